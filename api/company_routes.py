@@ -1,4 +1,5 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, BackgroundTasks, HTTPException
+from typing import Optional
 from google.cloud import firestore
 from models.company_model import CompanyRequest
 
@@ -6,6 +7,11 @@ from fastapi import Depends
 from config.firebase_config import get_firestore_client
 
 from api.theme_routes import  generate_all_themes_route
+from services.overlay_text import invalidate_overlay_style
+from services.company_cache import invalidate_company_profile, is_company_deleting
+from services.company_deletion import start_company_delete, get_company_delete_job
+from utils.pagination import paginate, page_size
+from utils.fieldsets import parse_fields, COMPANY_LIST_FIELDS
 from utils.logger import setup_logger
 
 
@@ -18,16 +24,25 @@ async def get_db():
 router = APIRouter()
 
 @router.get("/company")
-def get_companies(db: firestore.Client = Depends(get_db), page: int = 1, limit: int = 5):
+def get_companies(db: firestore.Client = Depends(get_db), page: int = 1, limit: int = 5, cursor: Optional[str] = None, fields: Optional[str] = None):
     try:
+        # pass back next_cursor to page on; `page` still works but is billed for every skipped company
+        limit = page_size(limit)
+        # listings read only COMPANY_LIST_FIELDS unless the caller asks for more (fields=* for everything)
+        field_paths = parse_fields(fields, default=COMPANY_LIST_FIELDS)
         companies_ref = db.collection("companies")
-        docs = companies_ref.limit(limit).offset((page-1)*limit).stream()
+        if field_paths is not None:
+            companies_ref = companies_ref.select(field_paths)
+        docs, next_cursor = paginate(companies_ref, limit, cursor=cursor, page=page)
         companies = [{**doc.to_dict(), "id": doc.id} for doc in docs]
         return {
             "data": companies,
             "page": page,
-            "limit": limit
+            "limit": limit,
+            "next_cursor": next_cursor
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching companies: {str(e)}")
 
@@ -98,17 +113,19 @@ async def create_company(company: CompanyRequest, db: firestore.Client = Depends
 
 
 @router.get("/company/{company_id}")
-def get_company(company_id: str, db: firestore.Client = Depends(get_db)):
+def get_company(company_id: str, fields: Optional[str] = None, db: firestore.Client = Depends(get_db)):
     try:
         doc_ref = db.collection("companies").document(company_id)
-        doc = doc_ref.get()
-        if not doc.exists:
+        doc = doc_ref.get(field_paths=parse_fields(fields))
+        if not doc.exists or is_company_deleting(company_id):
             raise HTTPException(status_code=404, detail=f"Company {company_id} not found")
 
         company_data = doc.to_dict()
         company_data['company_id'] = company_id
         
         return company_data
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching company: {str(e)}")
 
@@ -117,8 +134,19 @@ def get_company(company_id: str, db: firestore.Client = Depends(get_db)):
 
 ############################################# update company ###########################################
 
+async def _regenerate_themes(company_id: str, db: firestore.Client):
+    try:
+        response_content = await generate_all_themes_route(company_id, db)
+        if response_content:
+            logger.info(f"[Background] Themes generated successfully for {company_id}")
+        else:
+            logger.warning(f"[Background] No response from theme generator for {company_id}")
+    except Exception as e:
+        logger.exception(f"[Background] Theme regeneration failed for {company_id}: {e}")
+
+
 @router.put("/company/{company_id}")
-def update_company(company_id: str, company: CompanyRequest, db: firestore.Client = Depends(get_db)):
+async def update_company(company_id: str, company: CompanyRequest, background_tasks: BackgroundTasks, db: firestore.Client = Depends(get_db)):
     try:
 
         doc_ref = db.collection("companies").document(company_id)
@@ -148,13 +176,13 @@ def update_company(company_id: str, company: CompanyRequest, db: firestore.Clien
 
         if update_data:
             doc_ref.update(update_data)
+            # drop the cached profile before themes are regenerated from it
+            invalidate_company_profile(company_id)
+            # fonts and theme colors may have changed
+            invalidate_overlay_style(company_id)
 
-            # Run theme regeneration in background
-            response_content =  generate_all_themes_route(company_id)
-            if response_content:
-                logger.info(f"[Background] Themes generated successfully for {company_id}")
-            else:
-                logger.warning(f"[Background] No response from theme generator for {company_id}")
+            # Run theme regeneration in background, after the response is sent
+            background_tasks.add_task(_regenerate_themes, company_id, db)
 
             return {
                 "status": "success",
@@ -173,35 +201,34 @@ def update_company(company_id: str, company: CompanyRequest, db: firestore.Clien
 
 
 
-@router.delete("/company/{company_id}")
-def delete_company(company_id: str, db: firestore.Client = Depends(get_db)):
+@router.delete("/company/{company_id}", status_code=202)
+async def delete_company(company_id: str, db: firestore.Client = Depends(get_db)):
     try:
-        doc_ref = db.collection("companies").document(company_id)
-        doc = doc_ref.get()
+        doc = db.collection("companies").document(company_id).get()
         if not doc.exists:
             raise HTTPException(status_code=404, detail=f"Company {company_id} not found")
-        
-        # delete all posts for the company
-        facebook_posts = db.collection("facebook_posts").document(company_id).collection("posts").get()
-        if facebook_posts:
-            for post in facebook_posts:
-                post.reference.delete()
-        linkedin_posts = db.collection("linkedin_posts").document(company_id).collection("posts").get()
-        if linkedin_posts:
-            for post in linkedin_posts:
-                post.reference.delete()
-        instagram_posts = db.collection("instagram_posts").document(company_id).collection("posts").get()
-        if instagram_posts:
-            for post in instagram_posts:
-                post.reference.delete()
-
-       #delete themes for the company
-        themes = db.collection("themes").document(company_id).collection("months").get()
-        if themes:
-            for month in themes:
-                month.reference.delete()
-
-        doc_ref.delete()
-        return {"status": "success", "message": f"Company {company_id} deleted"}
+
+        # posts, themes, images and cached entries are removed by a background job;
+        # the company document itself is deleted last, and reads see it as missing meanwhile
+        job = start_company_delete(company_id)
+        return {
+            "status": "success",
+            "message": f"Deleting company {company_id}",
+            "job_id": job.job_id,
+            "job": job.to_dict(),
+        }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error deleting company: {str(e)}")
+
+
+@router.get("/company/delete-jobs/{job_id}")
+def get_delete_job(job_id: str):
+    try:
+        job = get_company_delete_job(job_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching delete job: {str(e)}")
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Delete job {job_id} not found")
+    return {"status": "success", "data": job}
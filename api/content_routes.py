@@ -6,7 +6,10 @@ from models.schedular_model import SchedularRequest
 
 from google.cloud import firestore
 from datetime import datetime, timezone
+from typing import List, Optional, Tuple
 from utils.logger import setup_logger
+from utils.pagination import paginate, page_size
+from utils.fieldsets import parse_fields, select_paths, only_fields
 
 from fastapi import Depends
 from config.firebase_config import get_firestore_client
@@ -25,6 +28,41 @@ router = APIRouter()
 async def get_db():
     return get_firestore_client()
 
+
+def thumbnail_url(post_data: dict) -> Optional[str]:
+    """
+    Smallest stored variant of a post's image for grid views, falling back to the full image
+    """
+    variants = post_data.get("image_variants") or {}
+    return variants.get("thumbnail") or variants.get("preview") or post_data.get("image_url")
+
+
+# fields the post listings compute, with the stored fields they are computed from
+POST_DERIVED_FIELDS = {"thumbnail_url": ("image_variants", "image_url")}
+# post listings page newest first; every save path sets created_at
+POST_ORDER_FIELD = "created_at"
+
+
+def post_projection(fields: Optional[str], required: Tuple[str, ...] = ()) -> Tuple[Optional[List[str]], Optional[List[str]]]:
+    """
+    Field paths a post route was asked for and the stored paths to read for them (computed
+    fields mapped to their sources, plus `required` ones); both None for whole documents
+    """
+    field_paths = parse_fields(fields)
+    if field_paths is None:
+        return None, None
+    return field_paths, select_paths(field_paths, derived=POST_DERIVED_FIELDS, required=required)
+
+
+def post_response(post, field_paths: Optional[List[str]]) -> dict:
+    """A post document as returned by the post routes, trimmed to `field_paths` if given"""
+    post_data = post.to_dict()
+    post_data["thumbnail_url"] = thumbnail_url(post_data)
+    if field_paths is not None:
+        post_data = only_fields(post_data, field_paths)
+    post_data["post_id"] = post.id
+    return post_data
+
 ## generate posts for instagram
 @router.post("/content/{company_id}/generate/instagram")
 async def generate_image_instagram(content: ContentRequest, company_id: str):
@@ -32,7 +70,9 @@ async def generate_image_instagram(content: ContentRequest, company_id: str):
         planner_info={
             "image_prompt" : content.image_prompt,
             "company_id": company_id,
-            "channel" : "instagram"
+            "channel" : "instagram",
+            "use_cache": content.use_cache,
+            "overlay_text": content.overlay_text,
         }
         result = await create_company_image(planner_info)
         
@@ -54,7 +94,9 @@ async def generate_image_facebook(content: ContentRequest, company_id: str):
         planner_info={
             "image_prompt" : content.image_prompt,
             "company_id": company_id,
-            "channel" : "facebook"
+            "channel" : "facebook",
+            "use_cache": content.use_cache,
+            "overlay_text": content.overlay_text,
         }
         result = await create_company_image(planner_info)
         
@@ -77,7 +119,9 @@ async def generate_image_linkedin(content: ContentRequest, company_id: str):
         planner_info={
             "image_prompt" : content.image_prompt,
             "company_id": company_id,
-            "channel" : "linkedin"
+            "channel" : "linkedin",
+            "use_cache": content.use_cache,
+            "overlay_text": content.overlay_text,
         }
         result = await create_company_image(planner_info)
         
@@ -102,6 +146,7 @@ async def save_instagram_post_to_db(company_id: str, content: ContentSaveRequest
             "company_id": company_id,
             "channel": "instagram", 
             "image_url": content.image_url,
+            "image_variants": content.image_variants or {},
             "caption": content.caption,
             "hashtags": content.hashtags,
             "scheduled_time": content.scheduled_time,
@@ -137,6 +182,7 @@ async def save_facebook_post_to_db(company_id: str, content: ContentSaveRequest,
             "company_id": company_id,
             "channel": "facebook", 
             "image_url": content.image_url,
+            "image_variants": content.image_variants or {},
             "caption": content.caption,
             "hashtags": content.hashtags,
             "scheduled_time": content.scheduled_time,
@@ -173,6 +219,7 @@ async def save_linkedin_post_to_db(company_id: str, content: ContentSaveRequest,
             "company_id": company_id,
             "channel": "linkedin", 
             "image_url": content.image_url,
+            "image_variants": content.image_variants or {},
             "caption": content.caption,
             "hashtags": content.hashtags,
             "scheduled_time": content.scheduled_time,
@@ -203,16 +250,16 @@ async def save_linkedin_post_to_db(company_id: str, content: ContentSaveRequest,
 ###################################################### Get posts ###################################################
 
 @router.get("/content/{company_id}/instagram/post/{post_id}")
-def get_instagram_post(company_id: str, post_id: str, db: firestore.Client = Depends(get_db)):
+def get_instagram_post(company_id: str, post_id: str, fields: Optional[str] = None, db: firestore.Client = Depends(get_db)):
     try:
         
+        field_paths, read_paths = post_projection(fields, required=("status",))
         post_ref = db.collection("instagram_posts").document(company_id).collection("posts").document(post_id)
-        post_doc = post_ref.get()
+        post_doc = post_ref.get(field_paths=read_paths)
 
         if post_doc.exists:
-            post_data = post_doc.to_dict()
-            post_data["post_id"] = post_doc.id  
-            status = post_data["status"]
+            status = post_doc.get("status")
+            post_data = post_response(post_doc, field_paths)
             return {
                 "status": status,
                 "data": post_data
@@ -227,15 +274,15 @@ def get_instagram_post(company_id: str, post_id: str, db: firestore.Client = Dep
         raise HTTPException(status_code=500, detail=f"Error fetching Post: {str(e)}")
 
 @router.get("/content/{company_id}/facebook/post/{post_id}")
-def get_facebook_post(company_id: str, post_id: str, db: firestore.Client = Depends(get_db)):
+def get_facebook_post(company_id: str, post_id: str, fields: Optional[str] = None, db: firestore.Client = Depends(get_db)):
     try:
+        field_paths, read_paths = post_projection(fields, required=("status",))
         post_ref = db.collection("facebook_posts").document(company_id).collection("posts").document(post_id)
-        post_doc = post_ref.get()
+        post_doc = post_ref.get(field_paths=read_paths)
 
         if post_doc.exists:
-            post_data = post_doc.to_dict()
-            post_data["post_id"] = post_doc.id  
-            status = post_data["status"]
+            status = post_doc.get("status")
+            post_data = post_response(post_doc, field_paths)
             return {
                 "status": status,
                 "data": post_data
@@ -251,15 +298,15 @@ def get_facebook_post(company_id: str, post_id: str, db: firestore.Client = Depe
 
 
 @router.get("/content/{company_id}/linkedin/post/{post_id}")
-def get_linkedin_post(company_id: str, post_id: str, db: firestore.Client = Depends(get_db)):
+def get_linkedin_post(company_id: str, post_id: str, fields: Optional[str] = None, db: firestore.Client = Depends(get_db)):
     try:
+        field_paths, read_paths = post_projection(fields, required=("status",))
         post_ref = db.collection("linkedin_posts").document(company_id).collection("posts").document(post_id)
-        post_doc = post_ref.get()
+        post_doc = post_ref.get(field_paths=read_paths)
 
         if post_doc.exists:
-            post_data = post_doc.to_dict()
-            post_data["post_id"] = post_doc.id  
-            status = post_data["status"]
+            status = post_doc.get("status")
+            post_data = post_response(post_doc, field_paths)
             return {
                 "status": status,
                 "data": post_data
@@ -277,28 +324,36 @@ def get_linkedin_post(company_id: str, post_id: str, db: firestore.Client = Depe
 
 
 @router.get("/content/{company_id}/instagram/posts")
-def get_all_instagram_posts(company_id: str, db: firestore.Client = Depends(get_db)):
+def get_all_instagram_posts(company_id: str, limit: Optional[int] = None, cursor: Optional[str] = None, fields: Optional[str] = None, db: firestore.Client = Depends(get_db)):
     try:
+        # the order field is read too, the next cursor is built from it
+        field_paths, read_paths = post_projection(fields, required=(POST_ORDER_FIELD,))
         posts_ref = db.collection("instagram_posts").document(company_id).collection("posts")
+        if read_paths is not None:
+            posts_ref = posts_ref.select(read_paths)
         
-        posts = posts_ref.stream()
+        if limit is None and cursor is None:
+            # without paging parameters the listing stays complete, as it was before cursors
+            posts, next_cursor = posts_ref.stream(), None
+        else:
+            posts, next_cursor = paginate(posts_ref, page_size(limit), cursor=cursor, order_field=POST_ORDER_FIELD, descending=True)
         
-        posts_data = []
-        for post in posts:
-            post_data = post.to_dict()
-            post_data["post_id"] = post.id
-            posts_data.append(post_data)
+        posts_data = [post_response(post, field_paths) for post in posts]
         
         if posts_data:
             return {
-                "data": posts_data
+                "data": posts_data,
+                "next_cursor": next_cursor
             }
         else:
             return {
                 "data": [],
+                "next_cursor": None,
                 "message": f"No posts found for company {company_id}"
             }
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Couldn't fetch the posts for {company_id}: {str(e)}")
         return {
@@ -308,28 +363,36 @@ def get_all_instagram_posts(company_id: str, db: firestore.Client = Depends(get_
     
 
 @router.get("/content/{company_id}/facebook/posts")
-def get_all_facebook_posts(company_id: str, db: firestore.Client = Depends(get_db)):
+def get_all_facebook_posts(company_id: str, limit: Optional[int] = None, cursor: Optional[str] = None, fields: Optional[str] = None, db: firestore.Client = Depends(get_db)):
     try:
+        # the order field is read too, the next cursor is built from it
+        field_paths, read_paths = post_projection(fields, required=(POST_ORDER_FIELD,))
         posts_ref = db.collection("facebook_posts").document(company_id).collection("posts")
+        if read_paths is not None:
+            posts_ref = posts_ref.select(read_paths)
         
-        posts = posts_ref.stream()
+        if limit is None and cursor is None:
+            # without paging parameters the listing stays complete, as it was before cursors
+            posts, next_cursor = posts_ref.stream(), None
+        else:
+            posts, next_cursor = paginate(posts_ref, page_size(limit), cursor=cursor, order_field=POST_ORDER_FIELD, descending=True)
         
-        posts_data = []
-        for post in posts:
-            post_data = post.to_dict()
-            post_data["post_id"] = post.id
-            posts_data.append(post_data)
+        posts_data = [post_response(post, field_paths) for post in posts]
         
         if posts_data:
             return {
-                "data": posts_data
+                "data": posts_data,
+                "next_cursor": next_cursor
             }
         else:
             return {
                 "data": [],
+                "next_cursor": None,
                 "message": f"No posts found for company {company_id}"
             }
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Couldn't fetch the posts for {company_id}: {str(e)}")
         return {
@@ -338,28 +401,36 @@ def get_all_facebook_posts(company_id: str, db: firestore.Client = Depends(get_d
         }
     
 @router.get("/content/{company_id}/linkedin/posts")
-def get_all_linkedin_posts(company_id: str, db: firestore.Client = Depends(get_db)):
+def get_all_linkedin_posts(company_id: str, limit: Optional[int] = None, cursor: Optional[str] = None, fields: Optional[str] = None, db: firestore.Client = Depends(get_db)):
     try:
+        # the order field is read too, the next cursor is built from it
+        field_paths, read_paths = post_projection(fields, required=(POST_ORDER_FIELD,))
         posts_ref = db.collection("linkedin_posts").document(company_id).collection("posts")
+        if read_paths is not None:
+            posts_ref = posts_ref.select(read_paths)
         
-        posts = posts_ref.stream()
+        if limit is None and cursor is None:
+            # without paging parameters the listing stays complete, as it was before cursors
+            posts, next_cursor = posts_ref.stream(), None
+        else:
+            posts, next_cursor = paginate(posts_ref, page_size(limit), cursor=cursor, order_field=POST_ORDER_FIELD, descending=True)
         
-        posts_data = []
-        for post in posts:
-            post_data = post.to_dict()
-            post_data["post_id"] = post.id
-            posts_data.append(post_data)
+        posts_data = [post_response(post, field_paths) for post in posts]
         
         if posts_data:
             return {
-                "data": posts_data
+                "data": posts_data,
+                "next_cursor": next_cursor
             }
         else:
             return {
                 "data": [],
+                "next_cursor": None,
                 "message": f"No posts found for company {company_id}"
             }
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Couldn't fetch the posts for {company_id}: {str(e)}")
         return {
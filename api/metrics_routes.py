@@ -0,0 +1,58 @@
+from typing import Optional
+
+from fastapi import APIRouter
+
+from services.llm_cache import get_cache_stats
+from services.openai_limiter import get_openai_limiter
+from services.llm_resilience import get_resilience_stats
+from services.llm_usage import get_usage_stats
+from services.caption_pool import get_caption_pool_stats
+from services.image_cache import get_image_cache_stats
+from services.memory_governor import get_image_memory_governor
+from services.image_limiter import get_image_limiter
+from services.company_cache import get_company_cache_stats
+
+router = APIRouter()
+
+
+@router.get("/metrics/llm-cache")
+async def get_llm_cache_metrics():
+    return {"status": "success", "data": get_cache_stats()}
+
+
+@router.get("/metrics/openai")
+async def get_openai_metrics():
+    return {
+        "status": "success",
+        "data": {**get_openai_limiter().stats(), "resilience": get_resilience_stats()},
+    }
+
+
+@router.get("/metrics/llm-usage")
+async def get_llm_usage_metrics(company_id: Optional[str] = None):
+    return {"status": "success", "data": get_usage_stats(company_id)}
+
+
+@router.get("/metrics/caption-pool")
+async def get_caption_pool_metrics():
+    return {"status": "success", "data": get_caption_pool_stats()}
+
+
+@router.get("/metrics/image-cache")
+async def get_image_cache_metrics():
+    return {"status": "success", "data": get_image_cache_stats()}
+
+
+@router.get("/metrics/image-memory")
+async def get_image_memory_metrics():
+    return {"status": "success", "data": get_image_memory_governor().stats()}
+
+
+@router.get("/metrics/image-concurrency")
+async def get_image_concurrency_metrics():
+    return {"status": "success", "data": get_image_limiter().stats()}
+
+
+@router.get("/metrics/company-cache")
+async def get_company_cache_metrics():
+    return {"status": "success", "data": get_company_cache_stats()}
@@ -1,12 +1,19 @@
 from fastapi import APIRouter, HTTPException        
-from models.planner_model import PlannerRequest, CaptionRegenerateRequest
-from services.gpt_service import generate_facebook_post, generate_linkedin_post, generate_instagram_post, regenerate_caption
+from fastapi.responses import StreamingResponse
+import json
+from typing import Optional
+from models.planner_model import PlannerRequest, PlannerBatchRequest, CaptionRegenerateRequest
+from services.gpt_service import generate_facebook_post, generate_linkedin_post, generate_instagram_post
 
 from fastapi import Depends
 from google.cloud import firestore
 from config.firebase_config import get_firestore_client
+from services.company_cache import get_company_profile
+from utils.error_handler import raise_for_provider_overload
 
-from services.gpt_service import generate_image_prompt
+from services.gpt_service import generate_image_prompt, generate_fused_post, generate_post_batch, get_image_analysis
+from services.gpt_service import stream_regenerate_caption, stream_fused_post
+from services.caption_pool import get_caption_variant
 
 from utils.logger import setup_logger
 
@@ -33,37 +40,29 @@ async def generate_linkedin_planner(planner: PlannerRequest, company_id: str, db
             company_id,
             planner.theme_title,
         )
-        company_ref = db.collection("companies").document(company_id)
-        company_doc = company_ref.get()
-        if not company_doc.exists:
+        company_data = get_company_profile(db, company_id)
+        if company_data is None:
             logger.warning("LinkedIn planner request failed: company %s not found", company_id)
             raise HTTPException(status_code=404, detail=f"Company {company_id} not found")
-        company_data = company_doc.to_dict()
 
-        generated_planner_data = generate_linkedin_post(company_data, planner.theme_title, planner.theme_description)
+        if planner.fused:
+            # one structured completion returns caption, hashtags, overlay text and image prompt
+            generated_planner_data = await generate_fused_post(company_data, planner.theme_title, planner.theme_description, "LinkedIn")
+        else:
+            generated_planner_data = await generate_linkedin_post(company_data, planner.theme_title, planner.theme_description)
 
         channel = generated_planner_data.get("channel", "").lower().strip()
 
-        # image_prompt = generated_planner_data.get("image_prompt", "")
-
-
         caption = generated_planner_data.get("caption", "")
         hashtags = generated_planner_data.get("hashtags", [])
         overlay_text = generated_planner_data.get("overlay_text", "")
 
-        image_analysis = {
-                "composition_and_style": company_data.get("composition_and_style", ""),
-                "environment_settings": company_data.get("environment_settings", ""),
-                "image_types_and_animation": company_data.get("image_types_and_animation", ""),
-                "keywords_for_ai_image_generation": company_data.get("keywords_for_ai_image_generation", ""),
-                "lighting_and_color_tone": company_data.get("lighting_and_color_tone", ""),
-                "subjects_and_people": company_data.get("subjects_and_people", ""),
-                "technology_elements": company_data.get("technology_elements", ""),
-                "theme_and_atmosphere": company_data.get("theme_and_atmosphere", ""),
-            }
-
-        generated_image_prompt = await generate_image_prompt(caption, hashtags, overlay_text, image_analysis)
-        image_prompt = generated_image_prompt.get("image_prompt", "")
+        if planner.fused:
+            image_prompt = generated_planner_data.get("image_prompt", "")
+        else:
+            image_analysis = get_image_analysis(company_data)
+            generated_image_prompt = await generate_image_prompt(caption, hashtags, overlay_text, image_analysis)
+            image_prompt = generated_image_prompt.get("image_prompt", "")
 
         final_data = {
                 "channel": channel,
@@ -88,6 +87,7 @@ async def generate_linkedin_planner(planner: PlannerRequest, company_id: str, db
         )
         raise
     except Exception as e:
+        raise_for_provider_overload(e)
         logger.exception("Error creating LinkedIn planner for company %s", company_id)
         raise HTTPException(status_code= 500, detail=f"Error creating linkedin planner: {str(e)}")
 
@@ -106,36 +106,29 @@ async def generate_facebook_planner(planner: PlannerRequest, company_id: str, db
             company_id,
             planner.theme_title,
         )
-        company_ref = db.collection("companies").document(company_id)
-        company_doc = company_ref.get()
-        if not company_doc.exists:
+        company_data = get_company_profile(db, company_id)
+        if company_data is None:
             logger.warning("Facebook planner request failed: company %s not found", company_id)
             raise HTTPException(status_code=404, detail=f"Company {company_id} not found")
-        company_data = company_doc.to_dict()
 
-        generated_planner_data = generate_facebook_post(company_data, planner.theme_title, planner.theme_description)
+        if planner.fused:
+            # one structured completion returns caption, hashtags, overlay text and image prompt
+            generated_planner_data = await generate_fused_post(company_data, planner.theme_title, planner.theme_description, "Facebook")
+        else:
+            generated_planner_data = await generate_facebook_post(company_data, planner.theme_title, planner.theme_description)
 
         channel = generated_planner_data.get("channel", "").lower().strip()
 
-        # image_prompt = generated_planner_data.get("image_prompt", "")
-
         caption = generated_planner_data.get("caption", "")
         hashtags = generated_planner_data.get("hashtags", [])
         overlay_text = generated_planner_data.get("overlay_text", "")
 
-        # image generation according to image analysis 
-        image_analysis = {
-                "composition_and_style": company_data.get("composition_and_style", ""),
-                "environment_settings": company_data.get("environment_settings", ""),
-                "image_types_and_animation": company_data.get("image_types_and_animation", ""),
-                "keywords_for_ai_image_generation": company_data.get("keywords_for_ai_image_generation", ""),
-                "lighting_and_color_tone": company_data.get("lighting_and_color_tone", ""),
-                "subjects_and_people": company_data.get("subjects_and_people", ""),
-                "technology_elements": company_data.get("technology_elements", ""),
-                "theme_and_atmosphere": company_data.get("theme_and_atmosphere", ""),
-            }
-        generated_image_prompt = await generate_image_prompt(caption, hashtags, overlay_text, image_analysis)
-        image_prompt = generated_image_prompt.get("image_prompt", "")
+        if planner.fused:
+            image_prompt = generated_planner_data.get("image_prompt", "")
+        else:
+            image_analysis = get_image_analysis(company_data)
+            generated_image_prompt = await generate_image_prompt(caption, hashtags, overlay_text, image_analysis)
+            image_prompt = generated_image_prompt.get("image_prompt", "")
 
         final_data = {
                 "channel": channel,
@@ -160,6 +153,7 @@ async def generate_facebook_planner(planner: PlannerRequest, company_id: str, db
         )
         raise
     except Exception as e:
+        raise_for_provider_overload(e)
         logger.exception("Error creating Facebook planner for company %s", company_id)
         raise HTTPException(status_code= 500, detail=f"Error creating facebook planner: {str(e)}")
 
@@ -178,37 +172,29 @@ async def generate_instagram_planner(planner: PlannerRequest, company_id: str, d
             company_id,
             planner.theme_title,
         )
-        company_ref = db.collection("companies").document(company_id)
-        company_doc = company_ref.get()
-        if not company_doc.exists:
+        company_data = get_company_profile(db, company_id)
+        if company_data is None:
             logger.warning("Instagram planner request failed: company %s not found", company_id)
             raise HTTPException(status_code=404, detail=f"Company {company_id} not found")
-        company_data = company_doc.to_dict()
 
-        generated_planner_data = generate_instagram_post(company_data, planner.theme_title, planner.theme_description)
+        if planner.fused:
+            # one structured completion returns caption, hashtags, overlay text and image prompt
+            generated_planner_data = await generate_fused_post(company_data, planner.theme_title, planner.theme_description, "Instagram")
+        else:
+            generated_planner_data = await generate_instagram_post(company_data, planner.theme_title, planner.theme_description)
 
         channel = generated_planner_data.get("channel", "").lower().strip()
 
-        # image_prompt = generated_planner_data.get("image_prompt", "")
-        
         caption = generated_planner_data.get("caption", "")
         hashtags = generated_planner_data.get("hashtags", [])
         overlay_text = generated_planner_data.get("overlay_text", "")
 
-        image_analysis = {
-                "composition_and_style": company_data.get("composition_and_style", ""),
-                "environment_settings": company_data.get("environment_settings", ""),
-                "image_types_and_animation": company_data.get("image_types_and_animation", ""),
-                "keywords_for_ai_image_generation": company_data.get("keywords_for_ai_image_generation", ""),
-                "lighting_and_color_tone": company_data.get("lighting_and_color_tone", ""),
-                "subjects_and_people": company_data.get("subjects_and_people", ""),
-                "technology_elements": company_data.get("technology_elements", ""),
-                "theme_and_atmosphere": company_data.get("theme_and_atmosphere", ""),
-            }
-
-
-        generated_image_prompt = await generate_image_prompt(caption, hashtags, overlay_text, image_analysis)
-        image_prompt = generated_image_prompt.get("image_prompt", "")
+        if planner.fused:
+            image_prompt = generated_planner_data.get("image_prompt", "")
+        else:
+            image_analysis = get_image_analysis(company_data)
+            generated_image_prompt = await generate_image_prompt(caption, hashtags, overlay_text, image_analysis)
+            image_prompt = generated_image_prompt.get("image_prompt", "")
         final_data = {
                 "channel": channel,
                 "image_prompt": image_prompt,
@@ -232,10 +218,91 @@ async def generate_instagram_planner(planner: PlannerRequest, company_id: str, d
         )
         raise
     except Exception as e:
+        raise_for_provider_overload(e)
         logger.exception("Error generating Instagram planner for company %s", company_id)
         raise HTTPException(status_code= 500, detail=f"Error generating facebook planner: {str(e)}")
 
 
+######################################################### batch planner #########################################################
+
+PLANNER_CHANNELS = {
+    "instagram": "Instagram",
+    "facebook": "Facebook",
+    "linkedin": "LinkedIn",
+}
+
+async def build_planner_batch(channel: str, theme_title: Optional[str], theme_description: Optional[str], count: int, company_id: str, db: firestore.Client) -> dict:
+    """
+    `count` distinct planners for one channel and theme. Not bounded like the route's
+    request model: generate_post_batch splits large counts into completions that share
+    out the angles and are checked for repeats across the whole batch.
+    """
+    channel_name = PLANNER_CHANNELS.get(channel.lower())
+    if not channel_name:
+        raise HTTPException(status_code=400, detail=f"Unsupported channel '{channel}'")
+
+    logger.info(
+        "Generating %s %s planners for company %s with theme '%s'",
+        count,
+        channel_name,
+        company_id,
+        theme_title,
+    )
+    company_data = get_company_profile(db, company_id)
+    if company_data is None:
+        logger.warning("%s batch planner request failed: company %s not found", channel_name, company_id)
+        raise HTTPException(status_code=404, detail=f"Company {company_id} not found")
+
+    generated_posts = await generate_post_batch(
+        company_data, theme_title, theme_description, channel_name, count
+    )
+
+    posts = [
+        {
+            "channel": post.get("channel", "").lower().strip(),
+            "image_prompt": post.get("image_prompt", ""),
+            "caption": post.get("caption", ""),
+            "hashtags": post.get("hashtags", []),
+            "overlay_text": post.get("overlay_text", ""),
+            "company_id": company_id,
+        }
+        for post in generated_posts
+    ]
+    logger.info(
+        "%s %s planners generated for company %s",
+        len(posts),
+        channel_name,
+        company_id,
+    )
+    return {"channel": channel.lower(), "company_id": company_id, "count": len(posts), "posts": posts}
+
+
+@router.post(
+    "/planners/{company_id}/{channel}/batch",
+    tags=["Batch Planners"],
+    summary="Generate a batch of planners",
+    description="Generate several distinct planners for one channel and theme from a single completion",
+    response_description="Generated planners for the channel"
+)
+async def generate_planner_batch(channel: str, planner: PlannerBatchRequest, company_id: str, db: firestore.Client = Depends(get_db)):
+    try:
+        return await build_planner_batch(
+            channel, planner.theme_title, planner.theme_description, planner.count, company_id, db
+        )
+    except HTTPException as http_exc:
+        logger.warning(
+            "Batch planner generation returned HTTP %s for company %s: %s",
+            http_exc.status_code,
+            company_id,
+            http_exc.detail,
+        )
+        raise
+    except Exception as e:
+        raise_for_provider_overload(e)
+        logger.exception("Error generating %s batch planner for company %s", channel, company_id)
+        raise HTTPException(status_code= 500, detail=f"Error generating {channel} batch planner: {str(e)}")
+
+
 ######################################################### caption regenerate #########################################################
 
 @router.post(
@@ -247,14 +314,97 @@ async def generate_instagram_planner(planner: PlannerRequest, company_id: str, d
 )
 async def regenerate_caption_route(caption_regenerate: CaptionRegenerateRequest):
     try:
-        generated_caption = await regenerate_caption(caption_regenerate.caption, caption_regenerate.hashtags, caption_regenerate.overlay_text)
+        # served from the post's pre-generated variant pool, refilled in the background
+        generated_caption = await get_caption_variant(caption_regenerate.caption, caption_regenerate.hashtags, caption_regenerate.overlay_text)
 
         if not generated_caption:
             raise HTTPException(status_code=400, detail="Failed to regenerate caption")
             
-        return {"caption": generated_caption.get("caption", "")}
+        return {"caption": generated_caption}
     except HTTPException as e:
         raise
     except Exception as e:
+        raise_for_provider_overload(e)
         logger.exception("Error regenerating caption for planner")
-        raise HTTPException(status_code= 500, detail=f"Error regenerating caption: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code= 500, detail=f"Error regenerating caption: {str(e)}")
+
+
+######################################################### streaming (SSE) #########################################################
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+# registered before the planner stream route so "caption/regenerate" is not taken as company_id/channel
+@router.post(
+    "/planners/caption/regenerate/stream",
+    tags=["Caption Regenerate"],
+    summary="Regenerate caption (streaming)",
+    description="Stream a regenerated caption as server-sent events: `caption` events carry text deltas, "
+                "a final `result` event carries the full caption",
+    response_description="text/event-stream of caption deltas"
+)
+async def stream_regenerate_caption_route(caption_regenerate: CaptionRegenerateRequest):
+    async def events():
+        try:
+            async for event, data in stream_regenerate_caption(
+                caption_regenerate.caption, caption_regenerate.hashtags, caption_regenerate.overlay_text
+            ):
+                if event == "delta":
+                    yield _sse("caption", {"delta": data})
+                else:
+                    yield _sse("result", {"caption": data.get("caption", "")})
+        except Exception as e:
+            logger.exception("Error streaming regenerated caption for planner")
+            yield _sse("error", {"detail": f"Error regenerating caption: {str(e)}"})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@router.post(
+    "/planners/{company_id}/{channel}/stream",
+    tags=["Streaming Planners"],
+    summary="Generate planner (streaming)",
+    description="Stream a planner as server-sent events: `caption` events carry caption text deltas as they are "
+                "generated, a final `result` event carries the complete planner including the image prompt",
+    response_description="text/event-stream of caption deltas and the generated planner"
+)
+async def stream_planner(channel: str, planner: PlannerRequest, company_id: str, db: firestore.Client = Depends(get_db)):
+    channel_name = PLANNER_CHANNELS.get(channel.lower())
+    if not channel_name:
+        raise HTTPException(status_code=400, detail=f"Unsupported channel '{channel}'")
+
+    # validate before the stream starts so missing companies still get a proper 404
+    company_data = get_company_profile(db, company_id)
+    if company_data is None:
+        logger.warning("%s streaming planner request failed: company %s not found", channel_name, company_id)
+        raise HTTPException(status_code=404, detail=f"Company {company_id} not found")
+
+    logger.info(
+        "Streaming %s planner for company %s with theme '%s'",
+        channel_name,
+        company_id,
+        planner.theme_title,
+    )
+
+    async def events():
+        try:
+            async for event, data in stream_fused_post(company_data, planner.theme_title, planner.theme_description, channel_name):
+                if event == "delta":
+                    yield _sse("caption", {"delta": data})
+                else:
+                    yield _sse("result", {
+                        "channel": data.get("channel", "").lower().strip(),
+                        "image_prompt": data.get("image_prompt", ""),
+                        "caption": data.get("caption", ""),
+                        "hashtags": data.get("hashtags", []),
+                        "overlay_text": data.get("overlay_text", ""),
+                        "company_id": company_id,
+                    })
+        except Exception as e:
+            logger.exception("Error streaming %s planner for company %s", channel_name, company_id)
+            yield _sse("error", {"detail": f"Error generating {channel} planner: {str(e)}"})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
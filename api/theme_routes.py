@@ -5,8 +5,12 @@ from services.gpt_service import generate_all_themes, generate_theme
 from google.cloud import firestore
 from fastapi import Depends
 from config.firebase_config import get_firestore_client
+from services.company_cache import get_company_profile
+from utils.firestore_batch import commit_in_batches, set_write
+from utils.error_handler import raise_for_provider_overload
 
 import json
+import asyncio
 
 router = APIRouter()
 
@@ -57,17 +61,15 @@ def get_theme(company_id: str, month_id: int, db: firestore.Client = Depends(get
 
 
 @router.post("/themes/{company_id}/{month_id}/regenerate")
-def regenerate_month_theme(company_id: str, month_id: int, db: firestore.Client = Depends(get_db)):
+async def regenerate_month_theme(company_id: str, month_id: int, db: firestore.Client = Depends(get_db)):
     try:
         # Validate month_id
         if month_id < 1 or month_id > 12:
             raise HTTPException(status_code=400, detail="month_id must be between 0 and 11")
         
-        company_ref = db.collection("companies").document(company_id)
-        company_doc = company_ref.get()
-        if not company_doc.exists:
+        company_data = get_company_profile(db, company_id)
+        if company_data is None:
             raise HTTPException(status_code=404, detail=f"Company {company_id} not found")
-        company_data = company_doc.to_dict()
 
         list_of_months = {"1":"January", "2":"February", "3":"March", "4":"April", "5":"May", "6":"June", 
                          "7":"July", "8":"August", "9":"September", "10":"October", "11":"November", "12":"December"}
@@ -82,7 +84,7 @@ def regenerate_month_theme(company_id: str, month_id: int, db: firestore.Client
             existing_themes = existing_doc.to_dict()
             print(f"Found existing themes for {month_name}: {existing_themes.get('themes', [])}")
 
-        theme_data = generate_theme(company_data, month_name, existing_themes)
+        theme_data = await generate_theme(company_data, month_name, existing_themes)
         
         month_data = {
             "month_id": month_id,
@@ -100,21 +102,20 @@ def regenerate_month_theme(company_id: str, month_id: int, db: firestore.Client
     except HTTPException:
         raise
     except Exception as e:
+        raise_for_provider_overload(e)
         raise HTTPException(status_code=500, detail=f"Error regenerating theme: {str(e)}")
 
 
 # Generate all themes for a company
 @router.post("/themes/{company_id}/generate-all")
-def generate_all_themes_route(company_id: str, db: firestore.Client = Depends(get_db)):
+async def generate_all_themes_route(company_id: str, db: firestore.Client = Depends(get_db)):
     try:
-        company_ref = db.collection("companies").document(company_id)
-        company_doc = company_ref.get()
-        if not company_doc.exists:
+        company_data = get_company_profile(db, company_id)
+        if company_data is None:
             raise HTTPException(status_code=404, detail=f"Company {company_id} not found")
-        company_data = company_doc.to_dict()
 
         # Call GPT service
-        response_content = generate_all_themes(company_data)
+        response_content = await generate_all_themes(company_data)
         if isinstance(response_content, str):
             themes = parse_themes_response(response_content)
         elif isinstance(response_content, list):
@@ -123,15 +124,20 @@ def generate_all_themes_route(company_id: str, db: firestore.Client = Depends(ge
             raise HTTPException(status_code=500, detail=f"Invalid GPT response: {type(response_content)}")
         themes = ensure_all_months(themes)
 
-        # Save to Firestore using numeric IDs
+        # Save to Firestore using numeric IDs, all twelve months in one batch commit
         months_ref = db.collection("themes").document(company_id).collection("months")
-        for month in themes:
-            month_id = month["month_id"]
-            months_ref.document(str(month_id)).set(month)
+        await asyncio.to_thread(
+            commit_in_batches,
+            db,
+            [set_write(months_ref.document(str(month["month_id"])), month) for month in themes],
+        )
 
         return {"message": "All themes generated successfully", "data": themes}
 
+    except HTTPException:
+        raise
     except Exception as e:
+        raise_for_provider_overload(e)
         raise HTTPException(status_code=500, detail=f"Error generating themes: {str(e)}")
 
 
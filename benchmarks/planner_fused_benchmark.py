@@ -0,0 +1,96 @@
+"""
+Compare fused vs two-step planner generation (latency and OpenAI token usage).
+
+Usage:
+    python -m benchmarks.planner_fused_benchmark --company company.json --channel Instagram --runs 5
+
+company.json is a company document as stored in Firestore (the same dict the
+planner routes pass to gpt_service). Requires OPENAI_API_KEY.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from services import gpt_service
+
+
+TWO_STEP_GENERATORS = {
+    "Instagram": gpt_service.generate_instagram_post,
+    "LinkedIn": gpt_service.generate_linkedin_post,
+    "Facebook": gpt_service.generate_facebook_post,
+}
+
+
+class UsageRecorder:
+    """Wraps chat.completions.create on the shared client and sums response.usage"""
+
+    def __init__(self, client):
+        self._create = client.chat.completions.create
+        client.chat.completions.create = self._recording_create
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    async def _recording_create(self, *args, **kwargs):
+        response = await self._create(*args, **kwargs)
+        self.calls += 1
+        if response.usage is not None:
+            self.prompt_tokens += response.usage.prompt_tokens
+            self.completion_tokens += response.usage.completion_tokens
+        return response
+
+
+async def run_two_step(company_data, channel, theme, theme_description):
+    post = await TWO_STEP_GENERATORS[channel](company_data, theme, theme_description)
+    await gpt_service.generate_image_prompt(
+        post["caption"], post["hashtags"], post["overlay_text"], gpt_service.get_image_analysis(company_data)
+    )
+
+
+async def run_fused(company_data, channel, theme, theme_description):
+    await gpt_service.generate_fused_post(company_data, theme, theme_description, channel)
+
+
+async def measure(name, fn, recorder, runs, *args):
+    latencies = []
+    recorder.reset()
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        await fn(*args)
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    latencies.sort()
+    p95 = latencies[min(len(latencies) - 1, int(round(0.95 * (len(latencies) - 1))))]
+    print(
+        f"{name:<9} runs={runs} calls/run={recorder.calls / runs:.1f} "
+        f"mean_ms={statistics.mean(latencies):.0f} p50_ms={statistics.median(latencies):.0f} p95_ms={p95:.0f} "
+        f"prompt_tokens/run={recorder.prompt_tokens / runs:.0f} completion_tokens/run={recorder.completion_tokens / runs:.0f}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--company", required=True, help="path to a company document JSON file")
+    parser.add_argument("--channel", default="Instagram", choices=sorted(TWO_STEP_GENERATORS))
+    parser.add_argument("--theme", default="Winter sale")
+    parser.add_argument("--theme-description", default="Seasonal offers to warm up the cold months")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with open(args.company) as f:
+        company_data = json.load(f)
+
+    recorder = UsageRecorder(gpt_service.get_openai_client())
+    call_args = (company_data, args.channel, args.theme, args.theme_description)
+
+    await measure("two-step", run_two_step, recorder, args.runs, *call_args)
+    await measure("fused", run_fused, recorder, args.runs, *call_args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,173 @@
+"""
+Compare the legacy tempfile upload path with the in-memory buffer upload path
+(peak RSS and upload latency for 1-8 MB images).
+
+Usage:
+    python -m benchmarks.upload_benchmark --sizes 1 2 4 8 --runs 5
+    python -m benchmarks.upload_benchmark --bucket my-bucket.appspot.com --runs 3
+
+Without --bucket the uploads go to a local emulator of the Cloud Storage upload API
+started by the benchmark, so the numbers isolate client-side copies, disk I/O and
+memory. Each (path, size) pair runs in its own process so peak RSS is not shared.
+"""
+import argparse
+import base64
+import json
+import os
+import re
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import google_crc32c
+
+MB = 1024 * 1024
+
+
+class _FakeStorageHandler(BaseHTTPRequestHandler):
+    """Just enough of the JSON upload API for multipart and resumable uploads"""
+
+    sessions = {}
+
+    def log_message(self, *args):
+        pass
+
+    def _body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def _object(self, name, size, checksum):
+        crc32c = base64.b64encode(checksum.digest()).decode()
+        payload = json.dumps({"name": name, "bucket": "bench", "size": str(size), "crc32c": crc32c}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        body = self._body()
+        if "uploadType=resumable" in self.path:
+            session = str(len(self.sessions))
+            self.sessions[session] = (0, google_crc32c.Checksum())
+            self.send_response(200)
+            self.send_header("Location", f"http://{self.headers['Host']}/upload/session/{session}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        else:
+            self._object("multipart", len(body), google_crc32c.Checksum(body))
+
+    def do_PUT(self):
+        session = self.path.rsplit("/", 1)[-1]
+        received, checksum = self.sessions[session]
+        body = self._body()
+        checksum.update(body)
+        received += len(body)
+        self.sessions[session] = (received, checksum)
+        match = re.match(r"bytes (\*|\d+-\d+)/(\*|\d+)", self.headers.get("Content-Range", ""))
+        if match and match.group(2) != "*":
+            self._object("resumable", received, checksum)
+            return
+        self.send_response(308)
+        self.send_header("Range", f"bytes=0-{received - 1}")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+def _start_fake_storage():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeStorageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def _legacy_upload(blob, image_bytes, content_type):
+    """upload_image before the in-memory path: copy to a temp file, upload from disk"""
+    blob.chunk_size = 1 * MB
+    tmp_file = tempfile.NamedTemporaryFile(delete=False)
+    try:
+        tmp_file.write(image_bytes)
+        tmp_file.flush()
+        tmp_file.close()
+        blob.upload_from_filename(tmp_file.name, content_type=content_type)
+    finally:
+        os.unlink(tmp_file.name)
+
+
+def _peak_rss_mb():
+    # ru_maxrss is KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_worker(path, size_mb, runs, bucket_name, endpoint):
+    from google.cloud import storage
+
+    if endpoint:
+        from google.auth.credentials import AnonymousCredentials
+        client = storage.Client(project="bench", credentials=AnonymousCredentials(),
+                                client_options={"api_endpoint": endpoint})
+    else:
+        client = storage.Client()
+
+    from utils.upload_stream import upload_from_buffer
+
+    bucket = client.bucket(bucket_name)
+    image = os.urandom(size_mb * MB)
+    baseline_rss = _peak_rss_mb()
+
+    latencies = []
+    for run in range(runs):
+        blob = bucket.blob(f"benchmarks/upload/{path}-{size_mb}mb-{run}.bin")
+        started = time.perf_counter()
+        if path == "tempfile":
+            _legacy_upload(blob, image, "application/octet-stream")
+        else:
+            upload_from_buffer(blob, memoryview(image), "application/octet-stream")
+        latencies.append((time.perf_counter() - started) * 1000)
+        if not endpoint:
+            blob.delete()
+
+    print(json.dumps({
+        "path": path,
+        "size_mb": size_mb,
+        "p50_ms": round(statistics.median(latencies), 1),
+        "max_ms": round(max(latencies), 1),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "rss_over_baseline_mb": round(_peak_rss_mb() - baseline_rss, 1),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 2, 4, 8], help="image sizes in MB")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--bucket", help="real bucket to upload to (default: local emulator)")
+    parser.add_argument("--worker", nargs=2, metavar=("PATH", "SIZE_MB"), help=argparse.SUPPRESS)
+    parser.add_argument("--endpoint", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker[0], int(args.worker[1]), args.runs, args.bucket or "bench", args.endpoint)
+        return
+
+    endpoint = None if args.bucket else _start_fake_storage()
+    print(f"{'path':<10} {'size':>6} {'p50 ms':>9} {'max ms':>9} {'peak RSS':>10} {'over base':>10}")
+    for size_mb in args.sizes:
+        for path in ("tempfile", "buffer"):
+            command = [sys.executable, "-m", "benchmarks.upload_benchmark", "--worker", path, str(size_mb),
+                       "--runs", str(args.runs)]
+            if args.bucket:
+                command += ["--bucket", args.bucket]
+            if endpoint:
+                command += ["--endpoint", endpoint]
+            output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{path:<10} {size_mb:>4}MB {result['p50_ms']:>9} {result['max_ms']:>9} "
+                  f"{result['peak_rss_mb']:>8}MB {result['rss_over_baseline_mb']:>8}MB")
+
+
+if __name__ == "__main__":
+    main()
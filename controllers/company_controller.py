@@ -3,7 +3,21 @@ from utils.error_handler import handle_error
 
 async def create_company_image(planner_info: dict):
     try:
-        url = await process_company(planner_info)
-        return {"status": "success", "image_url": url}
+        image = await process_company(planner_info)
+        return {"status": "success", "image_url": image["url"], "image_variants": image["variants"]}
     except Exception as e:
         return handle_error(e)
+
+async def create_company_images(planner_infos: list):
+    """
+    Batch version of create_company_image: one result per planner, in order
+    """
+    try:
+        images = await process_company(planner_infos)
+    except Exception as e:
+        images = [e] * len(planner_infos)
+    return [
+        {"status": "error", "message": str(image)} if isinstance(image, Exception)
+        else {"status": "success", "image_url": image["url"], "image_variants": image["variants"]}
+        for image in images
+    ]
@@ -1,5 +1,5 @@
 import os
-from fastapi import FastAPI
+from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi_profiler import PyInstrumentProfilerMiddleware
 
@@ -16,6 +16,10 @@ from api.planner_routes import router as planner_router
 from api.content_routes import router as content_router
 from api.theme_routes import router as theme_router
 from api.request_routes import router as request_router
+from api.metrics_routes import router as metrics_router
+from services.llm_cache import llm_cache_bypass_header
+from services.llm_usage import llm_usage_context
+from services.image_processing import shutdown_image_pool
 
 
 logger = setup_logger("marketing-app")
@@ -55,6 +59,7 @@ async def lifespan(app: FastAPI):
         raise Exception("Failed to initialize Firebase")
     yield
     logger.info("Shutting down Marketing Planner API...")
+    shutdown_image_pool()
 
 
 app = FastAPI(
@@ -83,11 +88,14 @@ if os.getenv("ENABLE_PROFILER", "false").lower() == "true":
         prof_file_name="example_speedscope_profile.json"
     )
 
-app.include_router(company_router, prefix="/api/v1", tags=["companies"])
-app.include_router(planner_router, prefix="/api/v1")
-app.include_router(content_router, prefix="/api/v1", tags=["content"])
-app.include_router(theme_router, prefix="/api/v1", tags=["themes"])
+llm_dependencies = [Depends(llm_cache_bypass_header), Depends(llm_usage_context)]
+
+app.include_router(company_router, prefix="/api/v1", tags=["companies"], dependencies=[Depends(llm_usage_context)])
+app.include_router(planner_router, prefix="/api/v1", dependencies=llm_dependencies)
+app.include_router(content_router, prefix="/api/v1", tags=["content"], dependencies=llm_dependencies)
+app.include_router(theme_router, prefix="/api/v1", tags=["themes"], dependencies=llm_dependencies)
 app.include_router(request_router, prefix="/api/v1", tags=["requests"])
+app.include_router(metrics_router, prefix="/api/v1", tags=["metrics"])
 
 
 
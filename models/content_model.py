@@ -1,12 +1,18 @@
-from typing import Optional, List
+from typing import Optional, List, Dict
 from pydantic import BaseModel, field_validator
 from datetime import datetime, timezone
 
 class ContentRequest(BaseModel):
     image_prompt: str
+    # reuse an image already rendered for the same prompt and channel
+    use_cache: Optional[bool] = True
+    # drawn onto the "composited" variant when overlay compositing is enabled
+    overlay_text: Optional[str] = None
 
 class ContentSaveRequest(BaseModel):
     image_url: Optional[str] = None
+    # variant name (thumbnail, preview) -> url, as returned by the generate endpoints
+    image_variants: Optional[Dict[str, str]] = None
     caption: Optional[str] = None
     hashtags: Optional[List[str]] = None
     status: Optional[str] = None
@@ -1,9 +1,19 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
 
 class PlannerRequest(BaseModel):
     theme_title: Optional[str] = None
     theme_description: Optional[str] = None
+    # generate caption, hashtags, overlay text and image prompt in one completion
+    fused: Optional[bool] = False
+
+# most posts one batch planner request may ask for
+MAX_PLANNER_BATCH = 31
+
+class PlannerBatchRequest(BaseModel):
+    theme_title: Optional[str] = None
+    theme_description: Optional[str] = None
+    count: int = Field(default=1, ge=1, le=MAX_PLANNER_BATCH)
     
 class CaptionRegenerateRequest(BaseModel):
     caption: str
@@ -0,0 +1,164 @@
+import os
+import json
+import hashlib
+from typing import Any, Optional
+
+from cachetools import LRUCache
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+BRAND_CONTEXT_TOKEN_BUDGET = int(os.getenv("BRAND_CONTEXT_TOKEN_BUDGET", "900"))
+IMAGE_PROFILE_TOKEN_BUDGET = int(os.getenv("IMAGE_PROFILE_TOKEN_BUDGET", "700"))
+BRAND_CONTEXT_CACHE_SIZE = int(os.getenv("BRAND_CONTEXT_CACHE_SIZE", "512"))
+
+CHARS_PER_TOKEN = 4
+TRUNCATION_MARK = "…"
+
+# (field, label, minimum characters kept when trimming to the budget)
+# Ordered by priority: fields at the bottom are trimmed first.
+BRAND_FIELDS = [
+    ("company_name", "Company Name", None),
+    ("industry", "Industry", None),
+    ("address", "Location", None),
+    ("target_group", "Target Audience", 200),
+    ("keywords", "Keywords", 120),
+    ("tone_analysis", "Tone of voice", 250),
+    ("products", "Products", 150),
+    ("theme_colors", "Theme Colors", None),
+    ("company_info", "About", 300),
+    ("product_categories", "Product categories", 100),
+]
+
+IMAGE_ANALYSIS_FIELDS = {
+    "composition_and_style": "Composition and style",
+    "environment_settings": "Environment settings",
+    "image_types_and_animation": "Image types and animation",
+    "keywords_for_ai_image_generation": "Keywords for AI image generation",
+    "lighting_and_color_tone": "Lighting and color tone",
+    "subjects_and_people": "Subjects and people",
+    "technology_elements": "Technology elements",
+    "theme_and_atmosphere": "Theme and atmosphere",
+}
+
+# trim order for the image profile, last trimmed first
+IMAGE_PROFILE_PRIORITY = [
+    "keywords_for_ai_image_generation",
+    "composition_and_style",
+    "lighting_and_color_tone",
+    "subjects_and_people",
+    "environment_settings",
+    "theme_and_atmosphere",
+    "technology_elements",
+    "image_types_and_animation",
+]
+IMAGE_PROFILE_MIN_CHARS = 150
+
+# maximum items rendered for list-like fields
+LIST_CAPS = {
+    "keywords": 15,
+    "products": 15,
+    "theme_colors": 8,
+    "product_categories": 10,
+}
+
+_brand_context_cache = LRUCache(maxsize=BRAND_CONTEXT_CACHE_SIZE)
+_image_profile_cache = LRUCache(maxsize=BRAND_CONTEXT_CACHE_SIZE)
+
+
+def _to_text(value: Any, cap: Optional[int] = None) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, dict):
+        items = list(value.items())
+        rendered = [
+            f"{key}: {_to_text(item, cap)}" if item not in (None, "", [], {}) else str(key)
+            for key, item in (items[:cap] if cap else items)
+        ]
+        extra = len(items) - len(rendered)
+        return "; ".join(rendered) + (f" (+{extra} more)" if extra > 0 else "")
+    if isinstance(value, (list, tuple, set)):
+        items = [str(item) for item in value if item not in (None, "")]
+        rendered = items[:cap] if cap else items
+        extra = len(items) - len(rendered)
+        return ", ".join(rendered) + (f" (+{extra} more)" if extra > 0 else "")
+    return " ".join(str(value).split())
+
+
+def _fit_to_budget(lines: dict, trim_order: list, min_chars: dict, budget_tokens: int) -> dict:
+    """
+    Trim field values, lowest priority first, until the rendered block fits the token budget
+    """
+    budget_chars = budget_tokens * CHARS_PER_TOKEN
+    excess = sum(len(label) + len(value) + 4 for label, value in lines.values()) - budget_chars
+    for field in trim_order:
+        if excess <= 0:
+            break
+        if field not in lines or min_chars.get(field) is None:
+            continue
+        label, value = lines[field]
+        keep = max(min_chars[field], len(value) - excess)
+        if keep < len(value):
+            excess -= len(value) - keep
+            lines[field] = (label, value[:keep].rstrip() + TRUNCATION_MARK)
+    return lines
+
+
+def _render(lines: dict) -> str:
+    return "\n".join(f"- {label}: {value}" for label, value in lines.values() if value)
+
+
+def _version_key(data: dict, fields) -> str:
+    payload = json.dumps({field: data.get(field) for field in fields}, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def get_brand_context(company_data: dict) -> str:
+    """
+    Compact company block shared by every prompt builder.
+
+    Rendered once per company version (updated_at when present, otherwise a content hash),
+    with list fields capped and long text trimmed to BRAND_CONTEXT_TOKEN_BUDGET.
+    """
+    fields = [field for field, _, _ in BRAND_FIELDS]
+    updated_at = company_data.get("updated_at")
+    if updated_at is not None:
+        cache_key = (company_data.get("company_name"), str(updated_at))
+    else:
+        cache_key = _version_key(company_data, fields)
+
+    cached = _brand_context_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    lines = {
+        field: (label, _to_text(company_data.get(field), LIST_CAPS.get(field)))
+        for field, label, _ in BRAND_FIELDS
+    }
+    min_chars = {field: minimum for field, _, minimum in BRAND_FIELDS}
+    trim_order = [field for field, _, _ in reversed(BRAND_FIELDS)]
+    context = _render(_fit_to_budget(lines, trim_order, min_chars, BRAND_CONTEXT_TOKEN_BUDGET))
+
+    _brand_context_cache[cache_key] = context
+    return context
+
+
+def get_image_profile(image_analysis: dict) -> str:
+    """
+    Company image analysis profile trimmed to IMAGE_PROFILE_TOKEN_BUDGET, cached by content hash
+    """
+    cache_key = _version_key(image_analysis, IMAGE_ANALYSIS_FIELDS)
+    cached = _image_profile_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    lines = {
+        field: (label, _to_text(image_analysis.get(field)))
+        for field, label in IMAGE_ANALYSIS_FIELDS.items()
+    }
+    min_chars = {field: IMAGE_PROFILE_MIN_CHARS for field in IMAGE_ANALYSIS_FIELDS}
+    profile = _render(_fit_to_budget(lines, list(reversed(IMAGE_PROFILE_PRIORITY)), min_chars, IMAGE_PROFILE_TOKEN_BUDGET))
+
+    _image_profile_cache[cache_key] = profile
+    return profile
@@ -0,0 +1,129 @@
+import os
+import json
+import asyncio
+import hashlib
+import logging
+from collections import deque
+from typing import Optional
+
+from cachetools import TTLCache
+from dotenv import load_dotenv
+
+from services.gpt_service import regenerate_caption, generate_caption_variants
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+CAPTION_POOL_ENABLED = os.getenv("CAPTION_POOL_ENABLED", "true").lower() == "true"
+# variants generated per completion
+CAPTION_POOL_VARIANTS = int(os.getenv("CAPTION_POOL_VARIANTS", "4"))
+# start a background refill once a pool holds this many variants or fewer
+CAPTION_POOL_REFILL_AT = int(os.getenv("CAPTION_POOL_REFILL_AT", "1"))
+CAPTION_POOL_MAX_POSTS = int(os.getenv("CAPTION_POOL_MAX_POSTS", "1000"))
+CAPTION_POOL_TTL_SECONDS = int(os.getenv("CAPTION_POOL_TTL_SECONDS", "1800"))
+
+
+class CaptionPool:
+    """
+    Unserved caption variants for one post, plus the refill currently running for it
+    """
+
+    def __init__(self, caption: str, hashtags: list[str], overlay_text: str):
+        self.caption = caption
+        self.hashtags = hashtags
+        self.overlay_text = overlay_text
+        self.variants = deque(maxlen=CAPTION_POOL_VARIANTS * 2)
+        self.refill: Optional[asyncio.Task] = None
+
+
+_pools = TTLCache(maxsize=CAPTION_POOL_MAX_POSTS, ttl=CAPTION_POOL_TTL_SECONDS)
+_background_refills = set()
+_stats = {"hits": 0, "misses": 0, "refills": 0, "refill_errors": 0, "fallbacks": 0}
+
+
+def _pool_key(caption: str, hashtags: list[str], overlay_text: str) -> str:
+    payload = json.dumps([caption.strip(), list(hashtags), overlay_text.strip()], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+async def _fill(pool: CaptionPool) -> int:
+    """Add a completion's worth of new variants to the pool; returns how many were new"""
+    try:
+        _stats["refills"] += 1
+        variants = await generate_caption_variants(pool.caption, pool.hashtags, pool.overlay_text, CAPTION_POOL_VARIANTS)
+        new = [variant for variant in dict.fromkeys(variants) if variant and variant not in pool.variants]
+        pool.variants.extend(new)
+        return len(new)
+    except Exception:
+        _stats["refill_errors"] += 1
+        raise
+    finally:
+        pool.refill = None
+
+
+def _start_refill(pool: CaptionPool) -> asyncio.Task:
+    if pool.refill is None:
+        pool.refill = asyncio.create_task(_fill(pool))
+        _background_refills.add(pool.refill)
+        pool.refill.add_done_callback(_refill_done)
+    return pool.refill
+
+
+def _refill_done(task: asyncio.Task):
+    _background_refills.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"Caption pool refill failed: {str(task.exception())}")
+
+
+async def get_caption_variant(caption: str, hashtags: list[str], overlay_text: str) -> str:
+    """
+    Regenerated caption for a post, served from its variant pool when one is ready.
+
+    An empty pool is filled with CAPTION_POOL_VARIANTS captions from a single completion;
+    once it runs low it is refilled in the background. The pool is also registered under the
+    caption it just served, so regenerating the regenerated caption keeps hitting it.
+    """
+    if not CAPTION_POOL_ENABLED:
+        generated = await regenerate_caption(caption, hashtags, overlay_text)
+        return generated.get("caption", "")
+
+    key = _pool_key(caption, hashtags, overlay_text)
+    pool = _pools.get(key)
+    if pool is None:
+        pool = CaptionPool(caption, hashtags, overlay_text)
+        _pools[key] = pool
+
+    if pool.variants:
+        _stats["hits"] += 1
+    else:
+        _stats["misses"] += 1
+    # concurrent requests for the same post share one fill; shield so a disconnecting client
+    # does not cancel it for the others. More waiters than a fill yields wait for the next one;
+    # a failed fill raises here
+    while not pool.variants:
+        added = await asyncio.shield(_start_refill(pool))
+        if not added and not pool.variants:
+            # the completion brought nothing new, serve this caller a caption of its own
+            _stats["fallbacks"] += 1
+            generated = await regenerate_caption(caption, hashtags, overlay_text)
+            return generated.get("caption", "")
+
+    variant = pool.variants.popleft()
+    _pools[_pool_key(variant, hashtags, overlay_text)] = pool
+
+    if len(pool.variants) <= CAPTION_POOL_REFILL_AT:
+        _start_refill(pool)
+    return variant
+
+
+def get_caption_pool_stats() -> dict:
+    lookups = _stats["hits"] + _stats["misses"]
+    return {
+        **_stats,
+        "hit_ratio": round(_stats["hits"] / lookups, 4) if lookups else 0.0,
+        "pools": len(_pools),
+        "refills_in_flight": len(_background_refills),
+        "enabled": CAPTION_POOL_ENABLED,
+    }
@@ -0,0 +1,143 @@
+import os
+import copy
+import logging
+import threading
+from typing import Optional
+
+from cachetools import TTLCache
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+COMPANY_CACHE_ENABLED = os.getenv("COMPANY_CACHE_ENABLED", "true").lower() == "true"
+COMPANY_CACHE_TTL_SECONDS = int(os.getenv("COMPANY_CACHE_TTL_SECONDS", "300"))
+COMPANY_CACHE_MAX_ENTRIES = int(os.getenv("COMPANY_CACHE_MAX_ENTRIES", "1024"))
+# keep cached profiles coherent across workers with a Firestore listener per cached company
+COMPANY_CACHE_LISTENER = os.getenv("COMPANY_CACHE_LISTENER", "false").lower() == "true"
+COMPANIES_COLLECTION = "companies"
+
+_profiles = TTLCache(maxsize=COMPANY_CACHE_MAX_ENTRIES, ttl=COMPANY_CACHE_TTL_SECONDS)
+_listeners = {}
+# companies being deleted read as missing until their delete job finishes
+_deleting = set()
+# bumped by every invalidation, so a read that raced one does not cache what it fetched
+_generation = 0
+# sync routes run in the threadpool and listener callbacks on Firestore's own threads
+_lock = threading.RLock()
+_stats = {"hits": 0, "misses": 0, "invalidations": 0, "listener_updates": 0}
+
+
+def _on_snapshot(company_id: str):
+    def callback(snapshots, changes, read_time):
+        with _lock:
+            if company_id not in _profiles:
+                _unwatch(company_id)
+                return
+            for snapshot in snapshots:
+                _stats["listener_updates"] += 1
+                if snapshot.exists:
+                    _profiles[company_id] = snapshot.to_dict()
+                else:
+                    _profiles.pop(company_id, None)
+                    _unwatch(company_id)
+    return callback
+
+
+def _unwatch(company_id: str):
+    watch = _listeners.pop(company_id, None)
+    if watch is not None:
+        try:
+            watch.unsubscribe()
+        except Exception as e:
+            logger.warning(f"Could not stop company listener for {company_id}: {str(e)}")
+
+
+def _watch(db, company_id: str):
+    # drop listeners of profiles that expired or were evicted since
+    for stale in [key for key in _listeners if key not in _profiles]:
+        _unwatch(stale)
+    if company_id in _listeners:
+        return
+    try:
+        _listeners[company_id] = db.collection(COMPANIES_COLLECTION).document(company_id).on_snapshot(_on_snapshot(company_id))
+    except Exception as e:
+        logger.warning(f"Could not watch company {company_id}: {str(e)}")
+
+
+def get_company_profile(db, company_id: str) -> Optional[dict]:
+    """
+    Company document as a dict, or None if it does not exist or is being deleted. Read
+    through a per-process TTL cache; callers get their own copy and may modify it.
+    """
+    with _lock:
+        if company_id in _deleting:
+            return None
+        generation = _generation
+        if COMPANY_CACHE_ENABLED:
+            profile = _profiles.get(company_id)
+            if profile is not None:
+                _stats["hits"] += 1
+                return copy.deepcopy(profile)
+            _stats["misses"] += 1
+
+    doc = db.collection(COMPANIES_COLLECTION).document(company_id).get()
+    if not doc.exists:
+        return None
+    profile = doc.to_dict()
+
+    if COMPANY_CACHE_ENABLED:
+        with _lock:
+            if company_id in _deleting or generation != _generation:
+                return profile
+            _profiles[company_id] = copy.deepcopy(profile)
+            if COMPANY_CACHE_LISTENER:
+                _watch(db, company_id)
+    return profile
+
+
+def invalidate_company_profile(company_id: str):
+    global _generation
+    with _lock:
+        _stats["invalidations"] += 1
+        _generation += 1
+        _profiles.pop(company_id, None)
+        _unwatch(company_id)
+
+
+def mark_company_deleting(company_id: str):
+    """Treat the company as missing (and drop its cached profile) while it is being deleted"""
+    with _lock:
+        _deleting.add(company_id)
+    invalidate_company_profile(company_id)
+
+
+def is_company_deleting(company_id: str) -> bool:
+    with _lock:
+        return company_id in _deleting
+
+
+def clear_company_deleting(company_id: str):
+    """
+    Called once the delete job is over: the document is gone, or it is still there
+    because the job failed and reads should see it again
+    """
+    invalidate_company_profile(company_id)
+    with _lock:
+        _deleting.discard(company_id)
+
+
+def get_company_cache_stats() -> dict:
+    with _lock:
+        lookups = _stats["hits"] + _stats["misses"]
+        return {
+            **_stats,
+            "hit_ratio": round(_stats["hits"] / lookups, 4) if lookups else 0.0,
+            "entries": len(_profiles),
+            "listeners": len(_listeners),
+            "deleting": len(_deleting),
+            "enabled": COMPANY_CACHE_ENABLED,
+            "listener_enabled": COMPANY_CACHE_LISTENER,
+        }
@@ -0,0 +1,228 @@
+import os
+import uuid
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Optional
+
+from cachetools import TTLCache
+from dotenv import load_dotenv
+
+from config.firebase_config import get_firebase_client
+from services import image_cache
+from services.company_cache import mark_company_deleting, clear_company_deleting
+from services.overlay_text import invalidate_overlay_style
+from utils.firestore_batch import new_bulk_writer, raise_for_failures
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+# documents fetched per page while walking a company's collections (ids only)
+COMPANY_DELETE_PAGE_SIZE = int(os.getenv("COMPANY_DELETE_PAGE_SIZE", "1000"))
+# Storage objects deleted per batch request (the JSON API allows 100) and batches in flight
+STORAGE_DELETE_BATCH_SIZE = 100
+STORAGE_DELETE_PARALLELISM = int(os.getenv("STORAGE_DELETE_PARALLELISM", "8"))
+STORAGE_DELETE_PASSES = 3
+COMPANY_DELETE_JOB_TTL_SECONDS = int(os.getenv("COMPANY_DELETE_JOB_TTL_SECONDS", "86400"))
+# progress is mirrored here so any worker can answer a status request
+DELETE_JOBS_COLLECTION = "company_delete_jobs"
+PROGRESS_INTERVAL_SECONDS = 2.0
+
+POST_COLLECTIONS = ("instagram_posts", "facebook_posts", "linkedin_posts")
+
+_jobs = TTLCache(maxsize=1024, ttl=COMPANY_DELETE_JOB_TTL_SECONDS)
+_running: dict[str, "CompanyDeleteJob"] = {}
+_tasks: set = set()
+
+
+class CompanyDeleteJob:
+    def __init__(self, company_id: str):
+        self.job_id = uuid.uuid4().hex
+        self.company_id = company_id
+        self.status = "queued"
+        self.steps = {}
+        self.deleted = {"documents": 0, "storage_objects": 0, "cache_entries": 0}
+        self.error: Optional[str] = None
+        self.created_at = datetime.now(timezone.utc)
+        self.finished_at: Optional[datetime] = None
+        # counters are bumped from BulkWriter and storage worker threads
+        self._lock = threading.Lock()
+
+    def count(self, kind: str, amount: int = 1):
+        with self._lock:
+            self.deleted[kind] += amount
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            deleted = dict(self.deleted)
+        return {
+            "job_id": self.job_id,
+            "company_id": self.company_id,
+            "status": self.status,
+            "steps": dict(self.steps),
+            "deleted": deleted,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+def _delete_tree(db, path: str, job: CompanyDeleteJob) -> int:
+    """
+    Delete a document and everything below it. recursive_delete pages through descendants
+    by id only and hands them to a BulkWriter, so memory stays flat for any number of posts.
+    """
+    writer, failures = new_bulk_writer(db, on_result=lambda: job.count("documents"))
+    count = db.recursive_delete(db.document(path), bulk_writer=writer, chunk_size=COMPANY_DELETE_PAGE_SIZE)
+    raise_for_failures(failures, count)
+    return count
+
+
+def _delete_cache_documents(db, job: CompanyDeleteJob) -> int:
+    """Shared image cache entries point at the company's images, so they go too"""
+    query = db.collection(image_cache.IMAGE_CACHE_COLLECTION).where("company_id", "==", job.company_id)
+    total = 0
+    while True:
+        page = list(query.select([]).limit(COMPANY_DELETE_PAGE_SIZE).stream())
+        if not page:
+            return total
+        writer, failures = new_bulk_writer(db, on_result=lambda: job.count("cache_entries"))
+        for doc in page:
+            writer.delete(doc.reference)
+        writer.close()
+        raise_for_failures(failures, len(page))
+        total += len(page)
+
+
+def _delete_storage_prefix(storage_client, bucket_name: str, prefix: str, job: CompanyDeleteJob) -> int:
+    """
+    Delete every object under `prefix`, listing one page at a time and deleting each page
+    in parallel batch requests. Repeats the listing until nothing is left.
+    """
+    bucket = storage_client.bucket(bucket_name)
+
+    def delete_chunk(names):
+        # objects already gone (404) are not errors here
+        with storage_client.batch(raise_exception=False):
+            for name in names:
+                bucket.delete_blob(name)
+        job.count("storage_objects", len(names))
+
+    with ThreadPoolExecutor(max_workers=STORAGE_DELETE_PARALLELISM) as executor:
+        for _ in range(STORAGE_DELETE_PASSES):
+            pages = storage_client.list_blobs(bucket_name, prefix=prefix, page_size=STORAGE_DELETE_BATCH_SIZE * STORAGE_DELETE_PARALLELISM).pages
+            listed = 0
+            for page in pages:
+                names = [blob.name for blob in page]
+                listed += len(names)
+                chunks = [names[start:start + STORAGE_DELETE_BATCH_SIZE] for start in range(0, len(names), STORAGE_DELETE_BATCH_SIZE)]
+                list(executor.map(delete_chunk, chunks))
+            if not listed:
+                return job.deleted["storage_objects"]
+
+    if any(True for _ in storage_client.list_blobs(bucket_name, prefix=prefix, max_results=1)):
+        raise RuntimeError(f"Storage objects under {prefix} remain after {STORAGE_DELETE_PASSES} passes")
+    return job.deleted["storage_objects"]
+
+
+def _save_job(job: CompanyDeleteJob):
+    _, db = get_firebase_client()
+    db.collection(DELETE_JOBS_COLLECTION).document(job.job_id).set(job.to_dict())
+
+
+async def _save_job_quietly(job: CompanyDeleteJob):
+    try:
+        await asyncio.to_thread(_save_job, job)
+    except Exception as e:
+        logger.warning(f"Could not record progress of delete job {job.job_id}: {str(e)}")
+
+
+async def _report_progress(job: CompanyDeleteJob):
+    while True:
+        await asyncio.sleep(PROGRESS_INTERVAL_SECONDS)
+        await _save_job_quietly(job)
+
+
+async def _step(job: CompanyDeleteJob, name: str, work):
+    job.steps[name] = "running"
+    try:
+        await work
+    except Exception:
+        job.steps[name] = "failed"
+        raise
+    job.steps[name] = "done"
+
+
+async def _run(job: CompanyDeleteJob):
+    storage_client, db = get_firebase_client()
+    company_id = job.company_id
+    job.status = "running"
+    await _save_job_quietly(job)
+    reporter = asyncio.create_task(_report_progress(job))
+    try:
+        steps = [
+            _step(job, collection, asyncio.to_thread(_delete_tree, db, f"{collection}/{company_id}", job))
+            for collection in POST_COLLECTIONS
+        ]
+        steps.append(_step(job, "themes", asyncio.to_thread(_delete_tree, db, f"themes/{company_id}", job)))
+        steps.append(_step(job, "image_cache", asyncio.to_thread(_delete_cache_documents, db, job)))
+        bucket_name = os.getenv("FIREBASE_STORAGE_BUCKET")
+        if bucket_name:
+            steps.append(_step(job, "storage", asyncio.to_thread(
+                _delete_storage_prefix, storage_client, bucket_name, f"content/{company_id}/", job
+            )))
+
+        errors = [result for result in await asyncio.gather(*steps, return_exceptions=True) if isinstance(result, Exception)]
+        if errors:
+            raise errors[0]
+
+        # the company document goes last, so a failed job leaves it in place to retry the delete
+        await _step(job, "company", asyncio.to_thread(_delete_tree, db, f"companies/{company_id}", job))
+        job.status = "completed"
+        logger.info(f"Company {company_id} deleted: {job.deleted}")
+    except Exception as e:
+        job.status = "failed"
+        job.error = str(e)
+        logger.error(f"Deleting company {company_id} failed: {str(e)}", exc_info=True)
+    finally:
+        reporter.cancel()
+        job.finished_at = datetime.now(timezone.utc)
+        _running.pop(company_id, None)
+        clear_company_deleting(company_id)
+        invalidate_overlay_style(company_id)
+        job.count("cache_entries", image_cache.forget_company(company_id))
+        await _save_job_quietly(job)
+
+
+def start_company_delete(company_id: str) -> CompanyDeleteJob:
+    """
+    Start deleting a company with all its posts, themes, cached images and Storage objects
+    in the background. A delete already running for the company is returned instead.
+    """
+    job = _running.get(company_id)
+    if job is not None:
+        return job
+
+    job = CompanyDeleteJob(company_id)
+    _jobs[job.job_id] = job
+    _running[company_id] = job
+    # cached and fresh reads alike report the company as gone from here on
+    mark_company_deleting(company_id)
+    task = asyncio.create_task(_run(job))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return job
+
+
+def get_company_delete_job(job_id: str) -> Optional[dict]:
+    job = _jobs.get(job_id)
+    if job is not None:
+        return job.to_dict()
+    # started on another worker
+    _, db = get_firebase_client()
+    doc = db.collection(DELETE_JOBS_COLLECTION).document(job_id).get()
+    return doc.to_dict() if doc.exists else None
@@ -1,22 +1,163 @@
 import uuid
-import gc
 import time
-from services.gemini_service import generate_image
+import asyncio
+from typing import List, Optional, Tuple, Union
+from services.gemini_service import generate_image, generate_images, ASPECT_RATIOS
+from services.image_providers import get_image_provider
 from services.firebase_service import upload_image, save_url_to_db
+from services.image_processing import postprocess_image
+from services.overlay_text import composite_overlay_text, get_overlay_style, OVERLAY_TEXT_ENABLED
+from services import image_cache
+from services.memory_governor import get_image_memory_governor, Reservation, IMAGE_MEMORY_ESTIMATE_MB, MB
 from utils.logger import setup_logger
 
 logger = setup_logger("marketing-app")
 
-async def process_company(planner_info: dict) -> str:
-    image_bytes = None
-    try:
+def _uses_cache(planner_info: dict) -> bool:
+    # a missing or null use_cache means the default; only an explicit False skips the cache
+    return image_cache.IMAGE_CACHE_ENABLED and planner_info.get("use_cache") is not False
+
+
+async def _cache_key(planner_info: dict) -> str:
+    channel = planner_info["channel"].lower()
+    company_id = planner_info.get('company_id', 'unknown')
+    overlay_text = (planner_info.get("overlay_text") or "") if OVERLAY_TEXT_ENABLED else ""
+    # a font or theme_colors change must not keep serving composites in the old style
+    overlay_style = ""
+    if overlay_text.strip() and planner_info.get('company_id'):
+        try:
+            overlay_style = (await get_overlay_style(company_id)).fingerprint
+        except Exception as e:
+            # compositing fails the same way, so the entry is stored without a composite
+            logger.warning(f"Overlay style for company '{company_id}' unavailable: {str(e)}")
+    return image_cache.make_image_cache_key(
+        company_id,
+        channel,
+        planner_info["image_prompt"],
+        ASPECT_RATIOS.get(channel, '1:1'),
+        overlay_text,
+        overlay_style,
+    )
+
+
+async def process_company(planner_info: Union[dict, List[dict]]) -> Union[dict, List[Union[dict, Exception]]]:
+    """
+    Render and upload the image for a planner, reusing an earlier upload of the same
+    company, channel and (normalized) image prompt while it is in the image cache.
+    Pass planner_info["use_cache"] = False to force a fresh render.
+
+    Returns {"url": ..., "variants": {name: url}} for the full image and its responsive variants.
+    With OVERLAY_TEXT_ENABLED, a planner_info["overlay_text"] is also drawn onto the image
+    in the company's brand font and colors and uploaded as the "composited" variant.
+    Given a list of planners, renders them together (see process_company_batch) and returns
+    a list in the same order.
+    """
+    if isinstance(planner_info, list):
+        return await process_company_batch(planner_info)
+
+    if not _uses_cache(planner_info):
+        entry = await _render_and_upload(planner_info)
+        return {"url": entry["url"], "variants": entry["variants"]}
+
+    entry = await image_cache.get_or_create(await _cache_key(planner_info), lambda: _render_and_upload(planner_info))
+    return {"url": entry["url"], "variants": entry.get("variants", {})}
+
+
+async def process_company_batch(planner_infos: List[dict]) -> List[Union[dict, Exception]]:
+    """
+    Render and upload images for several planners, asking the image provider for as many
+    images per call as it supports instead of one call per planner. Cached images are
+    reused and duplicate prompts are rendered once.
+
+    Returns one {"url": ..., "variants": {...}} per planner, in order; a planner whose image
+    could not be produced gets the exception instead, so one failure does not lose the batch.
+    """
+    results: List[Union[dict, Exception, None]] = [None] * len(planner_infos)
+
+    # cache hits first, and collapse identical prompts within the batch onto one render
+    pending = {}
+    for index, planner_info in enumerate(planner_infos):
+        if not _uses_cache(planner_info):
+            pending[("uncached", index)] = [index]
+            continue
+        cache_key = await _cache_key(planner_info)
+        if cache_key in pending:
+            pending[cache_key].append(index)
+            continue
+        entry = await image_cache.lookup(cache_key)
+        if entry is not None:
+            results[index] = {"url": entry["url"], "variants": entry.get("variants", {})}
+        else:
+            pending[cache_key] = [index]
+
+    if pending:
+        cache_keys = list(pending)
+        outcomes = [None] * len(cache_keys)
+
+        # one provider call per channel and max_batch_size planners, as generate_images would make them
+        by_channel = {}
+        for position, cache_key in enumerate(cache_keys):
+            channel = planner_infos[pending[cache_key][0]]["channel"].lower()
+            by_channel.setdefault(channel, []).append(position)
+        batch_size = max(1, get_image_provider().max_batch_size)
+        chunks = [
+            positions[start:start + batch_size]
+            for positions in by_channel.values()
+            for start in range(0, len(positions), batch_size)
+        ]
+
+        async def upload(cache_key, planner_info, rendered, reservation):
+            if not rendered:
+                raise RuntimeError(f"Image generation failed for company {planner_info.get('name', 'Unknown')}")
+            entry = await _render_and_upload(planner_info, rendered, reservation)
+            if not isinstance(cache_key, tuple):
+                await image_cache.store(cache_key, entry)
+            return {"url": entry["url"], "variants": entry["variants"]}
+
+        async def render_chunk(positions):
+            # reserve per provider call, not per batch, so a large schedule cannot take the whole
+            # budget; each image keeps its own reservation from generation until its upload is done
+            to_render = [planner_infos[pending[cache_keys[position]][0]] for position in positions]
+            async with get_image_memory_governor().reserve_each(len(to_render), IMAGE_MEMORY_ESTIMATE_MB * MB) as reservations:
+                generated = await generate_images(to_render)
+                # generated images stay under their estimate until _render_and_upload resizes it
+                for reservation, rendered in zip(reservations, generated):
+                    if not rendered:
+                        reservation.release()
+                chunk_outcomes = await asyncio.gather(*(
+                    upload(cache_keys[position], planner_info, rendered, reservation)
+                    for position, planner_info, rendered, reservation in zip(positions, to_render, generated, reservations)
+                ), return_exceptions=True)
+            for position, outcome in zip(positions, chunk_outcomes):
+                outcomes[position] = outcome
+
+        await asyncio.gather(*(render_chunk(positions) for positions in chunks))
+
+        for cache_key, outcome in zip(cache_keys, outcomes):
+            for index in pending[cache_key]:
+                results[index] = outcome
+
+    return results
+
+
+async def _render_and_upload(planner_info: dict, rendered: Optional[Tuple[Union[bytes, memoryview], str]] = None,
+                             reservation: Optional[Reservation] = None) -> dict:
+    """
+    Generate (unless `rendered` already holds the generated image and mime type),
+    post-process and upload one planner image. A `reservation` already counting the
+    generated image is taken over instead of reserving again.
+    """
+    # image buffers held by this render count against the process-wide byte budget;
+    # new renders wait here while concurrent ones are holding it
+    initial = IMAGE_MEMORY_ESTIMATE_MB * MB if rendered is None else 2 * len(rendered[0])
+    async with get_image_memory_governor().hold(initial, reservation) as reservation:
         total_t0 = time.perf_counter()
         # Generate a unique ID for this content
         content_id = str(uuid.uuid4())
         
         # Generate image using Gemini
         gen_t0 = time.perf_counter()
-        result = await generate_image(planner_info)
+        result = rendered if rendered is not None else await generate_image(planner_info)
         if not result:
             raise RuntimeError(f"Image generation failed for company {planner_info.get('name', 'Unknown')}")
         image_bytes, mime_type = result
@@ -26,6 +167,23 @@ async def process_company(planner_info: dict) -> str:
         if not image_bytes or len(image_bytes) < 1024:  # <1 KB is almost certainly invalid
             raise RuntimeError("Generated image appears invalid or truncated (size < 1KB)")
 
+        # Crop/resize to the channel's canonical size and transcode (on the image process pool);
+        # the generated image and the pickled copy sent to the pool are held meanwhile
+        generated_size = len(image_bytes)
+        reservation.resize(2 * generated_size)
+        process_t0 = time.perf_counter()
+        image_bytes, mime_type, variants = await postprocess_image(image_bytes, mime_type, planner_info["channel"])
+        image_size = len(image_bytes)
+        process_ms = int((time.perf_counter() - process_t0) * 1000)
+
+        # Draw the overlay text onto a copy of the final image (also on the process pool)
+        composited = await composite_overlay_text(
+            image_bytes, mime_type, planner_info.get('company_id'), planner_info.get("overlay_text")
+        )
+        if composited:
+            variants["composited"] = composited
+        reservation.resize(image_size + sum(len(variant) for variant in variants.values()))
+
         # Create storage path with the generated content ID
         company_id = planner_info.get('company_id', 'unknown')
         # Choose file extension based on mime type
@@ -38,15 +196,21 @@ async def process_company(planner_info: dict) -> str:
         file_ext = ext_map.get(mime_type, ".png")
         path = f"content/{company_id}/{content_id}{file_ext}"
         
-        # Upload image to Firebase Storage (this function will handle cleanup)
+        # Upload the image and its variants (next to it, suffixed with the variant name) concurrently
         upload_t0 = time.perf_counter()
-        url = await upload_image(image_bytes, path, content_type=mime_type)
+        variant_names = list(variants)
+        url, *variant_urls = await asyncio.gather(
+            upload_image(image_bytes, path, content_type=mime_type),
+            *(
+                upload_image(variants[name], f"content/{company_id}/{content_id}_{name}{file_ext}", content_type=mime_type)
+                for name in variant_names
+            ),
+        )
+        variant_urls = dict(zip(variant_names, variant_urls))
         upload_ms = int((time.perf_counter() - upload_t0) * 1000)
 
-        # Clear image bytes from memory immediately after upload
-        del image_bytes
-        image_bytes = None
-        gc.collect()
+        # Drop the buffers before giving the budget back
+        del image_bytes, variants
 
         # Save metadata to Firestore with additional info
         additional_data = {
@@ -61,17 +225,15 @@ async def process_company(planner_info: dict) -> str:
         total_ms = int((time.perf_counter() - total_t0) * 1000)
         logger.info(
             f"image_pipeline: company_id={company_id} channel={channel} content_id={content_id} "
-            f"bytes={len(url) if isinstance(url, (bytes, bytearray)) else 'n/a'} gen_ms={gen_ms} "
+            f"generated_bytes={generated_size} bytes={image_size} gen_ms={gen_ms} process_ms={process_ms} "
             f"upload_ms={upload_ms} total_ms={total_ms} mime={mime_type} path={path} url={url}"
         )
 
-        return url
-        
-    except Exception as e:
-        if image_bytes is not None:
-            del image_bytes
-            gc.collect()
-        raise e
-
-
-
+        return {
+            "url": url,
+            "variants": variant_urls,
+            "path": path,
+            "mime_type": mime_type,
+            "company_id": company_id,
+            "channel": channel,
+        }
@@ -1,12 +1,13 @@
+import asyncio
 from datetime import datetime, timezone
 
 from fastapi import HTTPException
-from api.planner_routes import generate_instagram_planner, generate_facebook_planner, generate_linkedin_planner
-from api.content_routes import generate_image_instagram, generate_image_facebook, generate_image_linkedin
+from api.planner_routes import build_planner_batch
+from controllers.company_controller import create_company_images
 
 from config.firebase_config import get_firestore_client
-
-from models.planner_model import PlannerRequest
+from utils.firestore_batch import commit_in_batches, set_write
+from utils.error_handler import raise_for_provider_overload
 
 from utils.logger import setup_logger
 logger = setup_logger("marketing-app")
@@ -20,13 +21,10 @@ async def generate_scheduled_posts(company_id: str, posts_data: dict):
         theme_description = posts_data.get('theme_description')
         scheduled_month = posts_data.get('scheduled_month')
 
-        # FIX: Create proper Pydantic model objects instead of raw dictionaries
-        planner_request = PlannerRequest(
-            theme_title=theme,
-            theme_description=theme_description
-        )
-
         all_posts = []
+        # a channel's post documents are written in one batch commit once that channel is done,
+        # so a later channel failing does not lose the posts (and uploaded images) before it
+        post_writes = []
 
         logger.info(
             f"Generating scheduled posts for company {company_id} | "
@@ -37,34 +35,74 @@ async def generate_scheduled_posts(company_id: str, posts_data: dict):
             f"theme='{theme}', theme_description='{theme_description}', scheduled_month='{scheduled_month}'"
         )
 
+        async def generate_planners(channel: str, post_count: int) -> list:
+            # one planner batch per channel; it splits into completions itself and keeps
+            # hooks and concepts distinct across the whole schedule
+            if not post_count:
+                return []
+            try:
+                batch = await build_planner_batch(
+                    channel, theme, theme_description, post_count, company_id, get_firestore_client()
+                )
+                logger.info(f"{channel} planner batch received with {batch['count']} posts")
+                return batch["posts"]
+            except Exception as e:
+                logger.error(f"Failed to generate {channel} planners: {str(e)}", exc_info=True)
+                raise_for_provider_overload(e)
+                raise HTTPException(status_code=500, detail=f"Couldn't generate {channel} planners for company {company_id}: {str(e)}")
+
+        async def generate_images(channel: str, planners: list) -> list:
+            # render all of a channel's images together so the image provider can batch them;
+            # planners without an image prompt get None and fail in the loop below
+            prompted = [index for index, planner in enumerate(planners) if planner.get('image_prompt')]
+            images = [None] * len(planners)
+            if prompted:
+                results = await create_company_images([
+                    {
+                        "image_prompt": planners[index]['image_prompt'],
+                        "company_id": company_id,
+                        "channel": channel,
+                        "overlay_text": planners[index].get('overlay_text'),
+                    }
+                    for index in prompted
+                ])
+                for index, result in zip(prompted, results):
+                    images[index] = result
+            logger.info(f"{channel} images generated: {sum(1 for image in images if image and image.get('status') == 'success')}/{len(planners)}")
+            return images
+
+        async def save_posts(channel: str):
+            if not post_writes:
+                return
+            await asyncio.to_thread(commit_in_batches, get_firestore_client(), post_writes)
+            logger.info(f"Saved {len(post_writes)} {channel} posts for company {company_id}")
+            post_writes.clear()
+
         
         insta_posts = []
+        insta_planners = await generate_planners("instagram", instagram_post_count)
+        insta_images = await generate_images("instagram", insta_planners)
         # generate insta posts
         for count in range(instagram_post_count):
             try:
                 logger.info(f"Generating Instagram post {count+1}")
-                logger.debug(f"[Instagram:{count+1}] Calling planner with payload: {planner_request.dict()}")
                 
-                # FIX: Pass the Pydantic model, not a dictionary
-                planner = await generate_instagram_planner(planner_request, company_id)
-                if not planner:
-                    raise Exception("Planner returned None")
+                planner = insta_planners[count]
                 
                 logger.info(f"Instagram planner result received")
                 logger.debug(f"[Instagram:{count+1}] Planner response keys: {list(planner.keys())}")
                 
-                # generate image for post - FIX: Use proper content request model
-                from models.content_model import ContentRequest
+                # image for post, rendered with the rest of the batch above
                 image_prompt = planner.get('image_prompt')
                 if not image_prompt:
                     raise Exception("No image prompt returned from planner")
                 
-                # Create proper ContentRequest
-                content_request = ContentRequest(image_prompt=image_prompt)
                 logger.debug(
                     f"[Instagram:{count+1}] Image prompt preview: {image_prompt[:120]}{'...' if len(image_prompt) > 120 else ''}"
                 )
-                image_result = await generate_image_instagram(content_request, company_id)
+                image_result = insta_images[count]
+                if image_result.get('status') == 'error':
+                    raise Exception(image_result.get('message'))
                 image_url = image_result.get('image_url')
                 
                 if not image_url:
@@ -78,6 +116,7 @@ async def generate_scheduled_posts(company_id: str, posts_data: dict):
                     "company_id": company_id,
                     "channel": "instagram",  
                     "image_url": image_url,
+                    "image_variants": image_result.get('image_variants', {}),
                     "caption": planner.get('caption', ''),
                     "hashtags": planner.get('hashtags', []),
                     "overlay_text": planner.get('overlay_text', ''),
@@ -87,41 +126,41 @@ async def generate_scheduled_posts(company_id: str, posts_data: dict):
                     "updated_at": datetime.now(timezone.utc)
                 }
 
-                doc_ref = db.collection('instagram_posts').document(company_id).collection('posts').add(post_data)
-                post_id = doc_ref[1].id
+                doc_ref = db.collection('instagram_posts').document(company_id).collection('posts').document()
+                post_writes.append(set_write(doc_ref, post_data))
+                post_id = doc_ref.id
                 insta_posts.append(post_id)
                 logger.debug(
-                    f"[Instagram:{count+1}] Post data keys persisted: {list(post_data.keys())} | Firestore doc path: instagram_posts/{company_id}/posts/{post_id}"
+                    f"[Instagram:{count+1}] Post data keys staged: {list(post_data.keys())} | Firestore doc path: instagram_posts/{company_id}/posts/{post_id}"
                 )
                 logger.info(f"✅ Generated Instagram post {count+1}/{instagram_post_count} with ID: {post_id}")
 
             except Exception as e:
                 logger.error(f"Failed to generate Instagram post {count+1}: {str(e)}", exc_info=True)
                 raise HTTPException(status_code=500, detail=f"Couldn't generate Instagram post number {count+1} for company {company_id}: {str(e)}")
+        await save_posts("Instagram")
 
         fb_posts = []
+        fb_planners = await generate_planners("facebook", facebook_post_count)
+        fb_images = await generate_images("facebook", fb_planners)
         # generate fb posts
         for count in range(facebook_post_count):
             try:
                 logger.info(f"Generating Facebook post {count+1}")
-                logger.debug(f"[Facebook:{count+1}] Calling planner with payload: {planner_request.dict()}")
                 
-                # FIX: Pass the Pydantic model
-                planner = await generate_facebook_planner(planner_request, company_id)
-                if not planner:
-                    raise Exception("Planner returned None")
+                planner = fb_planners[count]
                 
                 # generate image for post
                 image_prompt = planner.get('image_prompt')
                 if not image_prompt:
                     raise Exception("No image prompt returned from planner")
                 
-                # Create proper ContentRequest
-                content_request = ContentRequest(image_prompt=image_prompt)
                 logger.debug(
                     f"[Facebook:{count+1}] Image prompt preview: {image_prompt[:120]}{'...' if len(image_prompt) > 120 else ''}"
                 )
-                image_result = await generate_image_facebook(content_request, company_id)
+                image_result = fb_images[count]
+                if image_result.get('status') == 'error':
+                    raise Exception(image_result.get('message'))
                 image_url = image_result.get('image_url')
                 
                 if not image_url:
@@ -136,6 +175,7 @@ async def generate_scheduled_posts(company_id: str, posts_data: dict):
                     "company_id": company_id,
                     "channel": "facebook",  
                     "image_url": image_url,
+                    "image_variants": image_result.get('image_variants', {}),
                     "caption": planner.get('caption', ''),
                     "hashtags": planner.get('hashtags', []),
                     "overlay_text": planner.get('overlay_text', ''),
@@ -145,11 +185,12 @@ async def generate_scheduled_posts(company_id: str, posts_data: dict):
                     "updated_at": datetime.now(timezone.utc)
                 }
 
-                doc_ref = db.collection('facebook_posts').document(company_id).collection('posts').add(post_data)
-                post_id = doc_ref[1].id
+                doc_ref = db.collection('facebook_posts').document(company_id).collection('posts').document()
+                post_writes.append(set_write(doc_ref, post_data))
+                post_id = doc_ref.id
                 fb_posts.append(post_id)
                 logger.debug(
-                    f"[Facebook:{count+1}] Post data keys persisted: {list(post_data.keys())} | Firestore doc path: facebook_posts/{company_id}/posts/{post_id}"
+                    f"[Facebook:{count+1}] Post data keys staged: {list(post_data.keys())} | Firestore doc path: facebook_posts/{company_id}/posts/{post_id}"
                 )
         
                 logger.info(f"✅ Generated Facebook post {count+1}/{facebook_post_count} with ID: {post_id}")
@@ -157,30 +198,29 @@ async def generate_scheduled_posts(company_id: str, posts_data: dict):
             except Exception as e:
                 logger.error(f"Failed to generate Facebook post {count+1}: {str(e)}", exc_info=True)
                 raise HTTPException(status_code=500, detail=f"Couldn't generate Facebook post number {count+1} for company {company_id}: {str(e)}")
+        await save_posts("Facebook")
 
         linkedin_posts = []
+        linkedin_planners = await generate_planners("linkedin", linkedin_post_count)
+        linkedin_images = await generate_images("linkedin", linkedin_planners)
         # generate linkedin posts
         for count in range(linkedin_post_count):
             try:
                 logger.info(f"Generating LinkedIn post {count+1}")
-                logger.debug(f"[LinkedIn:{count+1}] Calling planner with payload: {planner_request.dict()}")
                 
-                # FIX: Pass the Pydantic model
-                planner = await generate_linkedin_planner(planner_request, company_id)
-                if not planner:
-                    raise Exception("Planner returned None")
+                planner = linkedin_planners[count]
                 
                 # generate image for post
                 image_prompt = planner.get('image_prompt')
                 if not image_prompt:
                     raise Exception("No image prompt returned from planner")
                 
-                # Create proper ContentRequest
-                content_request = ContentRequest(image_prompt=image_prompt)
                 logger.debug(
                     f"[LinkedIn:{count+1}] Image prompt preview: {image_prompt[:120]}{'...' if len(image_prompt) > 120 else ''}"
                 )
-                image_result = await generate_image_linkedin(content_request, company_id)
+                image_result = linkedin_images[count]
+                if image_result.get('status') == 'error':
+                    raise Exception(image_result.get('message'))
                 image_url = image_result.get('image_url')
                 
                 if not image_url:
@@ -195,6 +235,7 @@ async def generate_scheduled_posts(company_id: str, posts_data: dict):
                     "company_id": company_id,
                     "channel": "linkedin",  
                     "image_url": image_url,
+                    "image_variants": image_result.get('image_variants', {}),
                     "caption": planner.get('caption', ''),
                     "hashtags": planner.get('hashtags', []),
                     "status" : "draft",
@@ -204,11 +245,12 @@ async def generate_scheduled_posts(company_id: str, posts_data: dict):
                     "updated_at": datetime.now(timezone.utc)
                 }
 
-                doc_ref = db.collection('linkedin_posts').document(company_id).collection('posts').add(post_data)
-                post_id = doc_ref[1].id
+                doc_ref = db.collection('linkedin_posts').document(company_id).collection('posts').document()
+                post_writes.append(set_write(doc_ref, post_data))
+                post_id = doc_ref.id
                 linkedin_posts.append(post_id)
                 logger.debug(
-                    f"[LinkedIn:{count+1}] Post data keys persisted: {list(post_data.keys())} | Firestore doc path: linkedin_posts/{company_id}/posts/{post_id}"
+                    f"[LinkedIn:{count+1}] Post data keys staged: {list(post_data.keys())} | Firestore doc path: linkedin_posts/{company_id}/posts/{post_id}"
                 )
                 
                 logger.info(f"✅ Generated LinkedIn post {count+1}/{linkedin_post_count} with ID: {post_id}")
@@ -216,7 +258,8 @@ async def generate_scheduled_posts(company_id: str, posts_data: dict):
             except Exception as e:
                 logger.error(f"Failed to generate LinkedIn post {count+1}: {str(e)}", exc_info=True)
                 raise HTTPException(status_code=500, detail=f"Couldn't generate LinkedIn post number {count+1} for company {company_id}: {str(e)}")
-            
+        await save_posts("LinkedIn")
+
         # Combine all post IDs
         all_posts = insta_posts + fb_posts + linkedin_posts
 
@@ -1,10 +1,10 @@
+import asyncio
 import logging
 import os
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Union
 from datetime import datetime, timezone
 from config.firebase_config import get_firebase_client
-import tempfile
-import os as _os
+from utils.upload_stream import upload_from_buffer
 
 from dotenv import load_dotenv
 
@@ -15,7 +15,13 @@ logger = logging.getLogger(__name__)
 storage_client, db = get_firebase_client()
 
 
-async def upload_image(image_bytes: bytes, path: str, content_type: str = "image/png") -> str:
+async def upload_image(image_bytes: Union[bytes, bytearray, memoryview], path: str, content_type: str = "image/png") -> str:
+    """
+    Upload an in-memory image to Firebase Storage and return its download URL.
+
+    The image is streamed straight from the caller's buffer (no temporary file), on a
+    worker thread so the event loop keeps serving other requests during the upload.
+    """
     try:
         bucket_name = os.getenv("FIREBASE_STORAGE_BUCKET")
         if not bucket_name:
@@ -24,24 +30,7 @@ async def upload_image(image_bytes: bytes, path: str, content_type: str = "image
         bucket = storage_client.bucket(bucket_name)
         blob = bucket.blob(path)
 
-        # Reduce peak memory by streaming from a temporary file with controlled chunk size
-        # 1MB chunks limit RAM spikes across concurrent requests
-        blob.chunk_size = 1 * 1024 * 1024
-
-        tmp_file = None
-        try:
-            tmp_file = tempfile.NamedTemporaryFile(delete=False)
-            tmp_file.write(image_bytes)
-            tmp_file.flush()
-            tmp_file.close()
-
-            blob.upload_from_filename(tmp_file.name, content_type=content_type)
-        finally:
-            if tmp_file is not None:
-                try:
-                    _os.unlink(tmp_file.name)
-                except Exception:
-                    pass
+        await asyncio.to_thread(upload_from_buffer, blob, image_bytes, content_type)
         
         encoded_path = path.replace('/', '%2F')
         public_url = f"https://firebasestorage.googleapis.com/v0/b/{bucket_name}/o/{encoded_path}?alt=media"
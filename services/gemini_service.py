@@ -1,17 +1,20 @@
 import os
+import asyncio
 import logging
 from PIL import Image
 from io import BytesIO
-from google import genai
 import requests
-import base64
-from typing import Dict, Any, Tuple, Optional
-from config.gemini_config import get_gemini_api_key
+from typing import Dict, Any, List, Tuple, Optional, Union
+from services.image_providers import get_image_provider, IMAGE_PROVIDER, ImageRateLimitError
+from services.image_limiter import get_image_limiter, ImageQueueTimeoutError
+from services.llm_resilience import backoff_delay
 
 logger = logging.getLogger(__name__)
 
 
-client = genai.Client(api_key=get_gemini_api_key())
+GEMINI_IMAGE_TIMEOUT_SECONDS = float(os.getenv("GEMINI_IMAGE_TIMEOUT_SECONDS", "90"))
+# extra attempts for a rate-limited image; each one queues again behind the reduced limit
+IMAGE_RATE_LIMIT_RETRIES = int(os.getenv("IMAGE_RATE_LIMIT_RETRIES", "2"))
 
 
 ASPECT_RATIOS = {
@@ -21,57 +24,128 @@ ASPECT_RATIOS = {
 }
 
 
-async def generate_image(planner_info: Dict[str, Any]) -> Optional[Tuple[bytes, str]]:
+def _image_instructions(channel: str, aspect_ratio: str) -> str:
+    """
+    Prompt boilerplate shared by every image of a channel (everything except the subject)
+    """
+    instructions = f"""
+        Generate a professional, high-quality, photorealistic image for a {channel} post.
+        Use cinematic lighting, vibrant colors, and visually appealing composition suitable for a marketing campaign.
+        The image must have an aspect ratio of {aspect_ratio}.
+        Do not include any text, words, letters, logos, watermarks, or overlays — only visuals.
+        """
+    if channel == 'instagram':
+        pass
+    elif channel == 'linkedin':
+        instructions += " The style should be corporate and sophisticated."
+    elif channel == 'facebook':
+        pass
+    return instructions
+
+
+async def _call_provider(units: int, request):
+    """
+    Run one provider request (rendering `units` images) in a slot of the adaptive image
+    limiter, bounded by GEMINI_IMAGE_TIMEOUT_SECONDS per image. Rate-limited requests are
+    retried after a backoff, by which time the limiter has cut concurrency.
+    """
+    limiter = get_image_limiter()
+    for attempt in range(IMAGE_RATE_LIMIT_RETRIES + 1):
+        try:
+            async with limiter.slot(units):
+                async with asyncio.timeout(GEMINI_IMAGE_TIMEOUT_SECONDS * units):
+                    return await request()
+        except ImageRateLimitError:
+            if attempt == IMAGE_RATE_LIMIT_RETRIES:
+                raise
+            delay = backoff_delay(attempt)
+            logger.warning(f"Image provider rate limited, retrying in {delay:.1f}s (attempt {attempt + 1})")
+            await asyncio.sleep(delay)
+
+
+async def generate_image(planner_info: Dict[str, Any]) -> Optional[Tuple[Union[bytes, memoryview], str]]:
+    """
+    Generate an image for a planner through the configured image provider
+    (Gemini by default, see services.image_providers).
+
+    Concurrency is set by the adaptive limiter in services.image_limiter: requests wait
+    in FIFO order for a slot (up to IMAGE_QUEUE_TIMEOUT_SECONDS), then the generation
+    itself is bounded by GEMINI_IMAGE_TIMEOUT_SECONDS.
+    Cancelling the calling task cancels the request to the provider.
+
+    The image is returned as the provider's own buffer so it is not copied again before upload.
+    """
+    channel = str(planner_info.get("channel", "")).lower()
     try:
         image_prompt = planner_info["image_prompt"]
         channel = planner_info["channel"].lower()
         
         aspect_ratio = ASPECT_RATIOS.get(channel, '1:1')
 
-        enhanced_prompt = f"""
-        Generate a professional, high-quality, photorealistic image for a {channel} post.
-        Subject: {image_prompt}.
-        Use cinematic lighting, vibrant colors, and visually appealing composition suitable for a marketing campaign.
-        The image must have an aspect ratio of {aspect_ratio}.
-        Do not include any text, words, letters, logos, watermarks, or overlays — only visuals.
-        """
-        if channel == 'instagram':
-            pass
-        elif channel == 'linkedin':
-            enhanced_prompt += " The style should be corporate and sophisticated."
-        elif channel == 'facebook':
-            pass
-
-        response = client.models.generate_content(
-            model="gemini-2.5-flash-image-preview",
-            contents=[enhanced_prompt],
-        )
-
-        # Extract image data; if it's already bytes, use as-is. If it's a string, decode as base64.
-        for part in response.candidates[0].content.parts:
-            if part.inline_data is not None:
-                mime_type = getattr(part.inline_data, "mime_type", None) or "image/png"
-                data_field = part.inline_data.data
-
-                # If SDK returns bytes/bytearray, assume it's raw image bytes
-                if isinstance(data_field, (bytes, bytearray)):
-                    image_bytes = bytes(data_field)
-                else:
-                    # If it's a string, attempt strict base64 decode
-                    if isinstance(data_field, str):
-                        try:
-                            image_bytes = base64.b64decode(data_field, validate=True)
-                        except Exception:
-                            # If not valid base64, treat as UTF-8 bytes (best effort)
-                            image_bytes = data_field.encode("utf-8")
-                    else:
-                        # Unknown type; coerce via bytes()
-                        image_bytes = bytes(data_field)
-                return image_bytes, mime_type
-
-        raise ValueError("No image data found in the response.")
+        enhanced_prompt = f"{_image_instructions(channel, aspect_ratio)}\nSubject: {image_prompt}."
 
+        provider = get_image_provider()
+        return await _call_provider(1, lambda: provider.generate(enhanced_prompt, aspect_ratio))
+
+    except ImageQueueTimeoutError as e:
+        logger.error(f"Image generation for channel '{channel}' was not started: {str(e)}")
+        return None
+    except TimeoutError:
+        logger.error(f"Image generation for channel '{channel}' timed out after {GEMINI_IMAGE_TIMEOUT_SECONDS:g}s")
+        return None
     except Exception as e:
-        logger.error(f"Error generating image with Gemini API for channel '{channel}': {str(e)}")
+        logger.error(f"Error generating image with {IMAGE_PROVIDER} provider for channel '{channel}': {str(e)}")
         return None
 
+
+async def _generate_image_batch(channel: str, planner_infos: List[Dict[str, Any]]) -> List[Optional[Tuple[Union[bytes, memoryview], str]]]:
+    provider = get_image_provider()
+    aspect_ratio = ASPECT_RATIOS.get(channel, '1:1')
+    images = []
+    try:
+        # one provider call for the whole batch, so it gets the timeout budget of that many images
+        images = await _call_provider(len(planner_infos), lambda: provider.generate_batch(
+            [planner_info["image_prompt"] for planner_info in planner_infos],
+            aspect_ratio,
+            _image_instructions(channel, aspect_ratio),
+        ))
+    except TimeoutError:
+        logger.error(f"Batch of {len(planner_infos)} images for channel '{channel}' timed out, rendering them one by one")
+    except Exception as e:
+        logger.error(f"Batch image generation with {IMAGE_PROVIDER} provider for channel '{channel}' failed, rendering one by one: {str(e)}")
+
+    # anything the batch call did not return is rendered on its own
+    missing = planner_infos[len(images):]
+    if missing:
+        images = list(images) + list(await asyncio.gather(*(generate_image(planner_info) for planner_info in missing)))
+    return images
+
+
+async def generate_images(planner_infos: List[Dict[str, Any]]) -> List[Optional[Tuple[Union[bytes, memoryview], str]]]:
+    """
+    Generate images for several planners, in order, asking the provider for up to its
+    max_batch_size images per call (grouped by channel, since the prompt boilerplate and
+    aspect ratio are shared). Failed images are None, like generate_image.
+    """
+    provider = get_image_provider()
+    results: List[Optional[Tuple[Union[bytes, memoryview], str]]] = [None] * len(planner_infos)
+
+    by_channel: Dict[str, List[int]] = {}
+    for index, planner_info in enumerate(planner_infos):
+        by_channel.setdefault(str(planner_info.get("channel", "")).lower(), []).append(index)
+
+    async def render(indexes: List[int], channel: str):
+        if len(indexes) == 1:
+            images = [await generate_image(planner_infos[indexes[0]])]
+        else:
+            images = await _generate_image_batch(channel, [planner_infos[index] for index in indexes])
+        for index, image in zip(indexes, images):
+            results[index] = image
+
+    batch_size = max(1, provider.max_batch_size)
+    await asyncio.gather(*(
+        render(indexes[start:start + batch_size], channel)
+        for channel, indexes in by_channel.items()
+        for start in range(0, len(indexes), batch_size)
+    ))
+    return results
@@ -1,33 +1,267 @@
-from openai import OpenAI
+from openai import AsyncOpenAI, RateLimitError
 import os
+import re
 import json
+import time
+import asyncio
 from dotenv import load_dotenv
 
+from services import llm_cache
+from services.openai_limiter import get_openai_limiter, estimate_tokens
+from services.llm_resilience import call_with_retries, record_reask
+from services.llm_usage import record_usage
+from services.brand_context import get_brand_context, get_image_profile, IMAGE_ANALYSIS_FIELDS
+from utils.logger import setup_logger
+
 load_dotenv()
 
+logger = setup_logger("marketing-app")
+
 
 _openai_client = None
 
 def get_openai_client():
-    """Get singleton OpenAI client instance"""
+    """Get singleton AsyncOpenAI client instance so completions never block the event loop"""
     global _openai_client
     if _openai_client is None:
-        _openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        # retries are handled by llm_resilience so they also pass through the admission controller
+        _openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
     return _openai_client
 
 
-def generate_all_themes(company_data):
-    address = company_data['address']
-    company_info = company_data['company_info']
-    company_name = company_data['company_name']
-    industry = company_data['industry']
-    keywords = company_data['keywords']
-    target_group = company_data['target_group']
-    theme_colors = company_data['theme_colors']
-    tone_analysis = company_data['tone_analysis']
-    products = company_data['products']
-    product_categories = company_data['product_categories']
+OPENAI_MODEL = "gpt-4o-mini"
+
+
+# follow-up attempts when a response parses but fails validation
+MAX_REASKS = 2
+
+
+async def _create_completion(request, name, channel=None):
+    """
+    Send one chat completion through the admission controller, record its usage
+    and return the message content
+    """
+    client = get_openai_client()
+    limiter = get_openai_limiter()
+    async with limiter.admit(estimate_tokens(request["messages"])) as admission:
+        started = time.perf_counter()
+        try:
+            response = await client.chat.completions.create(**request)
+        except RateLimitError as e:
+            limiter.penalize(_retry_after_seconds(e))
+            raise
+        if response.usage is not None:
+            admission.record_usage(response.usage.total_tokens)
+            record_usage(request["model"], response.usage, time.perf_counter() - started, name, channel)
+    return response.choices[0].message.content.strip()
+
+
+async def _chat_completion(messages, temperature, response_format=None, name="chat_completion", channel=None, hedge=False):
+    """
+    Run a chat completion with retries (and optional hedging) and return the stripped message content
+    """
+    request = {"model": OPENAI_MODEL, "messages": messages, "temperature": temperature}
+    if response_format is not None:
+        request["response_format"] = response_format
+
+    return await call_with_retries(name, lambda: _create_completion(request, name, channel), hedge=hedge)
+
 
+async def _chat_json(messages, temperature, response_format=None, name="chat_completion", channel=None, validate=None, hedge=False):
+    """
+    Run a chat completion and return the parsed JSON.
+
+    Responses that are not valid JSON or fail `validate` get a targeted re-ask with the
+    error, up to MAX_REASKS times. Functions opted in to the LLM cache are served from it.
+    """
+    cache_key = None
+    if llm_cache.is_enabled_for(name):
+        cache_key = llm_cache.make_cache_key(OPENAI_MODEL, messages, temperature, response_format)
+        cached = await llm_cache.lookup(cache_key)
+        if cached is not None:
+            try:
+                data = json.loads(cached)
+                if validate:
+                    validate(data)
+                return data
+            except ValueError:
+                pass
+
+    conversation = list(messages)
+    for reask in range(MAX_REASKS + 1):
+        content = await _chat_completion(conversation, temperature, response_format, name=name, channel=channel, hedge=hedge)
+        content = content.replace('```json', '').replace('```', '').strip()
+        try:
+            data = json.loads(content)
+            if validate:
+                validate(data)
+            break
+        except ValueError as e:
+            # json.JSONDecodeError is a ValueError too
+            if reask == MAX_REASKS:
+                raise ValueError(f"Model did not return a valid response: {e}\nContent: {content[:500]}")
+            record_reask()
+            conversation = list(messages) + [
+                {"role": "assistant", "content": content},
+                {"role": "user", "content": f"Your previous response was invalid: {e}. "
+                                            f"Reply again with the complete corrected JSON only."},
+            ]
+
+    if cache_key is not None:
+        await llm_cache.store(cache_key, content)
+    return data
+
+
+async def _stream_chat_completion(messages, temperature, response_format=None, name="chat_completion", channel=None):
+    """
+    Stream a chat completion through the admission controller, yielding content deltas.
+    Only opening the stream is retried; usage is recorded from the final chunk.
+    """
+    request = {
+        "model": OPENAI_MODEL,
+        "messages": messages,
+        "temperature": temperature,
+        "stream": True,
+        "stream_options": {"include_usage": True},
+    }
+    if response_format is not None:
+        request["response_format"] = response_format
+
+    client = get_openai_client()
+    limiter = get_openai_limiter()
+
+    async def open_stream():
+        try:
+            return await client.chat.completions.create(**request)
+        except RateLimitError as e:
+            limiter.penalize(_retry_after_seconds(e))
+            raise
+
+    async with limiter.admit(estimate_tokens(messages)) as admission:
+        started = time.perf_counter()
+        stream = await call_with_retries(name, open_stream)
+        async for chunk in stream:
+            if getattr(chunk, "usage", None) is not None:
+                admission.record_usage(chunk.usage.total_tokens)
+                record_usage(OPENAI_MODEL, chunk.usage, time.perf_counter() - started, name, channel)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+_JSON_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+class _JsonStringFieldStream:
+    """
+    Incrementally decode one string field (e.g. "caption") out of a JSON object being streamed
+    """
+
+    def __init__(self, field):
+        self._pattern = re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+        self._buffer = ""
+        self._pos = None
+        self.done = False
+
+    def feed(self, text):
+        if self.done:
+            return ""
+        self._buffer += text
+        if self._pos is None:
+            match = self._pattern.search(self._buffer)
+            if not match:
+                return ""
+            self._pos = match.end()
+
+        buffer, i, out = self._buffer, self._pos, []
+        while i < len(buffer):
+            char = buffer[i]
+            if char == '"':
+                self.done = True
+                i += 1
+                break
+            if char != '\\':
+                out.append(char)
+                i += 1
+                continue
+            # escape sequences may be split across chunks; wait for the rest
+            if i + 1 >= len(buffer):
+                break
+            escape = buffer[i + 1]
+            if escape != 'u':
+                out.append(_JSON_ESCAPES.get(escape, escape))
+                i += 2
+                continue
+            length = 6
+            if i + 6 <= len(buffer) and 0xD800 <= int(buffer[i + 2:i + 6], 16) <= 0xDBFF:
+                length = 12  # surrogate pair
+            if i + length > len(buffer):
+                break
+            out.append(json.loads('"' + buffer[i:i + length] + '"'))
+            i += length
+        self._pos = i
+        return "".join(out)
+
+
+async def _stream_json_field(messages, temperature, response_format, name, field, channel=None, validate=None):
+    """
+    Stream a JSON completion, yielding ("delta", text) for `field` as it arrives and finally
+    ("result", data) with the parsed and validated object. An invalid final object is
+    re-asked through the non-streaming path.
+    """
+    field_stream = _JsonStringFieldStream(field)
+    chunks = []
+    async for delta in _stream_chat_completion(messages, temperature, response_format, name=name, channel=channel):
+        chunks.append(delta)
+        text = field_stream.feed(delta)
+        if text:
+            yield "delta", text
+
+    content = "".join(chunks).replace('```json', '').replace('```', '').strip()
+    try:
+        data = json.loads(content)
+        if validate:
+            validate(data)
+    except ValueError as e:
+        record_reask()
+        data = await _chat_json(
+            list(messages) + [
+                {"role": "assistant", "content": content},
+                {"role": "user", "content": f"Your previous response was invalid: {e}. "
+                                            f"Reply again with the complete corrected JSON only."},
+            ],
+            temperature,
+            response_format,
+            name=name,
+            channel=channel,
+            validate=validate,
+        )
+    yield "result", data
+
+
+def _retry_after_seconds(error):
+    try:
+        return float(error.response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def _expect_list(data):
+    if not isinstance(data, list):
+        raise ValueError("Expected a JSON array")
+
+
+def _expect_fields(*fields):
+    def validate(data):
+        if not isinstance(data, dict):
+            raise ValueError("Expected a JSON object")
+        for field in fields:
+            if field not in data:
+                raise ValueError(f"Response missing required field: {field}")
+    return validate
+
+
+async def generate_all_themes(company_data):
+    address = company_data['address']
 
     system_prompt = """
     You are an expert social media content strategist who specializes in creating monthly themed campaigns for brands worldwide.
@@ -71,16 +305,7 @@ def generate_all_themes(company_data):
 
     """
     prompt = f""" Generate two social media post themes per month using the company details below:
-                Company Name: {company_name}
-                Address: {address}
-                Company Information: {company_info}
-                Industry: {industry}
-                Keywords: {keywords}
-                Target Group: {target_group}
-                theme_colors = {theme_colors}
-                tone_analysis = {tone_analysis}
-                products = {products}
-                product_categories = {product_categories}
+{get_brand_context(company_data)}
 
                 Determine the location from the provided {address} and identify its country. Use the {address} to determine the regional language, and generate the themes in that language only.
                 Generate all monthly themes strictly based on local seasonal patterns, festivals, and cultural observances in that country only.
@@ -90,35 +315,21 @@ def generate_all_themes(company_data):
                 Return 12 months of creative themes in the exact JSON format required.
                 """
 
-    client = get_openai_client()
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
+    themes = await _chat_json(
         messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": prompt}
             ],
-        temperature=0.7
+        temperature=0.7,
+        name="generate_all_themes",
+        validate=_expect_list
     )
-    content = response.choices[0].message.content.strip()
-    import json
-    try:
-        themes = json.loads(content)
-    except json.JSONDecodeError:
-        raise ValueError(f"Model did not return valid JSON: {content[:200]}")
 
     return themes
 
 
-def generate_theme(company_data, month, existing_themes=None):
+async def generate_theme(company_data, month, existing_themes=None):
     address = company_data['address']
-    company_info = company_data['company_info']
-    industry = company_data['industry']
-    keywords = company_data['keywords']
-    target_group = company_data['target_group']
-    theme_colors = company_data['theme_colors']
-    tone_analysis = company_data['tone_analysis']
-    products = company_data['products']
-    product_categories = company_data['product_categories']
 
     system_prompt = """
     You are a social media content strategist that generates engaging monthly themes 
@@ -141,15 +352,7 @@ def generate_theme(company_data, month, existing_themes=None):
             Determine the location from the provided {address} and identify its country. Use the {address} to determine the regional language, and generate the themes in that language only.
 
             **Company Details**
-            - Address: {address}
-            - Industry: {industry}
-            - Company Information: {company_info}
-            - Keywords: {keywords}
-            - Target Audience: {target_group}
-            - Theme Colors: {theme_colors}
-            - Tone_analysis = {tone_analysis}
-            - Products = {products}
-            - Product_categories = {product_categories}
+{get_brand_context(company_data)}
 
             {existing_themes_context}
 
@@ -180,50 +383,27 @@ def generate_theme(company_data, month, existing_themes=None):
             }}
             """
 
-    client = get_openai_client()
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
+    themes = await _chat_json(
         messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": prompt}],
-        temperature=0.8  
+        temperature=0.8,
+        name="generate_theme",
+        validate=_expect_fields("themes")
     )
-    content = response.choices[0].message.content.strip()
-    
-    if content.startswith('```json'):
-        content = content[7:]
-    if content.endswith('```'):
-        content = content[:-3]
-    content = content.strip()
-    
-    import json
-    try:
-        themes = json.loads(content)
-    except json.JSONDecodeError:
-        raise ValueError(f"Model did not return valid JSON: {content[:200]}")
 
     return themes
 
 
-def generate_instagram_post(company_data, theme, theme_description):
+def _instagram_post_prompt(company_data, theme, theme_description):
     """
-    Generate Instagram-specific social media content with engaging, visual-focused captions
+    Build the system message and user prompt for an Instagram post
     """
-    _validate_company_data(company_data)
-    
     system_message = """You are a creative marketing expert who generates highly engaging, visual-focused content for Instagram. Create catchy, emoji-rich captions that grab attention while staying informative and authentic to the brand."""
     
     prompt = f"""
             Generate Instagram-specific social media content with HIGH ENGAGEMENT.
 
             COMPANY INFORMATION:
-            - Company Name: {company_data['company_name']}
-            - Industry: {company_data['industry']}
-            - About: {company_data['company_info']}
-            - Location: {company_data['address']}
-            - Target Audience: {company_data['target_group']}
-            - Keywords: {company_data['keywords']}
-            - Tone_analysis = {company_data['tone_analysis']}
-            - Products = {company_data['products']}
-            - Product_categories = {company_data['product_categories']}
+{get_brand_context(company_data)}
 
             THEME:
             - Title: {theme}
@@ -252,30 +432,29 @@ def generate_instagram_post(company_data, theme, theme_description):
             }}
             """
 
-    return _generate_single_post(system_message, prompt, "Instagram")
+    return system_message, prompt
 
 
-def generate_linkedin_post(company_data, theme, theme_description):
+async def generate_instagram_post(company_data, theme, theme_description):
     """
-    Generate LinkedIn-specific social media content with professional yet engaging captions
+    Generate Instagram-specific social media content with engaging, visual-focused captions
     """
     _validate_company_data(company_data)
-    
+    system_message, prompt = _instagram_post_prompt(company_data, theme, theme_description)
+    return await _generate_single_post(system_message, prompt, "Instagram")
+
+
+def _linkedin_post_prompt(company_data, theme, theme_description):
+    """
+    Build the system message and user prompt for a LinkedIn post
+    """
     system_message = """You are a marketing expert who creates professional yet engaging LinkedIn content. Balance business insights with engaging elements like strategic emojis and compelling storytelling."""
     
     prompt = f"""
             Generate LinkedIn-specific social media content with PROFESSIONAL ENGAGEMENT.
 
             COMPANY INFORMATION:
-            - Company Name: {company_data['company_name']}
-            - Industry: {company_data['industry']}
-            - About: {company_data['company_info']}
-            - Location: {company_data['address']}
-            - Target Audience: {company_data['target_group']}
-            - Keywords: {company_data['keywords']}
-            - Tone_analysis = {company_data['tone_analysis']}
-            - Products = {company_data['products']}
-            - Product_categories = {company_data['product_categories']}
+{get_brand_context(company_data)}
 
             THEME:
             - Title: {theme}
@@ -304,30 +483,29 @@ def generate_linkedin_post(company_data, theme, theme_description):
             }}
             """
 
-    return _generate_single_post(system_message, prompt, "LinkedIn")
+    return system_message, prompt
 
 
-def generate_facebook_post(company_data, theme, theme_description):
+async def generate_linkedin_post(company_data, theme, theme_description):
     """
-    Generate Facebook-specific social media content with highly engaging, community-focused captions
+    Generate LinkedIn-specific social media content with professional yet engaging captions
     """
     _validate_company_data(company_data)
-    
+    system_message, prompt = _linkedin_post_prompt(company_data, theme, theme_description)
+    return await _generate_single_post(system_message, prompt, "LinkedIn")
+
+
+def _facebook_post_prompt(company_data, theme, theme_description):
+    """
+    Build the system message and user prompt for a Facebook post
+    """
     system_message = """You are a community-focused marketing expert who creates highly engaging, conversational Facebook content. Use emojis, questions, and community-building language to drive engagement."""
     
     prompt = f"""
             Generate Facebook-specific social media content with MAXIMUM ENGAGEMENT.
 
             COMPANY INFORMATION:
-            - Company Name: {company_data['company_name']}
-            - Industry: {company_data['industry']}
-            - About: {company_data['company_info']}
-            - Location: {company_data['address']}
-            - Target Audience: {company_data['target_group']}
-            - Keywords: {company_data['keywords']}
-            - Tone_analysis = {company_data['tone_analysis']}
-            - Products = {company_data['products']}
-            - Product_categories = {company_data['product_categories']}
+{get_brand_context(company_data)}
 
             THEME:
             - Title: {theme}
@@ -356,7 +534,16 @@ def generate_facebook_post(company_data, theme, theme_description):
             }}
             """
 
-    return _generate_single_post(system_message, prompt, "Facebook")
+    return system_message, prompt
+
+
+async def generate_facebook_post(company_data, theme, theme_description):
+    """
+    Generate Facebook-specific social media content with highly engaging, community-focused captions
+    """
+    _validate_company_data(company_data)
+    system_message, prompt = _facebook_post_prompt(company_data, theme, theme_description)
+    return await _generate_single_post(system_message, prompt, "Facebook")
 
 
 def _validate_company_data(company_data):
@@ -372,55 +559,62 @@ def _validate_company_data(company_data):
             raise ValueError(f"Missing required field in company_data: {field}")
 
 
-def _generate_single_post(system_message, prompt, expected_channel):
+POST_FIELDS = ['channel', 'caption', 'hashtags', 'overlay_text']
+
+
+def _validate_post(post, expected_channel, required_post_fields=POST_FIELDS):
+    """
+    Validate a generated post against the planner fields
+    """
+    if not isinstance(post, dict):
+        raise ValueError("Post should be a JSON object")
+
+    for field in required_post_fields:
+        if field not in post:
+            raise ValueError(f"Post missing required field: {field}")
+
+    if post['channel'] != expected_channel:
+        raise ValueError(f"Expected channel '{expected_channel}', but got '{post['channel']}'")
+
+    if not isinstance(post['hashtags'], list):
+        raise ValueError("Hashtags should be an array")
+
+
+async def _generate_single_post(system_message, prompt, expected_channel, response_format=None, required_post_fields=POST_FIELDS):
     """
     Generate a single social media post using the AI model
     """
     try:
-        client = get_openai_client()
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
+        # the single post response is validated (and re-asked) inside _chat_json
+        post = await _chat_json(
             messages=[
                 {"role": "system", "content": system_message},
                 {"role": "user", "content": prompt}
             ],
             temperature=0.7, 
-            response_format={"type": "json_object"}  
+            response_format=response_format or {"type": "json_object"},
+            name=f"generate_{expected_channel.lower()}_post",
+            channel=expected_channel,
+            validate=lambda post: _validate_post(post, expected_channel, required_post_fields),
+            hedge=True
         )
         
-        content = response.choices[0].message.content.strip()
-        content = content.replace('```json', '').replace('```', '').strip()
-        
-        post = json.loads(content)
-        
-        # Validate the single post response
-        required_post_fields = ['channel', 'caption', 'hashtags', 'overlay_text']
-        for field in required_post_fields:
-            if field not in post:
-                raise ValueError(f"Post missing required field: {field}")
-        
-        if post['channel'] != expected_channel:
-            raise ValueError(f"Expected channel '{expected_channel}', but got '{post['channel']}'")
-        
-        if not isinstance(post['hashtags'], list):
-            raise ValueError("Hashtags should be an array")
-        
         return post
         
-    except json.JSONDecodeError as e:
-        raise ValueError(f"Failed to parse JSON response: {e}\nContent: {content[:500]}")
     except Exception as e:
         raise ValueError(f"Error generating {expected_channel} post: {str(e)}")
 
 
-def generate_all_posts(company_data, theme, theme_description):
+async def generate_all_posts(company_data, theme, theme_description):
     """
     Generate posts for all three social media platforms
     Returns the same format as the original function
     """
-    instagram_post = generate_instagram_post(company_data, theme, theme_description)
-    linkedin_post = generate_linkedin_post(company_data, theme, theme_description)
-    facebook_post = generate_facebook_post(company_data, theme, theme_description)
+    instagram_post, linkedin_post, facebook_post = await asyncio.gather(
+        generate_instagram_post(company_data, theme, theme_description),
+        generate_linkedin_post(company_data, theme, theme_description),
+        generate_facebook_post(company_data, theme, theme_description),
+    )
     
     return {
         "posts": [
@@ -430,9 +624,11 @@ def generate_all_posts(company_data, theme, theme_description):
         ]
     }
 
-async def regenerate_caption(caption: str, hashtags: list[str], overlay_text: str):
-    try:
-        system_message = """
+def _regenerate_caption_messages(caption: str, hashtags: list[str], overlay_text: str):
+    """
+    Build the chat messages for a caption regeneration
+    """
+    system_message = """
         You are a professional social media marketing expert specializing in creating highly engaging, scroll-stopping captions that match visual content and brand tone.
         Respond strictly in JSON format with the following fields:
         {
@@ -440,7 +636,7 @@ async def regenerate_caption(caption: str, hashtags: list[str], overlay_text: st
         }
         """
 
-        prompt = f"""
+    prompt = f"""
         Create a fresh, engaging, descriptive and visually appealing caption for a social media post.
         
         Requirements:
@@ -470,31 +666,93 @@ async def regenerate_caption(caption: str, hashtags: list[str], overlay_text: st
         Generate a new caption that aligns with the vibe implied by the hashtags and overlay text but remains unique and compelling.
         """
 
-        client = get_openai_client()
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "system", "content": system_message}, {"role": "user", "content": prompt}],
+    return [{"role": "system", "content": system_message}, {"role": "user", "content": prompt}]
+
+
+async def regenerate_caption(caption: str, hashtags: list[str], overlay_text: str):
+    try:
+        return await _chat_json(
+            messages=_regenerate_caption_messages(caption, hashtags, overlay_text),
             temperature=0.7,
-            response_format={"type": "json_object"}
+            response_format={"type": "json_object"},
+            name="regenerate_caption",
+            validate=_expect_fields("caption"),
+            hedge=True
         )
-        content = response.choices[0].message.content.strip()
-        return json.loads(content)
 
     except Exception as e:
         raise ValueError(f"Error regenerating caption: {str(e)}")
 
+
+CAPTION_VARIANTS_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "caption_variants",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "captions": {"type": "array", "items": {"type": "string"}},
+            },
+            "required": ["captions"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+
+async def generate_caption_variants(caption: str, hashtags: list[str], overlay_text: str, count: int):
+    """
+    Generate `count` distinct regenerated captions for one post in a single completion
+    """
+    messages = _regenerate_caption_messages(caption, hashtags, overlay_text)
+    messages[-1]["content"] += f"""
+        VARIANTS:
+        Generate exactly {count} DISTINCT captions, each with a different hook, angle and call-to-action.
+        Return a JSON object of the form {{"captions": ["...", "..."]}}.
+        """
+
+    def validate(data):
+        captions = data.get("captions") if isinstance(data, dict) else None
+        if not isinstance(captions, list) or not all(isinstance(item, str) and item.strip() for item in captions):
+            raise ValueError("Response 'captions' should be an array of non-empty strings")
+        if len(captions) < count:
+            raise ValueError(f"Expected {count} captions, but got {len(captions)}")
+
+    try:
+        data = await _chat_json(
+            messages=messages,
+            temperature=0.9,
+            response_format=CAPTION_VARIANTS_RESPONSE_FORMAT,
+            name="regenerate_caption_variants",
+            validate=validate,
+        )
+    except Exception as e:
+        raise ValueError(f"Error regenerating caption: {str(e)}")
+    return data["captions"][:count]
+
     
 
 #########################################  image prompt generation  #########################################
 
 
 
-def normalize_field(value):
-    if isinstance(value, set):
-        return ", ".join(value)
-    if value is None:
-        return ""
-    return str(value)
+def get_image_analysis(company_data):
+    """
+    Pick the image analysis fields out of a company document
+    """
+    return {field: company_data.get(field, "") for field in IMAGE_ANALYSIS_FIELDS}
+
+
+PHOTOGRAPHY_RULES = """
+    PHOTOGRAPHY RULES:
+    - Always describe a *photograph*, never illustrations, digital art, CGI, or rendering.
+    - Emphasize realism: natural lighting, lifelike textures, real human appearance, natural camera depth of field.
+    - Use true photography terminology:
+      “shot on 35mm lens”, “bokeh background”, “cinematic lighting”, “soft shadows”, “natural daylight”.
+    - Only describe things a real camera could capture.
+    - NEVER mention AI, generative tools, or digital art styles.
+    """
 
 
 async def generate_image_prompt(caption: str, hashtags: list[str], overlay_text: str, image_analysis: dict):
@@ -518,15 +776,7 @@ async def generate_image_prompt(caption: str, hashtags: list[str], overlay_text:
         • technology elements
         • theme and atmosphere
     - Do NOT introduce anything outside the company's style.
-
-    PHOTOGRAPHY RULES:
-    - Always describe a *photograph*, never illustrations, digital art, CGI, or rendering.
-    - Emphasize realism: natural lighting, lifelike textures, real human appearance, natural camera depth of field.
-    - Use true photography terminology:
-      “shot on 35mm lens”, “bokeh background”, “cinematic lighting”, “soft shadows”, “natural daylight”.
-    - Only describe things a real camera could capture.
-    - NEVER mention AI, generative tools, or digital art styles.
-    """
+    """ + PHOTOGRAPHY_RULES
 
     prompt = f"""
     Generate a realistic photography prompt for a social media post.
@@ -538,14 +788,7 @@ async def generate_image_prompt(caption: str, hashtags: list[str], overlay_text:
 
     STRICT COMPANY IMAGE ANALYSIS PROFILE (FOLLOW THESE EXACTLY):
 
-    - Composition and style: {normalize_field(image_analysis.get("composition_and_style"))}
-    - Environment settings: {normalize_field(image_analysis.get("environment_settings"))}
-    - Image types and animation: {normalize_field(image_analysis.get("image_types_and_animation"))}
-    - Keywords for AI image generation: {normalize_field(image_analysis.get("keywords_for_ai_image_generation"))}
-    - Lighting and color tone: {normalize_field(image_analysis.get("lighting_and_color_tone"))}
-    - Subjects and people: {normalize_field(image_analysis.get("subjects_and_people"))}
-    - Technology elements: {normalize_field(image_analysis.get("technology_elements"))}
-    - Theme and atmosphere: {normalize_field(image_analysis.get("theme_and_atmosphere"))}
+{get_image_profile(image_analysis)}
 
 
     REQUIREMENTS:
@@ -556,19 +799,316 @@ async def generate_image_prompt(caption: str, hashtags: list[str], overlay_text:
     Return ONLY valid JSON.
     """
 
-    client = get_openai_client()
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
+    return await _chat_json(
         messages=[
             {"role": "system", "content": system_message},
             {"role": "user", "content": prompt}
         ],
         temperature=0.7,
-        response_format={"type": "json_object"}
+        response_format={"type": "json_object"},
+        name="generate_image_prompt",
+        validate=_expect_fields("image_prompt"),
+        hedge=True
     )
 
-    content = response.choices[0].message.content.strip()
-    return json.loads(content)
+
+#########################################  fused planner generation  #########################################
+
+
+FUSED_POST_FIELDS = POST_FIELDS + ['image_prompt']
+
+FUSED_PLANNER_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "planner_post",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "channel": {"type": "string"},
+                "caption": {"type": "string"},
+                "hashtags": {"type": "array", "items": {"type": "string"}},
+                "overlay_text": {"type": "string"},
+                "image_prompt": {"type": "string"},
+            },
+            "required": FUSED_POST_FIELDS,
+            "additionalProperties": False,
+        },
+    },
+}
+
+FUSED_POST_SCHEMA = FUSED_PLANNER_RESPONSE_FORMAT["json_schema"]["schema"]
+
+# keeps a batch completion well inside the output token limit
+MAX_POSTS_PER_BATCH = 10
+
+_POST_PROMPT_BUILDERS = {
+    "Instagram": _instagram_post_prompt,
+    "LinkedIn": _linkedin_post_prompt,
+    "Facebook": _facebook_post_prompt,
+}
+
+
+def _fused_post_prompt(company_data, theme, theme_description, channel):
+    """
+    Extend the channel prompt so the model also writes the image prompt
+    """
+    if channel not in _POST_PROMPT_BUILDERS:
+        raise ValueError(f"Unsupported channel for fused planner: {channel}")
+
+    system_message, prompt = _POST_PROMPT_BUILDERS[channel](company_data, theme, theme_description)
+
+    system_message += """
+    You are also a professional marketing visual director specializing in hyper-realistic photography.
+    Alongside the post, write an `image_prompt` for the photograph that accompanies it.
+    The company's image analysis profile TAKES PRIORITY over the caption when writing the image prompt.
+    """ + PHOTOGRAPHY_RULES
+
+    prompt += f"""
+            IMAGE PROMPT:
+            Also write an "image_prompt" field: a realistic photography prompt for this post's visual.
+            It must follow this STRICT COMPANY IMAGE ANALYSIS PROFILE exactly:
+
+{get_image_profile(get_image_analysis(company_data))}
+
+            The caption may influence the concept, but the image prompt MUST remain aligned with the brand identity
+            and feel like a natural photograph from the company's existing image library.
+            Write the image prompt in English.
+            """
+
+    return system_message, prompt
+
+
+FUSED_RETURN_INSTRUCTION = """
+            Return the same JSON object as above with the additional "image_prompt" field.
+            """
+
+
+async def generate_fused_post(company_data, theme, theme_description, channel):
+    """
+    Generate caption, hashtags, overlay text and image prompt for one channel
+    from a single structured-output completion
+    """
+    _validate_company_data(company_data)
+    system_message, prompt = _fused_post_prompt(company_data, theme, theme_description, channel)
+    prompt += FUSED_RETURN_INSTRUCTION
+
+    return await _generate_single_post(
+        system_message,
+        prompt,
+        channel,
+        response_format=FUSED_PLANNER_RESPONSE_FORMAT,
+        required_post_fields=FUSED_POST_FIELDS,
+    )
+
+
+POST_BATCH_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "planner_post_batch",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "posts": {"type": "array", "items": FUSED_POST_SCHEMA},
+            },
+            "required": ["posts"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+
+# content angles handed out across a batch, so chunks generated concurrently do not
+# converge on the same ideas; wraps around for batches longer than the list
+POST_ANGLES = [
+    "product or service spotlight",
+    "customer problem and how the brand solves it",
+    "practical tip or how-to",
+    "behind the scenes",
+    "customer story or testimonial",
+    "myth versus fact",
+    "surprising statistic or industry insight",
+    "question to the audience",
+    "seasonal or timely moment",
+    "team or people behind the brand",
+    "before and after",
+    "common mistake to avoid",
+    "brand values or mission",
+    "comparison of options",
+    "checklist or quick list",
+    "local community or place",
+    "frequently asked question",
+    "sustainability or long-term benefit",
+    "limited offer or call to visit",
+    "milestone or brand history",
+]
+# completions used to replace posts that repeat a hook or overlay text from elsewhere in the batch
+POST_BATCH_REPAIR_ATTEMPTS = 2
+
+
+def _fingerprint(text: str) -> str:
+    return re.sub(r"[^a-z0-9]+", " ", str(text or "").lower()).strip()
+
+
+def _hook(post) -> str:
+    """First sentence (or line) of a post's caption"""
+    caption = str(post.get("caption") or "").strip()
+    return re.split(r"(?<=[.!?])\s|\n", caption, maxsplit=1)[0] if caption else ""
+
+
+def _post_keys(post) -> set:
+    """Normalized hook and overlay text of a post"""
+    return {key for key in (_fingerprint(_hook(post)), _fingerprint(post.get("overlay_text"))) if key}
+
+
+def _duplicate_indexes(posts) -> list:
+    """Indexes of posts whose hook or overlay text already appeared earlier in the batch"""
+    seen, duplicates = set(), []
+    for index, post in enumerate(posts):
+        keys = _post_keys(post)
+        if keys & seen:
+            duplicates.append(index)
+        else:
+            seen |= keys
+    return duplicates
+
+
+async def _generate_post_chunk(company_data, theme, theme_description, channel, count, positions=None, total=None, avoid=()):
+    """
+    Generate `count` distinct fused posts for one channel in a single completion. They fill
+    `positions` (0-based) of a `total` post batch, each on that position's angle from
+    POST_ANGLES, and never reuse the hooks or overlay texts in `avoid`
+    """
+    positions = list(positions) if positions is not None else list(range(count))
+    total = total or count
+    system_message, prompt = _fused_post_prompt(company_data, theme, theme_description, channel)
+    angles = "\n".join(
+        f"            {number}. {POST_ANGLES[position % len(POST_ANGLES)]}"
+        for number, position in enumerate(positions, start=1)
+    )
+
+    prompt += f"""
+            BATCH:
+            Generate exactly {count} DISTINCT posts for this theme. They are posts {", ".join(str(position + 1) for position in positions)}
+            of {total}; the others are written separately, so build the k-th post you return on the k-th angle here:
+{angles}
+            Every post must use a different hook, angle and call-to-action, different overlay text and a
+            different visual concept in its image prompt.
+            Return a JSON object of the form {{"posts": [ ... ]}} where each element is the JSON object
+            described above with the additional "image_prompt" field.
+            """
+    if avoid:
+        used = "\n".join(f"            - {text}" for text in avoid)
+        prompt += f"""
+            Other posts in this batch already use these hooks and overlay texts. Do NOT reuse or paraphrase them:
+{used}
+            """
+
+    def validate(data):
+        posts = data.get("posts") if isinstance(data, dict) else None
+        if not isinstance(posts, list):
+            raise ValueError("Batch response 'posts' should be an array")
+        if len(posts) < count:
+            raise ValueError(f"Expected {count} {channel} posts, but got {len(posts)}")
+        for post in posts[:count]:
+            _validate_post(post, channel, FUSED_POST_FIELDS)
+
+    data = await _chat_json(
+        messages=[
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.9,
+        response_format=POST_BATCH_RESPONSE_FORMAT,
+        name=f"generate_{channel.lower()}_post_batch",
+        channel=channel,
+        validate=validate
+    )
+    return data["posts"][:count]
+
+
+async def generate_post_batch(company_data, theme, theme_description, channel, count):
+    """
+    Generate `count` distinct posts (caption, hashtags, overlay text, image prompt) for one
+    channel and theme. Large batches are split into MAX_POSTS_PER_BATCH sized completions.
+    """
+    _validate_company_data(company_data)
+    if count <= 0:
+        return []
+
+    starts = range(0, count, MAX_POSTS_PER_BATCH)
+    try:
+        # chunks run concurrently, each on its own slice of the batch and its own angles
+        chunks = await asyncio.gather(*(
+            _generate_post_chunk(
+                company_data, theme, theme_description, channel,
+                min(MAX_POSTS_PER_BATCH, count - start),
+                positions=range(start, min(count, start + MAX_POSTS_PER_BATCH)), total=count,
+            )
+            for start in starts
+        ))
+        posts = [post for chunk in chunks for post in chunk]
+
+        # chunks cannot see each other, so replace repeats with posts told what is already taken
+        for _ in range(POST_BATCH_REPAIR_ATTEMPTS):
+            duplicates = _duplicate_indexes(posts)[:MAX_POSTS_PER_BATCH]
+            if not duplicates:
+                break
+            kept = [post for index, post in enumerate(posts) if index not in duplicates]
+            avoid = [text for post in kept for text in (_hook(post), str(post.get("overlay_text") or "")) if text.strip()]
+            replacements = await _generate_post_chunk(
+                company_data, theme, theme_description, channel, len(duplicates),
+                positions=duplicates, total=count, avoid=avoid,
+            )
+            for index, replacement in zip(duplicates, replacements):
+                posts[index] = replacement
+    except Exception as e:
+        raise ValueError(f"Error generating {channel} post batch: {str(e)}")
+
+    remaining = _duplicate_indexes(posts)
+    if remaining:
+        logger.warning(f"{channel} post batch still repeats hooks in {len(remaining)} of {count} posts")
+    return posts
+
+
+#########################################  streaming generation  #########################################
+
+
+async def stream_regenerate_caption(caption: str, hashtags: list[str], overlay_text: str):
+    """
+    Stream a regenerated caption: yields ("delta", text) events followed by ("result", {"caption": ...})
+    """
+    async for event in _stream_json_field(
+        _regenerate_caption_messages(caption, hashtags, overlay_text),
+        temperature=0.7,
+        response_format={"type": "json_object"},
+        name="regenerate_caption",
+        field="caption",
+        validate=_expect_fields("caption"),
+    ):
+        yield event
+
+
+async def stream_fused_post(company_data, theme, theme_description, channel):
+    """
+    Stream a fused planner post: yields caption ("delta", text) events followed by
+    ("result", post) with channel, caption, hashtags, overlay_text and image_prompt
+    """
+    _validate_company_data(company_data)
+    system_message, prompt = _fused_post_prompt(company_data, theme, theme_description, channel)
+    prompt += FUSED_RETURN_INSTRUCTION
+
+    async for event in _stream_json_field(
+        [{"role": "system", "content": system_message}, {"role": "user", "content": prompt}],
+        temperature=0.7,
+        response_format=FUSED_PLANNER_RESPONSE_FORMAT,
+        name=f"generate_{channel.lower()}_post",
+        field="caption",
+        channel=channel,
+        validate=lambda post: _validate_post(post, channel, FUSED_POST_FIELDS),
+    ):
+        yield event
 
 
 # import asyncio
@@ -0,0 +1,166 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Optional
+
+from cachetools import TTLCache
+from dotenv import load_dotenv
+
+from config.firebase_config import get_firestore_client
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+IMAGE_CACHE_ENABLED = os.getenv("IMAGE_CACHE_ENABLED", "true").lower() == "true"
+IMAGE_CACHE_TTL_SECONDS = int(os.getenv("IMAGE_CACHE_TTL_SECONDS", "86400"))
+IMAGE_CACHE_MAX_ENTRIES = int(os.getenv("IMAGE_CACHE_MAX_ENTRIES", "2048"))
+# share the index across workers through Firestore; local-only when disabled
+IMAGE_CACHE_FIRESTORE = os.getenv("IMAGE_CACHE_FIRESTORE", "true").lower() == "true"
+IMAGE_CACHE_COLLECTION = "image_cache"
+# local hits older than this are confirmed against the shared document, so entries removed
+# on another worker (e.g. by a company delete job) stop being served here within this window.
+# Without the shared backend each worker's index is only cleared by its own deletes.
+IMAGE_CACHE_LOCAL_VERIFY_SECONDS = int(os.getenv("IMAGE_CACHE_LOCAL_VERIFY_SECONDS", "60"))
+
+# key -> (entry, time it was last read from or written to the shared backend)
+_local_index = TTLCache(maxsize=IMAGE_CACHE_MAX_ENTRIES, ttl=IMAGE_CACHE_TTL_SECONDS)
+_in_flight: dict[str, asyncio.Task] = {}
+_stats = {"hits": 0, "local_hits": 0, "shared_hits": 0, "misses": 0, "collapsed": 0, "stores": 0, "shared_errors": 0, "revoked": 0}
+
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(str(prompt).lower().split())
+
+
+def make_image_cache_key(company_id: str, channel: str, image_prompt: str, aspect_ratio: str, overlay_text: str = "",
+                         overlay_style: str = "") -> str:
+    """
+    Content-addressed key for a rendered image (and its composited overlay text, if any,
+    drawn in the style `overlay_style` identifies)
+    """
+    parts = [company_id, channel.lower(), normalize_prompt(image_prompt), aspect_ratio]
+    if overlay_text:
+        parts.append(" ".join(overlay_text.split()))
+        if overlay_style:
+            parts.append(overlay_style)
+    payload = json.dumps(parts, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _read_shared(key: str) -> Optional[dict]:
+    doc = get_firestore_client().collection(IMAGE_CACHE_COLLECTION).document(key).get()
+    if not doc.exists:
+        return None
+    entry = doc.to_dict()
+    expires_at = entry.get("expires_at")
+    if expires_at is None or expires_at <= datetime.now(timezone.utc):
+        return None
+    return entry
+
+
+def _write_shared(key: str, entry: dict):
+    now = datetime.now(timezone.utc)
+    get_firestore_client().collection(IMAGE_CACHE_COLLECTION).document(key).set({
+        **entry,
+        "created_at": now,
+        "expires_at": now + timedelta(seconds=IMAGE_CACHE_TTL_SECONDS),
+    })
+
+
+async def lookup(key: str) -> Optional[dict]:
+    local = _local_index.get(key)
+    if local is not None:
+        entry, verified_at = local
+        if not IMAGE_CACHE_FIRESTORE or time.monotonic() - verified_at < IMAGE_CACHE_LOCAL_VERIFY_SECONDS:
+            _stats["hits"] += 1
+            _stats["local_hits"] += 1
+            return entry
+
+    if IMAGE_CACHE_FIRESTORE:
+        try:
+            entry = await asyncio.to_thread(_read_shared, key)
+        except Exception as e:
+            _stats["shared_errors"] += 1
+            logger.warning(f"Image cache read failed: {str(e)}")
+            # keep serving what this worker knows while the shared backend is unavailable
+            entry = local[0] if local is not None else None
+        if entry is not None:
+            _local_index[key] = (entry, time.monotonic())
+            _stats["hits"] += 1
+            _stats["shared_hits"] += 1
+            return entry
+        if local is not None:
+            # deleted or expired in the shared index since this worker cached it
+            _local_index.pop(key, None)
+            _stats["revoked"] += 1
+
+    _stats["misses"] += 1
+    return None
+
+
+async def store(key: str, entry: dict):
+    _local_index[key] = (entry, time.monotonic())
+    _stats["stores"] += 1
+    if IMAGE_CACHE_FIRESTORE:
+        try:
+            await asyncio.to_thread(_write_shared, key, entry)
+        except Exception as e:
+            _stats["shared_errors"] += 1
+            logger.warning(f"Image cache write failed: {str(e)}")
+
+
+async def get_or_create(key: str, create: Callable[[], Awaitable[dict]]) -> dict:
+    """
+    Return the cached entry for `key`, or run `create` and cache its result.
+    Concurrent callers with the same key share one in-flight `create`.
+    """
+    entry = await lookup(key)
+    if entry is not None:
+        return entry
+
+    task = _in_flight.get(key)
+    if task is not None:
+        _stats["collapsed"] += 1
+    else:
+        async def create_and_store():
+            try:
+                created = await create()
+                await store(key, created)
+                return created
+            finally:
+                _in_flight.pop(key, None)
+
+        task = asyncio.create_task(create_and_store())
+        _in_flight[key] = task
+
+    # shield so one disconnecting client does not cancel the render for the others
+    return await asyncio.shield(task)
+
+
+def forget_company(company_id: str) -> int:
+    """
+    Drop a company's entries from this worker's index (its images are being deleted).
+    Other workers stop serving them once their local hits are next verified.
+    """
+    keys = [key for key, (entry, _) in list(_local_index.items()) if entry.get("company_id") == company_id]
+    for key in keys:
+        _local_index.pop(key, None)
+    return len(keys)
+
+
+def get_image_cache_stats() -> dict:
+    lookups = _stats["hits"] + _stats["misses"]
+    return {
+        **_stats,
+        "hit_ratio": round(_stats["hits"] / lookups, 4) if lookups else 0.0,
+        "local_entries": len(_local_index),
+        "in_flight": len(_in_flight),
+        "enabled": IMAGE_CACHE_ENABLED,
+        "shared_backend": IMAGE_CACHE_FIRESTORE,
+    }
@@ -0,0 +1,240 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from services.image_providers import ImageRateLimitError
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+# starting limit; the controller moves between the min and max from there
+GEMINI_MAX_CONCURRENT_IMAGES = int(os.getenv("GEMINI_MAX_CONCURRENT_IMAGES", "4"))
+IMAGE_CONCURRENCY_MIN = int(os.getenv("IMAGE_CONCURRENCY_MIN", "1"))
+IMAGE_CONCURRENCY_MAX = int(os.getenv("IMAGE_CONCURRENCY_MAX", "32"))
+# multiplicative cut on a 429 or timeout, and the gentler cut when latency degrades
+IMAGE_CONCURRENCY_BACKOFF = float(os.getenv("IMAGE_CONCURRENCY_BACKOFF", "0.5"))
+IMAGE_LATENCY_BACKOFF = float(os.getenv("IMAGE_LATENCY_BACKOFF", "0.9"))
+# recent latency above baseline * tolerance counts as congestion
+IMAGE_LATENCY_TOLERANCE = float(os.getenv("IMAGE_LATENCY_TOLERANCE", "2.0"))
+IMAGE_QUEUE_TIMEOUT_SECONDS = float(os.getenv("IMAGE_QUEUE_TIMEOUT_SECONDS", "120"))
+# the healthy baseline is the fastest per-image latency seen in this window
+IMAGE_LATENCY_WINDOW_SECONDS = float(os.getenv("IMAGE_LATENCY_WINDOW_SECONDS", "600"))
+
+# successes needed before latency is compared against the baseline
+MIN_LATENCY_SAMPLES = 10
+RECENT_ALPHA = 0.3
+
+
+class ImageQueueTimeoutError(TimeoutError):
+    """Raised when an image request waited past its deadline for a concurrency slot"""
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD concurrency limit for a rate-limited backend.
+
+    The limit grows by 1/limit per success while callers are actually held back by it
+    (about +1 per round trip) and is multiplied by IMAGE_CONCURRENCY_BACKOFF on a 429 or
+    timeout, or by IMAGE_LATENCY_BACKOFF when recent latency rises well above the healthy
+    baseline. One congestion episode cuts at most once: only requests started after the
+    last cut can trigger another. Callers queue in FIFO order until a slot frees up or
+    their deadline passes.
+    """
+
+    def __init__(self, initial: int, min_limit: int, max_limit: int, backoff: float,
+                 latency_backoff: float, latency_tolerance: float, queue_timeout: float,
+                 latency_window: float = IMAGE_LATENCY_WINDOW_SECONDS):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.backoff = backoff
+        self.latency_backoff = latency_backoff
+        self.latency_tolerance = latency_tolerance
+        self.queue_timeout = queue_timeout
+        self.latency_window = latency_window
+        self._limit = float(min(self.max_limit, max(self.min_limit, initial)))
+
+        self._in_flight = 0
+        self._waiters = deque()
+        self._last_cut = 0.0
+        # (time, latency) pairs with increasing latency; the head is the window minimum
+        self._window_min = deque()
+        self._recent: Optional[float] = None
+        self._samples = 0
+
+        self._admitted = 0
+        self._queue_timeouts = 0
+        self._successes = 0
+        self._rate_limited = 0
+        self._timeouts = 0
+        self._errors = 0
+        self._increases = 0
+        self._decreases = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def _baseline(self) -> Optional[float]:
+        return self._window_min[0][1] if self._window_min else None
+
+    def _record_latency(self, latency: float):
+        now = time.monotonic()
+        while self._window_min and self._window_min[-1][1] >= latency:
+            self._window_min.pop()
+        self._window_min.append((now, latency))
+        while self._window_min[0][0] < now - self.latency_window:
+            self._window_min.popleft()
+
+    def _wake(self):
+        while self._waiters and self._in_flight < self.limit:
+            future = self._waiters.popleft()
+            if future.done():
+                continue
+            self._in_flight += 1
+            future.set_result(None)
+
+    def _release(self):
+        self._in_flight -= 1
+        self._wake()
+
+    async def _acquire(self, timeout: float):
+        if not self._waiters and self._in_flight < self.limit:
+            self._in_flight += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            async with asyncio.timeout(timeout):
+                await future
+        except (TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # the slot was granted just before the deadline or cancellation
+                self._release()
+            else:
+                future.cancel()
+            if isinstance(e, TimeoutError):
+                self._queue_timeouts += 1
+                raise ImageQueueTimeoutError(
+                    f"No image generation slot within {timeout:g}s "
+                    f"(limit {self.limit}, {sum(1 for waiter in self._waiters if not waiter.done())} queued)"
+                ) from None
+            raise
+
+    def _decrease(self, started: float, factor: float, reason: str):
+        if started < self._last_cut:
+            # already cut for this episode by a request that started after ours
+            return
+        previous = self.limit
+        self._limit = max(float(self.min_limit), self._limit * factor)
+        self._last_cut = time.monotonic()
+        self._decreases += 1
+        # latency measured at the old level is no longer representative
+        self._recent = self._baseline
+        logger.warning(f"Image concurrency limit {previous} -> {self.limit} ({reason})")
+
+    def _on_success(self, started: float, latency: float, saturated: bool):
+        self._successes += 1
+        self._samples += 1
+        self._recent = latency if self._recent is None else RECENT_ALPHA * latency + (1 - RECENT_ALPHA) * self._recent
+        self._record_latency(latency)
+
+        if self._samples >= MIN_LATENCY_SAMPLES and self._recent > self._baseline * self.latency_tolerance:
+            self._decrease(started, self.latency_backoff, f"latency {self._recent:.1f}s vs baseline {self._baseline:.1f}s")
+            return
+
+        # only grow while the limit is what holds callers back
+        if saturated and self._limit < self.max_limit:
+            previous = self.limit
+            self._limit = min(float(self.max_limit), self._limit + 1 / self._limit)
+            if self.limit > previous:
+                self._increases += 1
+                self._wake()
+
+    @asynccontextmanager
+    async def slot(self, units: int = 1, timeout: Optional[float] = None):
+        """
+        Hold one concurrency slot for a request to the backend. `units` is the number of
+        images the request renders, so latency is compared per image. Exceptions raised in
+        the block are the congestion signal: ImageRateLimitError and TimeoutError cut the
+        limit, other errors leave it unchanged.
+        """
+        queued = time.monotonic()
+        await self._acquire(self.queue_timeout if timeout is None else timeout)
+
+        started = time.monotonic()
+        wait = started - queued
+        self._admitted += 1
+        self._total_wait += wait
+        self._max_wait = max(self._max_wait, wait)
+        saturated = self._in_flight >= self.limit or bool(self._waiters)
+        try:
+            yield
+        except ImageRateLimitError:
+            self._rate_limited += 1
+            self._decrease(started, self.backoff, "rate limited")
+            raise
+        except TimeoutError:
+            self._timeouts += 1
+            self._decrease(started, self.backoff, "timeout")
+            raise
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self._errors += 1
+            raise
+        else:
+            self._on_success(started, (time.monotonic() - started) / max(1, units), saturated)
+        finally:
+            self._release()
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "limit_exact": round(self._limit, 3),
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "in_flight": self._in_flight,
+            "queue_depth": sum(1 for future in self._waiters if not future.done()),
+            "admitted": self._admitted,
+            "queue_timeouts": self._queue_timeouts,
+            "successes": self._successes,
+            "rate_limited": self._rate_limited,
+            "timeouts": self._timeouts,
+            "errors": self._errors,
+            "increases": self._increases,
+            "decreases": self._decreases,
+            "baseline_latency_ms": int(self._baseline * 1000) if self._baseline is not None else None,
+            "recent_latency_ms": int(self._recent * 1000) if self._recent is not None else None,
+            "avg_wait_ms": int(self._total_wait / self._admitted * 1000) if self._admitted else 0,
+            "max_wait_ms": int(self._max_wait * 1000),
+        }
+
+
+_image_limiter = None
+
+def get_image_limiter() -> AdaptiveConcurrencyLimiter:
+    """Get singleton concurrency limiter shared by every image generation in the process"""
+    global _image_limiter
+    if _image_limiter is None:
+        _image_limiter = AdaptiveConcurrencyLimiter(
+            initial=GEMINI_MAX_CONCURRENT_IMAGES,
+            min_limit=IMAGE_CONCURRENCY_MIN,
+            max_limit=IMAGE_CONCURRENCY_MAX,
+            backoff=IMAGE_CONCURRENCY_BACKOFF,
+            latency_backoff=IMAGE_LATENCY_BACKOFF,
+            latency_tolerance=IMAGE_LATENCY_TOLERANCE,
+            queue_timeout=IMAGE_QUEUE_TIMEOUT_SECONDS,
+        )
+    return _image_limiter
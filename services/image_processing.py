@@ -0,0 +1,139 @@
+import os
+import asyncio
+import logging
+import multiprocessing
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional, Tuple, Union
+
+from PIL import Image, ImageOps
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+IMAGE_POSTPROCESS_ENABLED = os.getenv("IMAGE_POSTPROCESS_ENABLED", "true").lower() == "true"
+# webp, jpeg or png
+IMAGE_OUTPUT_FORMAT = os.getenv("IMAGE_OUTPUT_FORMAT", "webp").lower()
+IMAGE_OUTPUT_QUALITY = int(os.getenv("IMAGE_OUTPUT_QUALITY", "85"))
+IMAGE_PROCESS_WORKERS = int(os.getenv("IMAGE_PROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))
+# jobs allowed to be queued or running on the pool; further callers wait
+IMAGE_PROCESS_MAX_PENDING = IMAGE_PROCESS_WORKERS * 2
+
+# responsive variants derived from every processed image, as name:max_width pairs
+IMAGE_VARIANTS = {
+    name.strip(): int(width)
+    for name, width in (
+        item.split(":") for item in os.getenv("IMAGE_VARIANTS", "thumbnail:320,preview:720").split(",") if ":" in item
+    )
+}
+
+# canonical upload size per channel, matching ASPECT_RATIOS in gemini_service
+CHANNEL_IMAGE_SIZES = {
+    'instagram': (1080, 1080),
+    'facebook': (1200, 628),
+    'linkedin': (1200, 628),
+}
+
+OUTPUT_FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "jpg": ("JPEG", "image/jpeg"),
+    "png": ("PNG", "image/png"),
+}
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pending = asyncio.Semaphore(IMAGE_PROCESS_MAX_PENDING)
+
+
+def _encode(image: Image.Image, pil_format: str, quality: int) -> bytes:
+    if pil_format == "JPEG" and image.mode != "RGB":
+        image = image.convert("RGB")
+    elif image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+
+    options = {"optimize": True}
+    if pil_format == "WEBP":
+        options = {"quality": quality, "method": 4}
+    elif pil_format == "JPEG":
+        options = {"quality": quality, "optimize": True, "progressive": True}
+
+    output = BytesIO()
+    image.save(output, format=pil_format, **options)
+    return output.getvalue()
+
+
+def fit_and_encode(image_bytes: bytes, size: Tuple[int, int], variants: Dict[str, int], pil_format: str, quality: int) -> Tuple[bytes, Dict[str, bytes]]:
+    """
+    Center-crop and resize an image to exactly `size` and encode it, plus one downscaled
+    copy per variant width (runs in a pool worker, decoding the source only once)
+    """
+    with Image.open(BytesIO(image_bytes)) as image:
+        image = ImageOps.exif_transpose(image)
+        fitted = ImageOps.fit(image, size, method=Image.Resampling.LANCZOS)
+
+    encoded_variants = {}
+    for name, width in variants.items():
+        if width >= fitted.width:
+            continue
+        height = max(1, round(fitted.height * width / fitted.width))
+        encoded_variants[name] = _encode(fitted.resize((width, height), Image.Resampling.LANCZOS), pil_format, quality)
+    return _encode(fitted, pil_format, quality), encoded_variants
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn so workers do not inherit the gRPC/HTTP client threads of the API process
+        _pool = ProcessPoolExecutor(
+            max_workers=IMAGE_PROCESS_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def shutdown_image_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def run_in_image_pool(fn, *args):
+    """
+    Run a CPU-bound image function on the shared process pool without blocking the event loop
+    """
+    async with _pending:
+        try:
+            return await asyncio.get_running_loop().run_in_executor(_get_pool(), fn, *args)
+        except BrokenProcessPool:
+            # a worker died (e.g. OOM-killed); start a fresh pool for the next job
+            shutdown_image_pool()
+            raise
+
+
+async def postprocess_image(image_bytes: Union[bytes, memoryview], mime_type: str, channel: str) -> Tuple[Union[bytes, memoryview], str, Dict[str, bytes]]:
+    """
+    Crop/resize a generated image to the channel's canonical size and transcode it to
+    IMAGE_OUTPUT_FORMAT, deriving the IMAGE_VARIANTS sizes from the result.
+    Falls back to the original image (and no variants) if processing fails.
+    """
+    size = CHANNEL_IMAGE_SIZES.get(channel.lower())
+    if not IMAGE_POSTPROCESS_ENABLED or size is None:
+        return image_bytes, mime_type, {}
+
+    pil_format, output_mime = OUTPUT_FORMATS.get(IMAGE_OUTPUT_FORMAT, OUTPUT_FORMATS["webp"])
+    try:
+        # the pool pickles its arguments, so a memoryview has to become bytes here
+        payload = image_bytes if isinstance(image_bytes, bytes) else bytes(image_bytes)
+        processed, variants = await run_in_image_pool(
+            fit_and_encode, payload, size, IMAGE_VARIANTS, pil_format, IMAGE_OUTPUT_QUALITY
+        )
+    except Exception as e:
+        logger.warning(f"Image post-processing for channel '{channel}' failed, uploading original: {str(e)}")
+        return image_bytes, mime_type, {}
+
+    return processed, output_mime, variants
@@ -0,0 +1,236 @@
+import os
+import base64
+import random
+import asyncio
+import hashlib
+import logging
+from io import BytesIO
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from PIL import Image
+from google import genai
+from google.genai import errors
+from dotenv import load_dotenv
+
+from config.gemini_config import get_gemini_api_key
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+IMAGE_PROVIDER = os.getenv("IMAGE_PROVIDER", "gemini").lower()
+GEMINI_IMAGE_MODEL = os.getenv("GEMINI_IMAGE_MODEL", "gemini-2.5-flash-image-preview")
+# images requested per Gemini call in batch mode; 1 disables multi-image prompts
+GEMINI_IMAGE_BATCH_SIZE = int(os.getenv("GEMINI_IMAGE_BATCH_SIZE", "1"))
+
+FAKE_IMAGE_LATENCY_SECONDS = float(os.getenv("FAKE_IMAGE_LATENCY_SECONDS", "0"))
+# probability of an injected failure, and which kind: error, rate_limit or timeout
+FAKE_IMAGE_FAILURE_RATE = float(os.getenv("FAKE_IMAGE_FAILURE_RATE", "0"))
+FAKE_IMAGE_FAILURE_KIND = os.getenv("FAKE_IMAGE_FAILURE_KIND", "error").lower()
+FAKE_IMAGE_LONG_SIDE = int(os.getenv("FAKE_IMAGE_LONG_SIDE", "1024"))
+FAKE_IMAGE_BATCH_SIZE = int(os.getenv("FAKE_IMAGE_BATCH_SIZE", "4"))
+
+ImageData = Union[bytes, memoryview]
+
+
+class ImageProviderError(Exception):
+    """Raised by image providers when a generation fails"""
+
+
+class ImageRateLimitError(ImageProviderError):
+    """Raised when the provider rejected the request because of quota or rate limits"""
+
+
+class ImageProvider:
+    """
+    Image generation backend used by gemini_service.generate_image.
+
+    Implementations return the encoded image and its mime type, and raise ImageProviderError
+    (or ImageRateLimitError for 429s) on failure. Providers that can render several images
+    in one request set max_batch_size above 1 and override generate_batch.
+    """
+
+    name = "base"
+    max_batch_size = 1
+
+    async def generate(self, prompt: str, aspect_ratio: str) -> Tuple[ImageData, str]:
+        raise NotImplementedError
+
+    async def generate_batch(self, subjects: List[str], aspect_ratio: str, instructions: str) -> List[Tuple[ImageData, str]]:
+        """
+        Render one image per subject, sharing `instructions` across them. May return fewer
+        images than subjects (in order); callers render the missing ones individually.
+        """
+        return [await self.generate(f"{instructions}\nSubject: {subject}.", aspect_ratio) for subject in subjects]
+
+
+def decode_inline_image(data_field) -> ImageData:
+    """
+    Raw image bytes from an inline_data payload without copying bytes-like data
+    """
+    # If SDK returns bytes/bytearray, assume it's raw image bytes and hand it over without copying
+    if isinstance(data_field, bytes):
+        return data_field
+    if isinstance(data_field, (bytearray, memoryview)):
+        return memoryview(data_field)
+    # If it's a string, attempt strict base64 decode
+    if isinstance(data_field, str):
+        try:
+            return base64.b64decode(data_field, validate=True)
+        except Exception:
+            # If not valid base64, treat as UTF-8 bytes (best effort)
+            return data_field.encode("utf-8")
+    # Unknown type; coerce via bytes()
+    return bytes(data_field)
+
+
+class GeminiImageProvider(ImageProvider):
+    name = "gemini"
+
+    def __init__(self, model: str = GEMINI_IMAGE_MODEL, max_batch_size: int = GEMINI_IMAGE_BATCH_SIZE):
+        self.model = model
+        self.max_batch_size = max(1, max_batch_size)
+        self.client = genai.Client(api_key=get_gemini_api_key())
+
+    async def _generate_content(self, prompt: str) -> List[Tuple[ImageData, str]]:
+        try:
+            response = await self.client.aio.models.generate_content(
+                model=self.model,
+                contents=[prompt],
+            )
+        except errors.APIError as e:
+            if e.code == 429:
+                raise ImageRateLimitError(str(e)) from e
+            raise ImageProviderError(str(e)) from e
+
+        # Extract image data; if it's already bytes, use as-is. If it's a string, decode as base64.
+        return [
+            (decode_inline_image(part.inline_data.data), getattr(part.inline_data, "mime_type", None) or "image/png")
+            for part in response.candidates[0].content.parts
+            if part.inline_data is not None
+        ]
+
+    async def generate(self, prompt: str, aspect_ratio: str) -> Tuple[ImageData, str]:
+        images = await self._generate_content(prompt)
+        if not images:
+            raise ImageProviderError("No image data found in the response.")
+        return images[0]
+
+    async def generate_batch(self, subjects: List[str], aspect_ratio: str, instructions: str) -> List[Tuple[ImageData, str]]:
+        if len(subjects) == 1:
+            return [await self.generate(f"{instructions}\nSubject: {subjects[0]}.", aspect_ratio)]
+
+        numbered = "\n".join(f"{index}. {subject}" for index, subject in enumerate(subjects, start=1))
+        prompt = f"""
+        {instructions}
+        Generate {len(subjects)} separate images, one for each subject below, in this order.
+        Return every image as its own image; do not combine subjects into one picture.
+        Subjects:
+        {numbered}
+        """
+        images = await self._generate_content(prompt)
+        if len(images) < len(subjects):
+            logger.warning(f"Gemini returned {len(images)} of {len(subjects)} batch images")
+        return images[:len(subjects)]
+
+
+def _aspect_size(aspect_ratio: str, long_side: int) -> Tuple[int, int]:
+    try:
+        width, height = (float(value) for value in aspect_ratio.split(":"))
+    except ValueError:
+        width, height = 1.0, 1.0
+    if width >= height:
+        return long_side, max(1, round(long_side * height / width))
+    return max(1, round(long_side * width / height)), long_side
+
+
+def render_fake_image(prompt: str, aspect_ratio: str, long_side: int = FAKE_IMAGE_LONG_SIDE) -> bytes:
+    """
+    Deterministic PNG for a prompt: smooth color noise seeded by the prompt hash
+    """
+    seed = int.from_bytes(hashlib.sha256(prompt.encode("utf-8")).digest()[:8], "big")
+    width, height = _aspect_size(aspect_ratio, long_side)
+    grid_w, grid_h = max(2, width // 16), max(2, height // 16)
+    noise = Image.frombytes("RGB", (grid_w, grid_h), random.Random(seed).randbytes(grid_w * grid_h * 3))
+    output = BytesIO()
+    noise.resize((width, height), Image.Resampling.BILINEAR).save(output, format="PNG")
+    return output.getvalue()
+
+
+class FakeImageProvider(ImageProvider):
+    """
+    Offline provider for tests and load tests: renders a deterministic PNG in the requested
+    aspect ratio after a configurable latency, failing at a configurable rate
+    """
+
+    name = "fake"
+
+    def __init__(
+        self,
+        latency: float = FAKE_IMAGE_LATENCY_SECONDS,
+        failure_rate: float = FAKE_IMAGE_FAILURE_RATE,
+        failure_kind: str = FAKE_IMAGE_FAILURE_KIND,
+        max_batch_size: int = FAKE_IMAGE_BATCH_SIZE,
+        seed: Optional[int] = None,
+    ):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.failure_kind = failure_kind
+        self.max_batch_size = max(1, max_batch_size)
+        self._random = random.Random(seed)
+        self.calls = 0
+
+    async def _simulate_request(self):
+        self.calls += 1
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+
+        if self.failure_rate > 0 and self._random.random() < self.failure_rate:
+            if self.failure_kind == "rate_limit":
+                raise ImageRateLimitError("Injected rate limit (429) from fake image provider")
+            if self.failure_kind == "timeout":
+                # hang until generate_image's own timeout cancels us
+                await asyncio.sleep(3600)
+            raise ImageProviderError("Injected failure from fake image provider")
+
+    async def generate(self, prompt: str, aspect_ratio: str) -> Tuple[ImageData, str]:
+        await self._simulate_request()
+        return await asyncio.to_thread(render_fake_image, prompt, aspect_ratio), "image/png"
+
+    async def generate_batch(self, subjects: List[str], aspect_ratio: str, instructions: str) -> List[Tuple[ImageData, str]]:
+        await self._simulate_request()
+        return [
+            (await asyncio.to_thread(render_fake_image, f"{instructions}\nSubject: {subject}.", aspect_ratio), "image/png")
+            for subject in subjects
+        ]
+
+
+IMAGE_PROVIDERS: Dict[str, Callable[[], ImageProvider]] = {
+    "gemini": GeminiImageProvider,
+    "fake": FakeImageProvider,
+}
+
+_image_provider: Optional[ImageProvider] = None
+
+
+def register_image_provider(name: str, factory: Callable[[], ImageProvider]):
+    IMAGE_PROVIDERS[name.lower()] = factory
+
+
+def set_image_provider(provider: Optional[ImageProvider]):
+    """Replace the active provider (None recreates the IMAGE_PROVIDER one on next use)"""
+    global _image_provider
+    _image_provider = provider
+
+
+def get_image_provider() -> ImageProvider:
+    """Get singleton image provider selected by IMAGE_PROVIDER"""
+    global _image_provider
+    if _image_provider is None:
+        factory = IMAGE_PROVIDERS.get(IMAGE_PROVIDER)
+        if factory is None:
+            raise ValueError(f"Unknown IMAGE_PROVIDER '{IMAGE_PROVIDER}' (available: {', '.join(IMAGE_PROVIDERS)})")
+        _image_provider = factory()
+        logger.info(f"Using image provider '{_image_provider.name}'")
+    return _image_provider
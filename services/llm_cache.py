@@ -0,0 +1,139 @@
+import os
+import json
+import hashlib
+import logging
+from contextvars import ContextVar
+from typing import Optional
+
+import httpx
+from cachetools import TTLCache
+from fastapi import Request
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", "3600"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024"))
+
+# Only functions listed here are served from the cache. Generators that are expected to
+# return a fresh answer on every call (caption regeneration, scheduled posts) stay out by default.
+LLM_CACHE_FUNCTIONS = {
+    name.strip()
+    for name in os.getenv("LLM_CACHE_FUNCTIONS", "generate_all_themes,generate_image_prompt").split(",")
+    if name.strip()
+}
+
+BYPASS_HEADER = "X-LLM-Cache"
+
+_cache_bypass: ContextVar[bool] = ContextVar("llm_cache_bypass", default=False)
+
+_stats = {"hits": 0, "local_hits": 0, "shared_hits": 0, "misses": 0, "bypassed": 0, "stores": 0, "shared_errors": 0}
+
+
+def make_cache_key(model: str, messages: list, temperature: float, response_format: Optional[dict] = None) -> str:
+    """
+    Content-addressed key for a chat completion request
+    """
+    payload = json.dumps(
+        {"model": model, "messages": messages, "temperature": temperature, "response_format": response_format},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return "llm:" + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def is_enabled_for(function_name: str) -> bool:
+    return LLM_CACHE_ENABLED and function_name in LLM_CACHE_FUNCTIONS
+
+
+class UpstashRedisBackend:
+    """
+    Shared cache backend speaking the Upstash Redis REST protocol
+    (any Redis REST proxy with the same command format works for local testing)
+    """
+
+    def __init__(self, url: str, token: Optional[str] = None, timeout: float = 2.0):
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        self._client = httpx.AsyncClient(base_url=url, headers=headers, timeout=timeout)
+
+    async def _command(self, *args):
+        response = await self._client.post("/", json=[str(arg) for arg in args])
+        response.raise_for_status()
+        return response.json().get("result")
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self._command("GET", key)
+
+    async def set(self, key: str, value: str, ttl: int):
+        await self._command("SET", key, value, "EX", ttl)
+
+
+_local_cache = TTLCache(maxsize=LLM_CACHE_MAX_ENTRIES, ttl=LLM_CACHE_TTL_SECONDS)
+_shared_backend = None
+
+if os.getenv("UPSTASH_REDIS_REST_URL"):
+    _shared_backend = UpstashRedisBackend(os.getenv("UPSTASH_REDIS_REST_URL"), os.getenv("UPSTASH_REDIS_REST_TOKEN"))
+
+
+async def lookup(key: str) -> Optional[str]:
+    if _cache_bypass.get():
+        _stats["bypassed"] += 1
+        return None
+
+    value = _local_cache.get(key)
+    if value is not None:
+        _stats["hits"] += 1
+        _stats["local_hits"] += 1
+        return value
+
+    if _shared_backend is not None:
+        try:
+            value = await _shared_backend.get(key)
+        except Exception as e:
+            _stats["shared_errors"] += 1
+            logger.warning(f"Shared LLM cache read failed: {str(e)}")
+            value = None
+        if value is not None:
+            _local_cache[key] = value
+            _stats["hits"] += 1
+            _stats["shared_hits"] += 1
+            return value
+
+    _stats["misses"] += 1
+    return None
+
+
+async def store(key: str, value: str):
+    _local_cache[key] = value
+    _stats["stores"] += 1
+    if _shared_backend is not None:
+        try:
+            await _shared_backend.set(key, value, LLM_CACHE_TTL_SECONDS)
+        except Exception as e:
+            _stats["shared_errors"] += 1
+            logger.warning(f"Shared LLM cache write failed: {str(e)}")
+
+
+def get_cache_stats() -> dict:
+    lookups = _stats["hits"] + _stats["misses"]
+    return {
+        **_stats,
+        "hit_ratio": round(_stats["hits"] / lookups, 4) if lookups else 0.0,
+        "local_entries": len(_local_cache),
+        "shared_backend": _shared_backend is not None,
+        "enabled_functions": sorted(LLM_CACHE_FUNCTIONS) if LLM_CACHE_ENABLED else [],
+    }
+
+
+async def llm_cache_bypass_header(request: Request):
+    """
+    Route dependency: `X-LLM-Cache: bypass` or `Cache-Control: no-cache` skips cache reads
+    for this request (fresh results are still stored)
+    """
+    bypass = request.headers.get(BYPASS_HEADER, "").lower() == "bypass" or \
+        "no-cache" in request.headers.get("Cache-Control", "").lower()
+    _cache_bypass.set(bypass)
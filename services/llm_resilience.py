@@ -0,0 +1,153 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from collections import deque, defaultdict
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import openai
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+OPENAI_MAX_ATTEMPTS = int(os.getenv("OPENAI_MAX_ATTEMPTS", "4"))
+OPENAI_BACKOFF_BASE_SECONDS = float(os.getenv("OPENAI_BACKOFF_BASE_SECONDS", "0.5"))
+OPENAI_BACKOFF_MAX_SECONDS = float(os.getenv("OPENAI_BACKOFF_MAX_SECONDS", "20"))
+OPENAI_HEDGING_ENABLED = os.getenv("OPENAI_HEDGING_ENABLED", "false").lower() == "true"
+# hedge delay used until enough latency samples exist to derive a p95
+OPENAI_HEDGE_DEFAULT_DELAY_SECONDS = float(os.getenv("OPENAI_HEDGE_DEFAULT_DELAY_SECONDS", "10"))
+OPENAI_HEDGE_MIN_DELAY_SECONDS = 1.0
+
+LATENCY_WINDOW = 200
+MIN_LATENCY_SAMPLES = 20
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+_latencies = defaultdict(lambda: deque(maxlen=LATENCY_WINDOW))
+_stats = {"calls": 0, "retries": 0, "failures": 0, "hedges_fired": 0, "hedge_wins": 0, "reasks": 0}
+
+
+def is_retryable(error: BaseException) -> bool:
+    return isinstance(error, RETRYABLE_ERRORS)
+
+
+def backoff_delay(attempt: int, error: Optional[BaseException] = None) -> float:
+    """
+    Full-jitter exponential backoff, never shorter than a Retry-After sent by the provider
+    """
+    delay = random.uniform(0, min(OPENAI_BACKOFF_MAX_SECONDS, OPENAI_BACKOFF_BASE_SECONDS * (2 ** attempt)))
+    response = getattr(error, "response", None)
+    if response is not None:
+        try:
+            delay = max(delay, float(response.headers.get("retry-after")))
+        except (TypeError, ValueError):
+            pass
+    return delay
+
+
+def record_latency(name: str, seconds: float):
+    _latencies[name].append(seconds)
+
+
+def p95_latency(name: str) -> Optional[float]:
+    samples = _latencies[name]
+    if len(samples) < MIN_LATENCY_SAMPLES:
+        return None
+    ordered = sorted(samples)
+    return ordered[int(0.95 * (len(ordered) - 1))]
+
+
+def hedge_delay(name: str) -> float:
+    p95 = p95_latency(name)
+    if p95 is None:
+        return OPENAI_HEDGE_DEFAULT_DELAY_SECONDS
+    return max(OPENAI_HEDGE_MIN_DELAY_SECONDS, p95)
+
+
+def record_reask():
+    _stats["reasks"] += 1
+
+
+async def _timed(name: str, call: Callable[[], Awaitable[T]]) -> T:
+    started = time.monotonic()
+    result = await call()
+    record_latency(name, time.monotonic() - started)
+    return result
+
+
+async def _hedged(name: str, call: Callable[[], Awaitable[T]]) -> T:
+    """
+    Start the call, and if it has not finished after the p95 delay start a second identical
+    call. The first successful result wins and the other request is cancelled.
+    """
+    primary = asyncio.create_task(_timed(name, call))
+    pending = {primary}
+    error = None
+    # whatever is still running when we leave, including on cancellation of the caller, is cancelled
+    try:
+        done, pending = await asyncio.wait(pending, timeout=hedge_delay(name))
+        if done:
+            return primary.result()
+
+        _stats["hedges_fired"] += 1
+        backup = asyncio.create_task(_timed(name, call))
+        pending = {primary, backup}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is backup:
+                        _stats["hedge_wins"] += 1
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def call_with_retries(name: str, call: Callable[[], Awaitable[T]], hedge: bool = False) -> T:
+    """
+    Run `call` with jittered exponential backoff on retryable OpenAI errors and,
+    when hedging is enabled, a backup request for slow attempts
+    """
+    _stats["calls"] += 1
+    for attempt in range(OPENAI_MAX_ATTEMPTS):
+        try:
+            if hedge and OPENAI_HEDGING_ENABLED:
+                return await _hedged(name, call)
+            return await _timed(name, call)
+        except Exception as e:
+            if not is_retryable(e) or attempt == OPENAI_MAX_ATTEMPTS - 1:
+                _stats["failures"] += 1
+                raise
+            delay = backoff_delay(attempt, e)
+            _stats["retries"] += 1
+            logger.warning(
+                f"{name}: attempt {attempt + 1}/{OPENAI_MAX_ATTEMPTS} failed with {type(e).__name__}, "
+                f"retrying in {delay:.2f}s"
+            )
+            await asyncio.sleep(delay)
+
+
+def get_resilience_stats() -> dict:
+    return {
+        **_stats,
+        "hedging_enabled": OPENAI_HEDGING_ENABLED,
+        "p95_latency_ms": {
+            name: int(p95 * 1000)
+            for name in list(_latencies)
+            if (p95 := p95_latency(name)) is not None
+        },
+    }
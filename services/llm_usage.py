@@ -0,0 +1,146 @@
+import os
+import asyncio
+import logging
+from collections import defaultdict
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+
+from fastapi import Request
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+LLM_USAGE_FIRESTORE_ROLLUP = os.getenv("LLM_USAGE_FIRESTORE_ROLLUP", "false").lower() == "true"
+
+# USD per 1M tokens: (input, cached input, output)
+MODEL_PRICING = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+}
+
+_usage_tags: ContextVar[dict] = ContextVar("llm_usage_tags", default={})
+
+_aggregates = {
+    "by_route": defaultdict(lambda: defaultdict(float)),
+    "by_company": defaultdict(lambda: defaultdict(float)),
+    "by_channel": defaultdict(lambda: defaultdict(float)),
+    "by_function": defaultdict(lambda: defaultdict(float)),
+}
+_totals = defaultdict(float)
+_pending_writes = set()
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+    input_price, cached_price, output_price = MODEL_PRICING.get(model, MODEL_PRICING["gpt-4o-mini"])
+    uncached = max(0, prompt_tokens - cached_tokens)
+    return (uncached * input_price + cached_tokens * cached_price + completion_tokens * output_price) / 1_000_000
+
+
+def _add(bucket, record: dict):
+    bucket["requests"] += 1
+    for field in ("prompt_tokens", "completion_tokens", "cached_tokens", "cost_usd", "latency_ms"):
+        bucket[field] += record[field]
+
+
+def record_usage(model: str, usage, latency_seconds: float, function_name: str, channel: Optional[str] = None):
+    """
+    Record one completion's usage, tagged with the route and company of the current request
+    """
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = getattr(details, "cached_tokens", 0) or 0
+
+    tags = _usage_tags.get()
+    record = {
+        "model": model,
+        "route": tags.get("route", "unknown"),
+        "company_id": tags.get("company_id", "unknown"),
+        "channel": (channel or tags.get("channel") or "none").lower(),
+        "function": function_name,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cached_tokens": cached_tokens,
+        "cost_usd": estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens),
+        "latency_ms": latency_seconds * 1000,
+    }
+
+    _add(_totals, record)
+    _add(_aggregates["by_route"][record["route"]], record)
+    _add(_aggregates["by_company"][record["company_id"]], record)
+    _add(_aggregates["by_channel"][record["channel"]], record)
+    _add(_aggregates["by_function"][record["function"]], record)
+
+    logger.debug(f"llm_usage: {record}")
+
+    if LLM_USAGE_FIRESTORE_ROLLUP and record["company_id"] != "unknown":
+        task = asyncio.create_task(asyncio.to_thread(_persist_daily_rollup, record))
+        _pending_writes.add(task)
+        task.add_done_callback(_pending_writes.discard)
+
+
+def _persist_daily_rollup(record: dict):
+    """
+    Increment llm_usage/{company_id}/daily/{YYYY-MM-DD} in Firestore
+    """
+    try:
+        from google.cloud import firestore
+        from config.firebase_config import get_firestore_client
+
+        day = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        doc_ref = get_firestore_client().collection("llm_usage").document(record["company_id"]) \
+            .collection("daily").document(day)
+        doc_ref.set({
+            "date": day,
+            "requests": firestore.Increment(1),
+            "prompt_tokens": firestore.Increment(record["prompt_tokens"]),
+            "completion_tokens": firestore.Increment(record["completion_tokens"]),
+            "cached_tokens": firestore.Increment(record["cached_tokens"]),
+            "cost_usd": firestore.Increment(record["cost_usd"]),
+            f"by_channel.{record['channel']}.requests": firestore.Increment(1),
+            f"by_channel.{record['channel']}.cost_usd": firestore.Increment(record["cost_usd"]),
+            "updated_at": firestore.SERVER_TIMESTAMP,
+        }, merge=True)
+    except Exception as e:
+        logger.warning(f"Failed to persist LLM usage rollup for {record['company_id']}: {str(e)}")
+
+
+def _summarize(bucket) -> dict:
+    requests = int(bucket["requests"])
+    return {
+        "requests": requests,
+        "prompt_tokens": int(bucket["prompt_tokens"]),
+        "completion_tokens": int(bucket["completion_tokens"]),
+        "cached_tokens": int(bucket["cached_tokens"]),
+        "cost_usd": round(bucket["cost_usd"], 6),
+        "avg_latency_ms": int(bucket["latency_ms"] / requests) if requests else 0,
+    }
+
+
+def get_usage_stats(company_id: Optional[str] = None) -> dict:
+    if company_id is not None:
+        return {"company_id": company_id, **_summarize(_aggregates["by_company"].get(company_id, defaultdict(float)))}
+    return {
+        "totals": _summarize(_totals),
+        **{
+            group: {key: _summarize(bucket) for key, bucket in buckets.items()}
+            for group, buckets in _aggregates.items()
+        },
+    }
+
+
+async def llm_usage_context(request: Request):
+    """
+    Route dependency: tag LLM usage recorded during this request with its route and company
+    """
+    route = request.scope.get("route")
+    path_params = request.path_params
+    _usage_tags.set({
+        "route": f"{request.method} {getattr(route, 'path_format', request.url.path)}",
+        "company_id": path_params.get("company_id", "unknown"),
+        "channel": path_params.get("channel"),
+    })
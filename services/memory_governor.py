@@ -0,0 +1,173 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+MB = 1024 * 1024
+
+# total bytes of image data allowed in flight across generation, post-processing and upload
+IMAGE_MEMORY_BUDGET_MB = int(os.getenv("IMAGE_MEMORY_BUDGET_MB", "256"))
+# reserved for an image before its real size is known (Gemini PNG + processed copy + variants)
+IMAGE_MEMORY_ESTIMATE_MB = int(os.getenv("IMAGE_MEMORY_ESTIMATE_MB", "12"))
+
+
+class Reservation:
+    def __init__(self, governor: "MemoryGovernor", nbytes: int):
+        self._governor = governor
+        self.nbytes = nbytes
+
+    def resize(self, nbytes: int):
+        """
+        Replace the reservation with the real size of the data now held. Growing never waits
+        (the data already exists); it only makes new work wait longer for the budget.
+        """
+        nbytes = min(max(0, nbytes), self._governor.budget)
+        self._governor._adjust(nbytes - self.nbytes)
+        self.nbytes = nbytes
+
+    def release(self):
+        self.resize(0)
+
+
+class MemoryGovernor:
+    """
+    Process-wide byte budget. Work reserves the bytes it is about to hold and waits, in FIFO
+    order, while the budget is exhausted instead of piling more buffers onto the heap.
+    """
+
+    def __init__(self, budget: int):
+        self.budget = budget
+        self._in_use = 0
+        self._waiters = deque()
+
+        self._peak = 0
+        self._admitted = 0
+        self._waited = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def _fits(self, nbytes: int) -> bool:
+        return self._in_use + nbytes <= self.budget
+
+    def _adjust(self, delta: int):
+        self._in_use += delta
+        self._peak = max(self._peak, self._in_use)
+        if delta < 0:
+            self._wake()
+
+    def _wake(self):
+        while self._waiters:
+            nbytes, future = self._waiters[0]
+            if future.done():
+                self._waiters.popleft()
+                continue
+            if not self._fits(nbytes):
+                break
+            self._waiters.popleft()
+            self._adjust(nbytes)
+            future.set_result(None)
+
+    async def _acquire(self, nbytes: int):
+        if not self._waiters and self._fits(nbytes):
+            self._adjust(nbytes)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((nbytes, future))
+        self._waited += 1
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # budget was granted just before the cancellation
+                self._adjust(-nbytes)
+            else:
+                # a cancelled head-of-line waiter may have been holding back smaller ones
+                self._wake()
+            raise
+
+    async def _admit(self, nbytes: int):
+        started = time.monotonic()
+        await self._acquire(nbytes)
+
+        wait = time.monotonic() - started
+        self._admitted += 1
+        self._total_wait += wait
+        self._max_wait = max(self._max_wait, wait)
+
+    @asynccontextmanager
+    async def reserve(self, nbytes: int):
+        nbytes = min(max(0, nbytes), self.budget)
+        await self._admit(nbytes)
+
+        reservation = Reservation(self, nbytes)
+        try:
+            yield reservation
+        finally:
+            self._adjust(-reservation.nbytes)
+
+    @asynccontextmanager
+    async def reserve_each(self, count: int, nbytes: int):
+        """
+        Reserve `nbytes` for each of `count` items in a single wait (taking them one at a
+        time could deadlock two callers each holding part of what they need) and yield one
+        Reservation per item, so each can be resized, handed over and released on its own.
+        """
+        total = min(max(0, count * nbytes), self.budget)
+        await self._admit(total)
+
+        reservations = [Reservation(self, total // count + (index < total % count)) for index in range(count)] if count else []
+        try:
+            yield reservations
+        finally:
+            self._adjust(-sum(reservation.nbytes for reservation in reservations))
+
+    @asynccontextmanager
+    async def hold(self, nbytes: int, reservation: Optional[Reservation] = None):
+        """
+        Reserve `nbytes`, or take over a reservation handed down by the caller: it is
+        resized to `nbytes` without waiting (its bytes are already counted) and released
+        on exit.
+        """
+        if reservation is None:
+            async with self.reserve(nbytes) as reservation:
+                yield reservation
+            return
+
+        reservation.resize(nbytes)
+        try:
+            yield reservation
+        finally:
+            reservation.release()
+
+    def stats(self) -> dict:
+        return {
+            "budget_bytes": self.budget,
+            "in_use_bytes": self._in_use,
+            "peak_bytes": self._peak,
+            "waiting": sum(1 for _, future in self._waiters if not future.done()),
+            "admitted": self._admitted,
+            "waited": self._waited,
+            "avg_wait_ms": int(self._total_wait / self._admitted * 1000) if self._admitted else 0,
+            "max_wait_ms": int(self._max_wait * 1000),
+        }
+
+
+_image_memory = None
+
+def get_image_memory_governor() -> MemoryGovernor:
+    """Get singleton governor for image buffers in this process"""
+    global _image_memory
+    if _image_memory is None:
+        _image_memory = MemoryGovernor(IMAGE_MEMORY_BUDGET_MB * MB)
+    return _image_memory
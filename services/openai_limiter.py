@@ -0,0 +1,207 @@
+import os
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+OPENAI_RPM_LIMIT = int(os.getenv("OPENAI_RPM_LIMIT", "500"))
+OPENAI_TPM_LIMIT = int(os.getenv("OPENAI_TPM_LIMIT", "200000"))
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "16"))
+OPENAI_QUEUE_TIMEOUT_SECONDS = float(os.getenv("OPENAI_QUEUE_TIMEOUT_SECONDS", "60"))
+
+# completion budget reserved per request on top of the prompt estimate
+DEFAULT_COMPLETION_TOKENS = 1000
+
+
+class AdmissionTimeoutError(Exception):
+    """Raised when a request waited longer than the queue deadline for OpenAI capacity"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def estimate_tokens(messages: list, completion_tokens: int = DEFAULT_COMPLETION_TOKENS) -> int:
+    """
+    Rough token estimate for a chat request (~4 characters per token plus per-message overhead)
+    """
+    prompt_chars = sum(len(str(message.get("content", ""))) for message in messages)
+    return prompt_chars // 4 + 4 * len(messages) + completion_tokens
+
+
+class TokenBucket:
+    """
+    Continuously refilling bucket holding at most one minute of budget
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        self.tokens -= min(amount, self.capacity)
+
+    def refund(self, amount: float):
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class Admission:
+    def __init__(self, controller: "AdmissionController", estimated_tokens: int):
+        self._controller = controller
+        self.estimated_tokens = estimated_tokens
+
+    def record_usage(self, total_tokens: Optional[int]):
+        """Reconcile the token bucket with the real usage reported by OpenAI"""
+        if total_tokens is None:
+            return
+        difference = total_tokens - self.estimated_tokens
+        if difference > 0:
+            self._controller._tokens.consume(difference)
+        elif difference < 0:
+            self._controller._tokens.refund(-difference)
+
+
+class AdmissionController:
+    """
+    Process-wide admission control for OpenAI requests.
+
+    Requests queue in FIFO order until both the RPM and TPM buckets can cover them and a
+    concurrency slot is free. Requests that cannot be admitted before the queue deadline
+    raise AdmissionTimeoutError instead of hitting the provider and getting a 429.
+    """
+
+    def __init__(self, rpm: int, tpm: int, max_concurrency: int, queue_timeout: float):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+
+        self._requests = TokenBucket(rpm)
+        self._tokens = TokenBucket(tpm)
+        self._queue_lock = asyncio.Lock()
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._paused_until = 0.0
+
+        self._waiting = 0
+        self._in_flight = 0
+        self._admitted = 0
+        self._timeouts = 0
+        self._rate_limited = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def penalize(self, retry_after: Optional[float]):
+        """Pause admissions after the provider answered with a 429"""
+        self._rate_limited += 1
+        pause = retry_after if retry_after and retry_after > 0 else 1.0
+        self._paused_until = max(self._paused_until, time.monotonic() + pause)
+        logger.warning(f"OpenAI rate limit hit, pausing admissions for {pause:.1f}s")
+
+    async def _wait_for_budget(self, tokens: int):
+        async with self._queue_lock:
+            while True:
+                now = time.monotonic()
+                delay = max(
+                    self._paused_until - now,
+                    self._requests.wait_time(1, now),
+                    self._tokens.wait_time(tokens, now),
+                )
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+            self._requests.consume(1)
+            self._tokens.consume(tokens)
+
+    @asynccontextmanager
+    async def admit(self, estimated_tokens: int):
+        started = time.monotonic()
+        budget_taken = False
+        self._waiting += 1
+        try:
+            async with asyncio.timeout(self.queue_timeout):
+                await self._wait_for_budget(estimated_tokens)
+                budget_taken = True
+                await self._slots.acquire()
+        except (TimeoutError, asyncio.CancelledError) as e:
+            # budget taken while still waiting for a slot was never used
+            if budget_taken:
+                self._requests.refund(1)
+                self._tokens.refund(estimated_tokens)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self._timeouts += 1
+            raise AdmissionTimeoutError(
+                f"OpenAI capacity not available within {self.queue_timeout:g}s "
+                f"({self._waiting - 1} requests queued)",
+                retry_after=max(1.0, self._paused_until - time.monotonic()),
+            )
+        finally:
+            self._waiting -= 1
+
+        wait = time.monotonic() - started
+        self._admitted += 1
+        self._total_wait += wait
+        self._max_wait = max(self._max_wait, wait)
+        self._in_flight += 1
+        try:
+            yield Admission(self, estimated_tokens)
+        finally:
+            self._in_flight -= 1
+            self._slots.release()
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        self._requests._refill(now)
+        self._tokens._refill(now)
+        return {
+            "rpm_limit": self.rpm,
+            "tpm_limit": self.tpm,
+            "max_concurrency": self.max_concurrency,
+            "queue_timeout_seconds": self.queue_timeout,
+            "queue_depth": self._waiting,
+            "in_flight": self._in_flight,
+            "admitted": self._admitted,
+            "timeouts": self._timeouts,
+            "rate_limited": self._rate_limited,
+            "avg_wait_ms": int(self._total_wait / self._admitted * 1000) if self._admitted else 0,
+            "max_wait_ms": int(self._max_wait * 1000),
+            "available_requests": int(self._requests.tokens),
+            "available_tokens": int(self._tokens.tokens),
+            "paused_for_ms": max(0, int((self._paused_until - now) * 1000)),
+        }
+
+
+_openai_limiter = None
+
+def get_openai_limiter() -> AdmissionController:
+    """Get singleton admission controller shared by every OpenAI call in the process"""
+    global _openai_limiter
+    if _openai_limiter is None:
+        _openai_limiter = AdmissionController(
+            rpm=OPENAI_RPM_LIMIT,
+            tpm=OPENAI_TPM_LIMIT,
+            max_concurrency=OPENAI_MAX_CONCURRENCY,
+            queue_timeout=OPENAI_QUEUE_TIMEOUT_SECONDS,
+        )
+    return _openai_limiter
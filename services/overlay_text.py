@@ -0,0 +1,274 @@
+import os
+import re
+import json
+import asyncio
+import hashlib
+import logging
+import tempfile
+from io import BytesIO
+from functools import lru_cache
+from typing import List, Optional, Tuple, Union
+
+import requests
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+from cachetools import TTLCache
+from dotenv import load_dotenv
+
+from config.firebase_config import get_firestore_client
+from services.company_cache import get_company_profile
+from services.image_processing import OUTPUT_FORMATS, IMAGE_OUTPUT_QUALITY, run_in_image_pool, _encode
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+OVERLAY_TEXT_ENABLED = os.getenv("OVERLAY_TEXT_ENABLED", "false").lower() == "true"
+# local .ttf/.otf files looked up by the company's matched font family
+OVERLAY_FONT_DIR = os.getenv("OVERLAY_FONT_DIR", "fonts")
+# optional download location for families not in OVERLAY_FONT_DIR, e.g. https://fonts.example.com/{family}.ttf
+OVERLAY_FONT_URL_TEMPLATE = os.getenv("OVERLAY_FONT_URL_TEMPLATE", "")
+OVERLAY_FONT_CACHE_DIR = os.getenv("OVERLAY_FONT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "overlay_fonts"))
+OVERLAY_STYLE_CACHE_SIZE = int(os.getenv("OVERLAY_STYLE_CACHE_SIZE", "512"))
+OVERLAY_STYLE_TTL_SECONDS = int(os.getenv("OVERLAY_STYLE_TTL_SECONDS", "3600"))
+OVERLAY_MAX_LINES = int(os.getenv("OVERLAY_MAX_LINES", "4"))
+
+FONT_EXTENSIONS = (".ttf", ".otf")
+# keys of a matched_fonts entry that may hold a font file url or a family name
+FONT_URL_KEYS = ("url", "font_url", "file", "ttf")
+FONT_FAMILY_KEYS = ("family", "google_font", "matched_font", "font", "name")
+
+HEX_COLOR = re.compile(r"#(?:[0-9a-fA-F]{6}|[0-9a-fA-F]{3})\b")
+DEFAULT_BAND = (0, 0, 0)
+DEFAULT_TEXT = (255, 255, 255)
+BAND_ALPHA = 170
+MIN_CONTRAST = 4.5
+
+Color = Tuple[int, int, int]
+
+_styles = TTLCache(maxsize=OVERLAY_STYLE_CACHE_SIZE, ttl=OVERLAY_STYLE_TTL_SECONDS)
+
+
+class OverlayStyle:
+    def __init__(self, font_path: Optional[str], band_color: Color, text_color: Color):
+        self.font_path = font_path
+        self.band_color = band_color
+        self.text_color = text_color
+
+    @property
+    def fingerprint(self) -> str:
+        """Identifies the look of the overlay, so cached composites change with the brand style"""
+        font = os.path.basename(self.font_path) if self.font_path else "default"
+        return json.dumps([font, list(self.band_color), list(self.text_color)])
+
+
+# ---------------------------------------------------------------- brand style (API process)
+
+def _font_candidates(company_data: dict) -> List[Tuple[Optional[str], Optional[str]]]:
+    """
+    (family, url) pairs in preference order: matched_fonts first, then fonts_typography
+    """
+    candidates = []
+    matched = company_data.get("matched_fonts") or {}
+    for value in (matched.values() if isinstance(matched, dict) else matched):
+        if isinstance(value, str):
+            candidates.append((value, None))
+        elif isinstance(value, dict):
+            url = next((value[key] for key in FONT_URL_KEYS if isinstance(value.get(key), str)), None)
+            family = next((value[key] for key in FONT_FAMILY_KEYS if isinstance(value.get(key), str)), None)
+            candidates.append((family, url))
+    for family in company_data.get("fonts_typography") or []:
+        if isinstance(family, str):
+            candidates.append((family, None))
+    return [(family, url) for family, url in candidates if family or url]
+
+
+def _normalize_family(family: str) -> str:
+    return re.sub(r"[^a-z0-9]", "", family.lower())
+
+
+def _find_local_font(family: str) -> Optional[str]:
+    if not os.path.isdir(OVERLAY_FONT_DIR):
+        return None
+    wanted = _normalize_family(family)
+    matches = []
+    for filename in os.listdir(OVERLAY_FONT_DIR):
+        stem, ext = os.path.splitext(filename)
+        if ext.lower() in FONT_EXTENSIONS and _normalize_family(stem).startswith(wanted):
+            matches.append(filename)
+    if not matches:
+        return None
+    # overlay text reads best in the bold cut when the family ships one
+    matches.sort(key=lambda name: ("bold" not in name.lower(), len(name)))
+    return os.path.join(OVERLAY_FONT_DIR, matches[0])
+
+
+def _download_font(url: str) -> str:
+    path = os.path.join(OVERLAY_FONT_CACHE_DIR, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".ttf")
+    if os.path.exists(path):
+        return path
+    response = requests.get(url, timeout=10)
+    response.raise_for_status()
+    # validate before caching so a bad download is not reused
+    ImageFont.truetype(BytesIO(response.content), 12)
+    os.makedirs(OVERLAY_FONT_CACHE_DIR, exist_ok=True)
+    partial = f"{path}.{os.getpid()}.part"
+    with open(partial, "wb") as f:
+        f.write(response.content)
+    os.replace(partial, path)
+    return path
+
+
+def resolve_font_path(company_data: dict) -> Optional[str]:
+    """
+    Local path of the company's brand font, downloading it if only a url is known.
+    None means the worker falls back to Pillow's default font.
+    """
+    for family, url in _font_candidates(company_data):
+        if family:
+            path = _find_local_font(family)
+            if path:
+                return path
+        if not url and family and OVERLAY_FONT_URL_TEMPLATE:
+            url = OVERLAY_FONT_URL_TEMPLATE.format(family=family.strip().replace(" ", ""))
+        if url:
+            try:
+                return _download_font(url)
+            except Exception as e:
+                logger.warning(f"Could not fetch font '{family or url}': {str(e)}")
+    return None
+
+
+def _parse_color(value) -> Optional[Color]:
+    text = str(value)
+    match = HEX_COLOR.search(text)
+    try:
+        return ImageColor.getrgb(match.group(0) if match else text.strip())[:3]
+    except ValueError:
+        return None
+
+
+def _luminance(color: Color) -> float:
+    def channel(c):
+        c = c / 255
+        return c / 12.92 if c <= 0.03928 else ((c + 0.055) / 1.055) ** 2.4
+    r, g, b = color
+    return 0.2126 * channel(r) + 0.7152 * channel(g) + 0.0722 * channel(b)
+
+
+def _contrast(a: Color, b: Color) -> float:
+    lighter, darker = sorted((_luminance(a), _luminance(b)), reverse=True)
+    return (lighter + 0.05) / (darker + 0.05)
+
+
+def pick_colors(theme_colors) -> Tuple[Color, Color]:
+    """
+    Band color is the brand's primary (first) theme color; text uses the theme color that
+    reads best on it, or white/black when none reaches WCAG AA contrast
+    """
+    colors = [color for color in (_parse_color(value) for value in theme_colors or []) if color]
+    if not colors:
+        return DEFAULT_BAND, DEFAULT_TEXT
+    band = colors[0]
+    text = max(colors[1:] or [band], key=lambda color: _contrast(band, color))
+    if _contrast(band, text) < MIN_CONTRAST:
+        text = max((255, 255, 255), (0, 0, 0), key=lambda color: _contrast(band, color))
+    return band, text
+
+
+def _load_style(company_id: str) -> OverlayStyle:
+    company_data = get_company_profile(get_firestore_client(), company_id) or {}
+    band, text = pick_colors(company_data.get("theme_colors"))
+    return OverlayStyle(resolve_font_path(company_data), band, text)
+
+
+async def get_overlay_style(company_id: str) -> OverlayStyle:
+    style = _styles.get(company_id)
+    if style is None:
+        style = await asyncio.to_thread(_load_style, company_id)
+        _styles[company_id] = style
+    return style
+
+
+def invalidate_overlay_style(company_id: str):
+    _styles.pop(company_id, None)
+
+
+# ---------------------------------------------------------------- rendering (pool workers)
+
+@lru_cache(maxsize=64)
+def _load_font(font_path: Optional[str], size: int):
+    if font_path:
+        try:
+            return ImageFont.truetype(font_path, size)
+        except OSError:
+            pass
+    return ImageFont.load_default(size)
+
+
+def _wrap(text: str, font, max_width: int) -> List[str]:
+    lines, current = [], ""
+    for word in text.split():
+        candidate = f"{current} {word}".strip()
+        if current and font.getlength(candidate) > max_width:
+            lines.append(current)
+            current = word
+        else:
+            current = candidate
+    if current:
+        lines.append(current)
+    return lines
+
+
+def render_overlay(image_bytes: bytes, text: str, font_path: Optional[str], band_color: Color, text_color: Color, pil_format: str, quality: int) -> bytes:
+    """
+    Draw `text` centered on a translucent brand-colored band across the bottom of the image
+    (runs in a pool worker; fonts are cached per worker)
+    """
+    with Image.open(BytesIO(image_bytes)) as image:
+        image = image.convert("RGBA")
+    width, height = image.size
+    margin = round(width * 0.06)
+    max_width = width - 2 * margin
+
+    # shrink the font until the wrapped text fits in OVERLAY_MAX_LINES and 40% of the height
+    size = max(12, round(height / 14))
+    while True:
+        font = _load_font(font_path, size)
+        lines = _wrap(text, font, max_width)
+        line_height = round(size * 1.25)
+        if size <= 12 or (len(lines) <= OVERLAY_MAX_LINES and len(lines) * line_height <= height * 0.4):
+            break
+        size = max(12, int(size * 0.9))
+
+    block_height = len(lines) * line_height
+    band_top = height - block_height - 2 * margin
+    overlay = Image.new("RGBA", image.size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(overlay)
+    draw.rectangle([(0, band_top), (width, height)], fill=(*band_color, BAND_ALPHA))
+    for index, line in enumerate(lines):
+        y = band_top + margin + index * line_height + line_height // 2
+        draw.text((width / 2, y), line, font=font, fill=(*text_color, 255), anchor="mm")
+
+    return _encode(Image.alpha_composite(image, overlay), pil_format, quality)
+
+
+async def composite_overlay_text(image_bytes: Union[bytes, memoryview], mime_type: str, company_id: Optional[str], overlay_text: Optional[str]) -> Optional[bytes]:
+    """
+    Render a planner's overlay_text onto its image with the company's brand font and
+    theme colors, in the image's own format. Returns None when disabled or on failure.
+    """
+    if not OVERLAY_TEXT_ENABLED or not overlay_text or not overlay_text.strip() or not company_id:
+        return None
+
+    pil_format = next((pil for pil, mime in OUTPUT_FORMATS.values() if mime == mime_type), "PNG")
+    try:
+        style = await get_overlay_style(company_id)
+        payload = image_bytes if isinstance(image_bytes, bytes) else bytes(image_bytes)
+        return await run_in_image_pool(
+            render_overlay, payload, " ".join(overlay_text.split()), style.font_path,
+            style.band_color, style.text_color, pil_format, IMAGE_OUTPUT_QUALITY,
+        )
+    except Exception as e:
+        logger.warning(f"Overlay text compositing for company '{company_id}' failed: {str(e)}")
+        return None
@@ -0,0 +1,14 @@
+import os
+import sys
+
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import firestore, storage
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import firebase_config  # noqa: E402
+
+# offline clients, so modules that create them at import time load without credentials;
+# tests patch out every call that would reach Firebase
+firebase_config._storage_client = storage.Client(project="test", credentials=AnonymousCredentials())
+firebase_config._db_client = firestore.Client(project="test", credentials=AnonymousCredentials())
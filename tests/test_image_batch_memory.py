@@ -0,0 +1,84 @@
+import asyncio
+
+from services import company_service
+from services.memory_governor import MemoryGovernor, IMAGE_MEMORY_ESTIMATE_MB, MB
+
+
+IMAGE_BYTES = 3 * MB
+PROVIDER_BATCH_SIZE = 4
+
+
+class _Provider:
+    max_batch_size = PROVIDER_BATCH_SIZE
+
+
+def _planners(company_id, count):
+    return [
+        {"company_id": company_id, "channel": "instagram", "image_prompt": f"{company_id} post {index}", "use_cache": False}
+        for index in range(count)
+    ]
+
+
+def test_concurrent_batches_keep_generated_images_counted(monkeypatch):
+    governor = MemoryGovernor(8 * IMAGE_MEMORY_ESTIMATE_MB * MB)
+    live = {}
+    checks = {"calls": 0, "undercounted": 0}
+
+    def check():
+        # every generated image still in memory must be covered by a reservation
+        checks["calls"] += 1
+        if governor.stats()["in_use_bytes"] < sum(live.values()):
+            checks["undercounted"] += 1
+
+    async def generate_images(planner_infos):
+        assert len(planner_infos) <= PROVIDER_BATCH_SIZE
+        await asyncio.sleep(0.01)
+        images = []
+        for planner_info in planner_infos:
+            live[planner_info["image_prompt"]] = IMAGE_BYTES
+            images.append((b"\0" * IMAGE_BYTES, "image/png"))
+        return images
+
+    async def postprocess_image(image_bytes, mime_type, channel):
+        check()
+        await asyncio.sleep(0.005)
+        return image_bytes, mime_type, {}
+
+    async def composite_overlay_text(*args):
+        return None
+
+    async def upload_image(image_bytes, path, content_type="image/png"):
+        check()
+        await asyncio.sleep(0.02)
+        return f"https://storage.example/{path}"
+
+    original_render = company_service._render_and_upload
+
+    async def render_and_upload(planner_info, rendered=None, reservation=None):
+        entry = await original_render(planner_info, rendered, reservation)
+        live.pop(planner_info["image_prompt"])
+        return entry
+
+    monkeypatch.setattr(company_service, "get_image_memory_governor", lambda: governor)
+    monkeypatch.setattr(company_service, "get_image_provider", lambda: _Provider())
+    monkeypatch.setattr(company_service, "generate_images", generate_images)
+    monkeypatch.setattr(company_service, "postprocess_image", postprocess_image)
+    monkeypatch.setattr(company_service, "composite_overlay_text", composite_overlay_text)
+    monkeypatch.setattr(company_service, "upload_image", upload_image)
+    monkeypatch.setattr(company_service, "_render_and_upload", render_and_upload)
+
+    async def run():
+        return await asyncio.gather(
+            company_service.process_company_batch(_planners("a", 30)),
+            company_service.process_company_batch(_planners("b", 30)),
+        )
+
+    first, second = asyncio.run(run())
+
+    assert all(isinstance(result, dict) and result["url"] for result in first + second)
+    stats = governor.stats()
+    assert stats["in_use_bytes"] == 0
+    assert stats["peak_bytes"] <= governor.budget
+    assert checks["calls"] > 0 and checks["undercounted"] == 0
+    # one reservation per provider call (8 per batch of 30), not one for each whole batch
+    assert stats["admitted"] == 2 * -(-30 // PROVIDER_BATCH_SIZE)
@@ -1,7 +1,51 @@
+import math
+from typing import Optional
+
+import openai
+from fastapi import HTTPException
 from fastapi.responses import JSONResponse
 
+from services.openai_limiter import AdmissionTimeoutError
+
 def handle_error(error: Exception):
     return JSONResponse(
         status_code=500,
         content={"status": "error", "message": str(error)},
     )
+
+
+def _retry_after(error: BaseException, default: float = 1.0) -> str:
+    seconds = getattr(error, "retry_after", None)
+    response = getattr(error, "response", None)
+    if seconds is None and response is not None:
+        try:
+            seconds = float(response.headers.get("retry-after"))
+        except (TypeError, ValueError):
+            pass
+    return str(max(1, math.ceil(seconds if seconds else default)))
+
+
+def provider_overload(error: BaseException) -> Optional[HTTPException]:
+    """
+    HTTP error for OpenAI overload anywhere in the error's cause/context chain (the service
+    layer re-raises as ValueError): 503 when the request never got capacity before the
+    queue deadline, 429 when the provider kept rate limiting past the retries. Both carry
+    Retry-After. None for any other error.
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, AdmissionTimeoutError):
+            return HTTPException(status_code=503, detail=f"AI service is busy, please retry: {str(error)}",
+                                 headers={"Retry-After": _retry_after(error)})
+        if isinstance(error, openai.RateLimitError):
+            return HTTPException(status_code=429, detail="AI provider rate limit reached, please retry later",
+                                 headers={"Retry-After": _retry_after(error)})
+        error = error.__cause__ or error.__context__
+    return None
+
+
+def raise_for_provider_overload(error: BaseException):
+    overload = provider_overload(error)
+    if overload is not None:
+        raise overload from error
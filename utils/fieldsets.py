@@ -0,0 +1,63 @@
+import re
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from fastapi import HTTPException
+
+
+# `fields=*` asks for every field, including the ones a lean default leaves out
+ALL_FIELDS = "*"
+FIELD_PATH = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)*$")
+
+# what GET /company returns without `fields`: enough for a dashboard listing, without the
+# image-analysis paragraphs, company_info, analyzed_images and product_categories
+COMPANY_LIST_FIELDS = (
+    "company_name",
+    "url",
+    "industry",
+    "logo_url",
+    "favicon_url",
+    "theme_colors",
+    "created_at",
+    "updated_at",
+)
+
+
+def parse_fields(fields: Optional[str], default: Optional[Sequence[str]] = None) -> Optional[List[str]]:
+    """
+    Field paths from a comma-separated `fields` query parameter, or `default` when it is
+    not given. None means the whole document.
+    """
+    if fields is None or not fields.strip():
+        return list(default) if default is not None else None
+    if fields.strip() == ALL_FIELDS:
+        return None
+
+    paths = []
+    for path in (part.strip() for part in fields.split(",")):
+        if not path:
+            continue
+        if not FIELD_PATH.match(path):
+            raise HTTPException(status_code=400, detail=f"Invalid field '{path}'")
+        if path not in paths:
+            paths.append(path)
+    return paths
+
+
+def select_paths(fields: List[str], derived: Optional[Dict[str, Sequence[str]]] = None, required: Iterable[str] = ()) -> List[str]:
+    """
+    Paths to read from Firestore for `fields`: fields the API computes (e.g. thumbnail_url)
+    are replaced by the stored fields they are computed from, and `required` ones are added
+    """
+    derived = derived or {}
+    paths = []
+    for path in [*fields, *required]:
+        for source in derived.get(path, (path,)):
+            if source not in paths:
+                paths.append(source)
+    return paths
+
+
+def only_fields(data: dict, fields: List[str], keep: Iterable[str] = ()) -> dict:
+    """Drop the keys read only to compute or check something the caller did not ask for"""
+    wanted = {path.split(".", 1)[0] for path in fields} | set(keep)
+    return {key: value for key, value in data.items() if key in wanted}
@@ -0,0 +1,97 @@
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, List, NamedTuple, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+# Firestore rejects a WriteBatch with more operations than this
+FIRESTORE_BATCH_LIMIT = 500
+# batches committed at once when a write set spans several of them
+FIRESTORE_BATCH_PARALLELISM = int(os.getenv("FIRESTORE_BATCH_PARALLELISM", "4"))
+# attempts per operation before a BulkWriter write is reported as failed
+FIRESTORE_BULK_MAX_ATTEMPTS = int(os.getenv("FIRESTORE_BULK_MAX_ATTEMPTS", "5"))
+
+
+class Write(NamedTuple):
+    """One document operation: kind is "set", "create", "update" or "delete"."""
+    kind: str
+    ref: Any
+    data: Optional[dict] = None
+    merge: bool = False
+
+
+def set_write(ref, data: dict, merge: bool = False) -> Write:
+    return Write("set", ref, data, merge)
+
+
+def delete_write(ref) -> Write:
+    return Write("delete", ref)
+
+
+def _apply(writer, write: Write):
+    if write.kind == "set":
+        writer.set(write.ref, write.data, merge=write.merge)
+    elif write.kind == "create":
+        writer.create(write.ref, write.data)
+    elif write.kind == "update":
+        writer.update(write.ref, write.data)
+    elif write.kind == "delete":
+        writer.delete(write.ref)
+    else:
+        raise ValueError(f"Unknown write kind '{write.kind}'")
+
+
+def _commit_chunk(db, chunk: List[Write]) -> int:
+    batch = db.batch()
+    for write in chunk:
+        _apply(batch, write)
+    batch.commit()
+    return len(chunk)
+
+
+def commit_in_batches(db, writes: Iterable[Write], parallelism: int = FIRESTORE_BATCH_PARALLELISM) -> int:
+    """
+    Commit writes as WriteBatches of at most FIRESTORE_BATCH_LIMIT operations, committing
+    the batches in parallel. Each batch is atomic; up to 500 writes cost one round trip.
+    Blocking; returns the number of operations written.
+    """
+    writes = list(writes)
+    chunks = [writes[start:start + FIRESTORE_BATCH_LIMIT] for start in range(0, len(writes), FIRESTORE_BATCH_LIMIT)]
+    if len(chunks) <= 1 or parallelism <= 1:
+        return sum(_commit_chunk(db, chunk) for chunk in chunks)
+
+    with ThreadPoolExecutor(max_workers=min(parallelism, len(chunks))) as executor:
+        return sum(executor.map(lambda chunk: _commit_chunk(db, chunk), chunks))
+
+
+def new_bulk_writer(db, on_result: Optional[Callable[[], None]] = None) -> Tuple[Any, list]:
+    """
+    BulkWriter that retries failed operations up to FIRESTORE_BULK_MAX_ATTEMPTS and collects
+    the ones that still fail into the returned list. `on_result` is called (from the
+    writer's threads) after every successful operation, e.g. to report progress.
+    """
+    failures = []
+
+    def on_error(failure, writer) -> bool:
+        if failure.attempts < FIRESTORE_BULK_MAX_ATTEMPTS:
+            return True
+        failures.append(failure)
+        return False
+
+    writer = db.bulk_writer()
+    writer.on_write_error(on_error)
+    if on_result is not None:
+        writer.on_write_result(lambda reference, result, writer: on_result())
+    return writer, failures
+
+
+def raise_for_failures(failures: list, count: int):
+    if failures:
+        logger.error(f"{len(failures)} of {count} bulk writes failed, first: {failures[0].message}")
+        raise RuntimeError(f"{len(failures)} of {count} Firestore writes failed")
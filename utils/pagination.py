@@ -0,0 +1,100 @@
+import os
+import json
+import base64
+import binascii
+from datetime import datetime, timezone
+from typing import Any, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+from google.cloud import firestore
+from google.cloud.firestore_v1.field_path import FieldPath
+
+load_dotenv()
+
+
+# page size used when a listing is paged by cursor without `limit`, and the most a caller may ask for
+LIST_PAGE_SIZE = int(os.getenv("LIST_PAGE_SIZE", "20"))
+LIST_MAX_PAGE_SIZE = int(os.getenv("LIST_MAX_PAGE_SIZE", "100"))
+
+
+def _encode_value(value):
+    # timestamps keep their nanoseconds, so start_after lands exactly after the last document
+    if isinstance(value, DatetimeWithNanoseconds):
+        return {"ts": value.rfc3339()}
+    if isinstance(value, datetime):
+        return {"ts": value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")}
+    return {"v": value}
+
+
+def _decode_value(value):
+    if "ts" in value:
+        return DatetimeWithNanoseconds.from_rfc3339(value["ts"])
+    return value["v"]
+
+
+def encode_cursor(doc_id: str, order_value=None, order_field: Optional[str] = None) -> str:
+    cursor = {"id": doc_id}
+    if order_field:
+        cursor["after"] = _encode_value(order_value)
+    payload = json.dumps(cursor, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, order_field: Optional[str] = None) -> Tuple[str, Any]:
+    """
+    Document id and order value a cursor points after; a malformed cursor, or one from a
+    listing with another order, is the caller's error (400)
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        doc_id = payload["id"]
+        order_value = _decode_value(payload["after"]) if order_field else None
+    except (ValueError, KeyError, TypeError, AttributeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(doc_id, str) or not doc_id or "/" in doc_id:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return doc_id, order_value
+
+
+def page_size(limit: Optional[int], default: int = LIST_PAGE_SIZE) -> int:
+    if limit is None:
+        return default
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be at least 1")
+    return min(limit, LIST_MAX_PAGE_SIZE)
+
+
+def paginate(query, limit: int, cursor: Optional[str] = None, page: Optional[int] = None,
+             order_field: Optional[str] = None, descending: bool = False) -> Tuple[List, Optional[str]]:
+    """
+    One page of `query` plus the cursor of the next page (None on the last one), ordered by
+    `order_field` and then document id, or by document id alone. Documents without
+    `order_field` are not listed. With a cursor the query starts right after that document,
+    so every page costs `limit` + 1 reads however deep it is. `page` is the legacy offset
+    paging, used only without a cursor.
+    """
+    # both in the same direction, so the single-field index on order_field is enough
+    direction = firestore.Query.DESCENDING if descending else firestore.Query.ASCENDING
+    if order_field:
+        query = query.order_by(order_field, direction=direction)
+    query = query.order_by(FieldPath.document_id(), direction=direction)
+
+    if cursor:
+        doc_id, order_value = decode_cursor(cursor, order_field)
+        position = {FieldPath.document_id(): doc_id}
+        if order_field:
+            position[order_field] = order_value
+        query = query.start_after(position)
+    elif page is not None and page > 1:
+        query = query.offset((page - 1) * limit)
+
+    # one extra document tells whether another page follows without a second query
+    docs = list(query.limit(limit + 1).stream())
+    if len(docs) <= limit:
+        return docs, None
+    docs = docs[:limit]
+    last = docs[-1]
+    return docs, encode_cursor(last.id, last.get(order_field) if order_field else None, order_field)
@@ -0,0 +1,75 @@
+import io
+import os
+from typing import Union
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# resumable uploads send the buffer in chunks of this size (must be a multiple of 256 KB)
+UPLOAD_CHUNK_SIZE = 1 * 1024 * 1024
+# images at or above this size use a chunked resumable upload, smaller ones a single multipart request
+# (multipart builds the whole request body in memory, several copies of the image)
+UPLOAD_RESUMABLE_THRESHOLD_BYTES = int(os.getenv("UPLOAD_RESUMABLE_THRESHOLD_MB", "1")) * 1024 * 1024
+
+
+class BufferReader(io.RawIOBase):
+    """
+    Read-only file object over an in-memory buffer. Reads slice a memoryview, so the
+    upload only ever copies the chunk being sent instead of the whole image.
+    """
+
+    def __init__(self, data: Union[bytes, bytearray, memoryview]):
+        self._view = memoryview(data).cast("B")
+        self._pos = 0
+        self.size = len(self._view)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._pos + offset
+        elif whence == io.SEEK_END:
+            position = len(self._view) + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        self._pos = max(0, min(position, len(self._view)))
+        return self._pos
+
+    def read(self, size=-1):
+        end = len(self._view) if size is None or size < 0 else min(len(self._view), self._pos + size)
+        chunk = self._view[self._pos:end].tobytes()
+        self._pos = end
+        return chunk
+
+    def readinto(self, buffer):
+        size = min(len(buffer), len(self._view) - self._pos)
+        buffer[:size] = self._view[self._pos:self._pos + size]
+        self._pos += size
+        return size
+
+    def close(self):
+        self._view.release()
+        super().close()
+
+
+def upload_from_buffer(blob, image_data: Union[bytes, bytearray, memoryview], content_type: str):
+    """
+    Upload `image_data` to a storage blob straight from memory (blocking)
+    """
+    with BufferReader(image_data) as reader:
+        if reader.size >= UPLOAD_RESUMABLE_THRESHOLD_BYTES:
+            # size=None forces a resumable session that pulls UPLOAD_CHUNK_SIZE reads from the buffer
+            blob.chunk_size = UPLOAD_CHUNK_SIZE
+            blob.upload_from_file(reader, size=None, content_type=content_type)
+        else:
+            blob.upload_from_file(reader, size=reader.size, content_type=content_type)